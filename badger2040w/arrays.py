@@ -0,0 +1,9 @@
+# Helpers for the fixed size arrays that history, metrics and ground tracks
+# are kept in, so they're allocated once rather than grown.
+import struct
+from array import array
+
+
+# An array of count zeros.
+def zeros(typecode, count):
+    return array(typecode, bytes(struct.calcsize(typecode) * count))
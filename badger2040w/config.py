@@ -1,9 +1,38 @@
-# How many previous ISS locations to display.
+# How many previous ISS locations to display, this can go up to a few hundred.
 MAX_LOCATION_HISTORY=15
+# Show previous ISS locations as "dots", or as a "track" line joining them up.
+HISTORY_STYLE="dots"
 # How close in miles does the ISS need to be to turn the light on?
 CLOSE_BY_DISTANCE=1000
 # How often in seconds to retrieve a new ISS position from the internet.
 REFRESH_INTERVAL=300
+# How often in seconds to work out the ISS position on the device between retrievals,
+# these show its latitude and longitude as place names come from the internet.
+POSITION_INTERVAL=30
+# Where to download the ISS orbit (two line element set) from, and how old in days it can get.
+TLE_URL="https://celestrak.org/NORAD/elements/gp.php?CATNR=25544&FORMAT=TLE"
+TLE_MAX_AGE=1
+# Set to a number of minutes (e.g. 95, a little over one orbit) to get where the
+# ISS will be for that long from the cloud function, and move it along that
+# ground track until it's about to run out before asking again, rather than
+# every REFRESH_INTERVAL.  Place names aren't updated in between, so the
+# latitude and longitude are shown instead.
+# Not used with LOW_POWER.
+TRACK_MINUTES=0
+# Set to True to switch off between updates to save battery, this stops the
+# ISS position being updated between retrievals (POSITION_INTERVAL is ignored).
+LOW_POWER=False
+# Set to True to start up quickly: show the last screen again straight away, and
+# reconnect to the same WiFi access point with the same address as last time,
+# without scanning.  Only use this if your router keeps giving the Badger the
+# same address, or it might end up with one that's been given to something else.
+FAST_BOOT=False
+# Only the parts of the screen that change are updated, with a full update after this many to clear ghosting.
+FULL_REFRESH_EVERY=10
+# How many recent samples of each stage of a refresh to keep timings for, and the
+# port to serve them on at /metrics (as JSON, or ?format=prometheus).
+METRICS_SAMPLES=32
+METRICS_PORT=80
 # Default lat/long values and place name.
 DEFAULT_LATITUDE=52.953384
 DEFAULT_LONGITUDE=-1.1505282
@@ -0,0 +1,101 @@
+# Where the ISS will be over the next orbit or so, as sent by the backend in
+# ground track mode: a point every step seconds, so that the position can
+# be worked out on the device by interpolating between the points either
+# side of now rather than asking the backend again.  The points are kept
+# in arrays, latitudes and longitudes in hundredths of a degree as the
+# backend's binary format has them.
+import struct
+from array import array
+
+from arrays import zeros
+
+# Offset between the Unix epoch the backend's JSON uses and 2000-01-01.
+UNIX_2000 = 946684800
+# Binary format (see encodeBinary() in the cloud function): the time of
+# the first point, seconds between points and how many there are, then
+# each point's lat, lon and distance in miles.
+HEADER = "<IHH"
+HEADER_SIZE = 8
+POINT = "<hhH"
+POINT_SIZE = 6
+
+
+class GroundTrack:
+    def __init__(self, start, step, lat, lon, dist):
+        # Seconds since 2000-01-01 UTC of the first point.
+        self.start = start
+        self.step = step
+        # array("h") in hundredths of a degree, and array("H") in miles.
+        self.lat = lat
+        self.lon = lon
+        self.dist = dist
+
+    def __len__(self):
+        return len(self.lat)
+
+    # Seconds since 2000-01-01 UTC of the last point.
+    def end(self):
+        return self.start + (len(self.lat) - 1) * self.step
+
+    def covers(self, seconds):
+        return len(self.lat) > 0 and self.start <= seconds <= self.end()
+
+    # Latitude, longitude and distance in miles at a time in seconds since
+    # 2000, or None if it's outside the track.
+    def position(self, seconds):
+        if not self.covers(seconds):
+            return None
+
+        i, offset = divmod(seconds - self.start, self.step)
+        if i >= len(self.lat) - 1:
+            return self.lat[i] / 100, self.lon[i] / 100, self.dist[i]
+
+        fraction = offset / self.step
+        lat = self.lat[i] + (self.lat[i + 1] - self.lat[i]) * fraction
+        # Take the short way round across the 180th meridian.
+        d_lon = self.lon[i + 1] - self.lon[i]
+        if d_lon > 18000:
+            d_lon -= 36000
+        elif d_lon < -18000:
+            d_lon += 36000
+        lon = self.lon[i] + d_lon * fraction
+        if lon > 18000:
+            lon -= 36000
+        elif lon < -18000:
+            lon += 36000
+        dist = self.dist[i] + (self.dist[i + 1] - self.dist[i]) * fraction
+        return lat / 100, lon / 100, round(dist)
+
+
+# Decodes a track in the binary format from buffer, starting at position
+# and ending before length.
+def decode(buffer, position, length):
+    if position + HEADER_SIZE > length:
+        raise ValueError("response too short")
+    start, step, count = struct.unpack_from(HEADER, buffer, position)
+    position += HEADER_SIZE
+    if step == 0 or position + count * POINT_SIZE > length:
+        raise ValueError("bad track")
+
+    lat = zeros("h", count)
+    lon = zeros("h", count)
+    dist = zeros("H", count)
+    for n in range(count):
+        lat[n], lon[n], dist[n] = struct.unpack_from(POINT, buffer, position)
+        position += POINT_SIZE
+    return GroundTrack(start, step, lat, lon, dist)
+
+
+# Converts a track from the backend's JSON, with the start time in ms since
+# 1970 and points as [lat, lon, distance].
+def from_json(track):
+    points = track["points"]
+    if track["step"] <= 0:
+        raise ValueError("bad track")
+    return GroundTrack(
+        track["start"] // 1000 - UNIX_2000,
+        track["step"],
+        array("h", [round(point[0] * 100) for point in points]),
+        array("h", [round(point[1] * 100) for point in points]),
+        array("H", [point[2] for point in points])
+    )
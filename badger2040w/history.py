@@ -0,0 +1,137 @@
+# Keeps the previous positions of the ISS in a fixed size ring buffer of
+# arrays, so adding a position doesn't allocate and hundreds of them fit
+# in a few KB.  Positions are stored as map pixels (for drawing) along with
+# the latitude, longitude and time they were recorded at.
+import struct
+
+from arrays import zeros
+
+# File header: magic, version, (reserved), capacity, count.
+HEADER = "<4sBBHH"
+MAGIC = b"ISSH"
+VERSION = 1
+# Type codes of the x, y, lat, lon and timestamp arrays, timestamps are
+# seconds since 2000 (see orbit.now()).
+TYPECODES = ("h", "h", "f", "f", "i")
+
+
+class History:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.x, self.y, self.lat, self.lon, self.timestamp = (zeros(typecode, capacity) for typecode in TYPECODES)
+        # Index of the oldest position, and how many there are.
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    # Index into the arrays of the nth position, 0 being the most recent.
+    def index(self, n):
+        return (self.start + self.count - 1 - n) % self.capacity
+
+    # Record a position, replacing the oldest one if the buffer is full.
+    def add(self, x, y, lat, lon, timestamp):
+        if self.count < self.capacity:
+            i = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.x[i] = x
+        self.y[i] = y
+        self.lat[i] = lat
+        self.lon[i] = lon
+        self.timestamp[i] = timestamp
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    # Draw each position as a circle, returns the areas drawn on as
+    # (left, top, right, bottom) tuples.
+    def draw_dots(self, display, radius):
+        areas = []
+        for n in range(self.count):
+            i = self.index(n)
+            x = self.x[i]
+            y = self.y[i]
+            display.circle(x, y, radius)
+            areas.append((x - radius, y - radius, x + radius, y + radius))
+        return areas
+
+    # Draw the positions joined up as the ground track, starting from the
+    # given current position.  Lines that cross the antimeridian are drawn
+    # off one side of the map and back on from the other, clipped to the
+    # map.  Returns the areas drawn on like draw_dots.
+    def draw_track(self, display, x, y, map_left, map_top, map_width, map_height):
+        areas = []
+        display.set_clip(map_left, map_top, map_width, map_height)
+
+        for n in range(self.count):
+            i = self.index(n)
+            previous_x = self.x[i]
+            previous_y = self.y[i]
+
+            if abs(x - previous_x) <= map_width // 2:
+                display.line(previous_x, previous_y, x, y)
+                areas.append((min(x, previous_x), min(y, previous_y), max(x, previous_x), max(y, previous_y)))
+            else:
+                # Move the earlier point a map's width over so the line
+                # leaves the map in the right direction, then draw it again
+                # from the other side.
+                shift = map_width if x > previous_x else -map_width
+                display.line(previous_x + shift, previous_y, x, y)
+                display.line(previous_x, previous_y, x - shift, y)
+                top = min(y, previous_y)
+                bottom = max(y, previous_y)
+                areas.append((max(min(x, previous_x + shift), map_left), top, min(max(x, previous_x + shift), map_left + map_width - 1), bottom))
+                areas.append((max(min(x - shift, previous_x), map_left), top, min(max(x - shift, previous_x), map_left + map_width - 1), bottom))
+
+            x = previous_x
+            y = previous_y
+
+        display.remove_clip()
+        return areas
+
+    # Save to a compact binary file, oldest position first.
+    def save(self, file):
+        with open(file, "wb") as f:
+            f.write(struct.pack(HEADER, MAGIC, VERSION, 0, self.capacity, self.count))
+            for values in (self.x, self.y, self.lat, self.lon, self.timestamp):
+                # Rotate the ring so the file doesn't depend on where it starts.
+                end = self.start + self.count
+                if end <= self.capacity:
+                    f.write(memoryview(values)[self.start:end])
+                else:
+                    f.write(memoryview(values)[self.start:])
+                    f.write(memoryview(values)[:end - self.capacity])
+
+
+# Read a history saved by History.save() into a new History with the given
+# capacity, keeping the most recent positions if it holds fewer.  Returns
+# an empty History if the file is missing or not valid.
+def load(file, capacity):
+    history = History(capacity)
+    try:
+        with open(file, "rb") as f:
+            header = f.read(struct.calcsize(HEADER))
+            if len(header) != struct.calcsize(HEADER):
+                return history
+            magic, version, _, saved_capacity, count = struct.unpack(HEADER, header)
+            if magic != MAGIC or version != VERSION or count > saved_capacity:
+                return history
+
+            columns = []
+            for typecode in TYPECODES:
+                values = zeros(typecode, count)
+                if f.readinto(values) != struct.calcsize(typecode) * count:
+                    return history
+                columns.append(values)
+    except OSError:
+        return history
+
+    for n in range(max(count - capacity, 0), count):
+        history.add(columns[0][n], columns[1][n], columns[2][n], columns[3][n], columns[4][n])
+    return history
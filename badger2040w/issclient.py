@@ -0,0 +1,286 @@
+# Makes HTTP requests from a uasyncio task, so that the rest of the
+# program (buttons, drawing the screen) carries on while waiting for a
+# slow or unreachable server, and gives up after a timeout.  Client keeps
+# a connection open for requests that are made regularly.
+import groundtrack
+import json
+import struct
+import uasyncio
+import usocket
+
+# Seconds to wait for a whole request before giving up.
+TIMEOUT = 15
+
+# The backend's compact binary response (see encodeBinary() in the cloud
+# function): a fixed header then length prefixed location strings.
+BINARY_CONTENT_TYPE = "application/vnd.iss-locator"
+BINARY_VERSION = 1
+BINARY_HEADER = "<BBffHI"
+BINARY_HEADER_SIZE = 16
+BINARY_FIELDS = ("locality", "region", "country", "ocean")
+# Set in the field mask when a ground track follows the location strings.
+BINARY_TRACK_FLAG = 0x80
+
+
+# Splits a URL into (secure, host, port, path).
+def split_url(url):
+    scheme, _, rest = url.partition("://")
+    host, _, path = rest.partition("/")
+    secure = scheme == "https"
+    port = 443 if secure else 80
+    if ":" in host:
+        host, port = host.split(":")
+        port = int(port)
+    return secure, host, port, "/" + path
+
+
+# Fills view from the stream, raising OSError if it ends first.
+async def _read_exactly_into(reader, view):
+    position = 0
+    readinto = getattr(reader, "readinto", None)
+    while position < len(view):
+        if readinto:
+            count = await readinto(view[position:])
+        else:
+            data = await reader.read(len(view) - position)
+            count = len(data)
+            view[position:position + count] = data
+        if not count:
+            raise OSError("response ended early")
+        position += count
+
+
+# Reads the body into buffer, returns how many bytes were read.  length is
+# the Content-Length, or None to read until the connection closes.
+async def _read_into(reader, buffer, length, chunked):
+    view = memoryview(buffer)
+
+    if chunked:
+        position = 0
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # Skip any trailers.
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                return position
+            if position + size > len(buffer):
+                raise OSError("response too large")
+            await _read_exactly_into(reader, view[position:position + size])
+            position += size
+            await reader.readline()
+
+    if length is not None:
+        if length > len(buffer):
+            raise OSError(f"response too large ({length} bytes)")
+        await _read_exactly_into(reader, view[:length])
+        return length
+
+    position = 0
+    while position < len(buffer):
+        data = await reader.read(len(buffer) - position)
+        if not data:
+            return position
+        view[position:position + len(data)] = data
+        position += len(data)
+    raise OSError("response too large")
+
+
+# Sends a GET request.
+async def _send_request(writer, version, host, path, headers):
+    request = f"GET {path} HTTP/{version}\r\nHost: {host}\r\n"
+    if headers:
+        for name, value in headers.items():
+            request += f"{name}: {value}\r\n"
+    writer.write(f"{request}\r\n".encode())
+    await writer.drain()
+
+
+# Reads the status line and headers, returns (status, content length or
+# None, whether the body is chunked, whether the server will close the
+# connection).
+async def _read_head(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise OSError("connection closed")
+    version, status = status_line.split(b" ", 2)[:2]
+    length = None
+    chunked = False
+    close = version != b"HTTP/1.1"
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n" or line == b"":
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = value == b"chunked"
+        elif name == b"connection":
+            close = value == b"close"
+    return int(status), length, chunked, close
+
+
+async def _get(url, headers, buffer=None):
+    secure, host, port, path = split_url(url)
+    if secure:
+        reader, writer = await uasyncio.open_connection(host, port, ssl=True)
+    else:
+        reader, writer = await uasyncio.open_connection(host, port)
+
+    try:
+        await _send_request(writer, "1.0", host, path, headers)
+        status, length, chunked, _ = await _read_head(reader)
+
+        if buffer is not None:
+            body = await _read_into(reader, buffer, length, chunked)
+        elif length is None:
+            body = await reader.read(-1)
+        else:
+            body = await reader.readexactly(length)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    if status != 200:
+        raise OSError(f"HTTP status {status}")
+    return body
+
+
+# Keeps one connection open between requests to the same server, so that
+# DNS, TCP and TLS set up only happen once rather than for every request.
+# The server's address is looked up once and remembered.  If the server
+# has closed the connection in the meantime, the request is retried on a
+# new one.
+class Client:
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        # (secure, host, port) of the open connection.
+        self.server = None
+        self.addresses = {}
+
+    def _resolve(self, host, port):
+        address = self.addresses.get(host)
+        if address is None:
+            address = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0][-1][0]
+            self.addresses[host] = address
+        return address
+
+    async def _connect(self, secure, host, port):
+        address = self._resolve(host, port)
+        try:
+            if secure:
+                self.reader, self.writer = await uasyncio.open_connection(address, port, ssl=True, server_hostname=host)
+            else:
+                self.reader, self.writer = await uasyncio.open_connection(address, port)
+        except OSError:
+            # The server may have moved, look it up again next time.
+            self.addresses.pop(host, None)
+            raise
+        self.server = (secure, host, port)
+
+    def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+        self.server = None
+
+    async def _get_into(self, url, buffer, headers):
+        secure, host, port, path = split_url(url)
+
+        for attempt in range(2):
+            reused = self.writer is not None and self.server == (secure, host, port)
+            if not reused:
+                self.close()
+                await self._connect(secure, host, port)
+
+            try:
+                await _send_request(self.writer, "1.1", host, path, headers)
+                status, length, chunked, close = await _read_head(self.reader)
+                if length is None and not chunked:
+                    close = True
+                count = await _read_into(self.reader, buffer, length, chunked)
+            except Exception:
+                self.close()
+                # A connection that has been idle may have been closed by
+                # the server, so try once more on a new one.
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                # Cancelled part way through a response (timed out).
+                self.close()
+                raise
+
+            if close:
+                self.close()
+            if status != 200:
+                raise OSError(f"HTTP status {status}")
+            return count
+
+    # Like fetch_into(), on the client's connection.
+    async def get_into(self, url, buffer, headers=None, timeout=TIMEOUT):
+        return await uasyncio.wait_for(self._get_into(url, buffer, headers), timeout)
+
+
+# Returns the body of the response to a GET request, raising OSError if
+# the status isn't 200 and uasyncio.TimeoutError after timeout seconds.
+async def fetch(url, headers=None, timeout=TIMEOUT):
+    return await uasyncio.wait_for(_get(url, headers), timeout)
+
+
+async def fetch_json(url, headers=None, timeout=TIMEOUT):
+    return json.loads(await fetch(url, headers, timeout))
+
+
+# Like fetch(), but reads the body into buffer (a bytearray) rather than
+# allocating a new one, and returns its length.
+async def fetch_into(url, buffer, headers=None, timeout=TIMEOUT):
+    return await uasyncio.wait_for(_get(url, headers, buffer), timeout)
+
+
+# Decodes the backend's response from the first length bytes of buffer,
+# either the compact binary format or JSON from backends that don't send
+# it.  Binary responses give the update time as updatedSeconds, seconds
+# since 2000-01-01 UTC, rather than the formatted updatedAt.  A ground
+# track, if there is one, is decoded into a groundtrack.GroundTrack.
+def decode_iss_data(buffer, length):
+    if length > 0 and buffer[0] == ord("{"):
+        iss_data = json.loads(bytes(memoryview(buffer)[:length]))
+        if "track" in iss_data:
+            iss_data["track"] = groundtrack.from_json(iss_data["track"])
+        return iss_data
+
+    if length < BINARY_HEADER_SIZE:
+        raise ValueError("response too short")
+    version, field_mask, lat, lon, dist, seconds = struct.unpack_from(BINARY_HEADER, buffer)
+    if version != BINARY_VERSION:
+        raise ValueError(f"unknown response version {version}")
+
+    iss_data = {
+        "lat": lat,
+        "lon": lon,
+        "dist": dist,
+        "updatedSeconds": seconds
+    }
+    position = BINARY_HEADER_SIZE
+    for bit in range(len(BINARY_FIELDS)):
+        if field_mask & (1 << bit):
+            if position >= length:
+                raise ValueError("response too short")
+            size = buffer[position]
+            position += 1
+            if position + size > length:
+                raise ValueError("response too short")
+            iss_data[BINARY_FIELDS[bit]] = str(bytes(memoryview(buffer)[position:position + size]), "utf-8")
+            position += size
+    if field_mask & BINARY_TRACK_FLAG:
+        iss_data["track"] = groundtrack.decode(buffer, position, length)
+    return iss_data
@@ -1,17 +1,27 @@
 import badger2040
+import binascii
 import config
 import gc
+import groundtrack
+import history
+import issclient
 import jpegdec
 import json
 import machine
+import metrics
 import network
+import ntptime
+import orbit
 import os
+import projection
 import sys
+import textlayout
 import time
-import urequests
+import uasyncio
+import wifiscan
 import _thread
 
-from phew import access_point, connect_to_wifi, is_connected_to_wifi, dns, server
+from phew import access_point, connect_to_wifi, is_connected_to_wifi, dns, logging, server
 from phew.template import render_template
 
 MAP_IMAGE_HEIGHT = 128
@@ -20,11 +30,59 @@ ISS_IMAGE_WIDTH = 203
 MAX_TEXT_WIDTH = 330
 MAP_LEFT_OFFSET = badger2040.WIDTH - MAP_IMAGE_WIDTH
 MAP_TOP_OFFSET = 0
-EQUATOR_Y = MAP_IMAGE_HEIGHT // 2
-MERIDIAN_X = MAP_IMAGE_WIDTH // 2
 TEXT_LEFT_OFFSET = 2
 WIFI_FILE = "wifi.json"
+TLE_FILE = "iss.tle"
+HISTORY_FILE = "history.bin"
+STATE_FILE = "state.json"
+WIFI_CACHE_FILE = "wifi-cache.json"
+MAP_FILE = "worldmap.bin"
+# How long in seconds to wait between attempts to download a new TLE.
+TLE_RETRY_INTERVAL = 600
+# How long in seconds to wait to reconnect to the access point used last
+# time before connecting normally instead.
+FAST_CONNECT_TIMEOUT = 5
+# How long in seconds the DHCP lease from last time is reused for (cyw43
+# doesn't say how long it's for).  Routers usually lease addresses for a
+# day or more, so after this it's safe to assume it's still ours.
+WIFI_LEASE_TIME = 3600
+# How often in seconds to save what's on the screen to show again at
+# startup in fast boot mode.  It's replaced as soon as there's new data, so
+# it needn't be recent, and writing it wears the flash.
+STATE_SAVE_INTERVAL = 3600
+# Ask for a new ground track this many seconds before the one we have runs
+# out, and set the clock again if it's this many seconds out from the
+# backend's when a track arrives, as positions on the track are only as
+# good as the clock.
+TRACK_REFETCH_MARGIN = 120
+TRACK_MAX_CLOCK_DRIFT = 10
+# Place names are looked up for squares of this many degrees (see
+# GEOCODE_GRID_DEGREES in the cloud function).
+PLACE_NAME_RANGE = 0.25
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
 TEMPLATE_PATH = "templates"
+# The framebuffer is packed one bit per pixel in columns (8 pixels per
+# byte, top to bottom), and the map is full height on the right of the
+# screen, so it's the last part of the framebuffer.
+MAP_BUFFER_START = MAP_LEFT_OFFSET * badger2040.HEIGHT // 8
+MAP_BUFFER_SIZE = MAP_IMAGE_WIDTH * badger2040.HEIGHT // 8
+# Bands of the screen holding each piece of text, as (x, y, width, height).
+# Partial updates must start and end on a multiple of 8 rows.
+DISTANCE_REGION = (0, 0, badger2040.WIDTH, 40)
+LOCATION_REGION = (0, 40, MAP_LEFT_OFFSET, 80)
+UPDATED_AT_REGION = (0, 120, badger2040.WIDTH, 8)
+# In setup mode, how often in seconds to scan for WiFi networks, how long
+# until a network that's no longer seen is dropped, and how many to list.
+WIFI_SCAN_INTERVAL = 15
+WIFI_NETWORK_MAX_AGE = 60
+MAX_WIFI_NETWORKS = 24
+# More changed areas of the map than this are updated as one.
+MAX_MAP_REGIONS = 3
+# Stages of a refresh that are timed, and how long after starting up the
+# first useful screen (maybe the one saved from last time) and the first
+# with new data were shown, see metrics.py.
+REFRESH_STAGES = ("fetch", "decode", "propagate", "map", "layout", "draw", "update", "refresh", "boot_to_screen", "boot_to_data")
 
 
 # Initialize display.
@@ -33,14 +91,61 @@ display.set_update_speed(badger2040.UPDATE_NORMAL)
 display.led(0)
 display.set_font("bitmap8")
 
-# Initialize location history
-location_history = []
+# Lookup tables for positioning things on the world map.
+world_map = projection.Equirectangular(MAP_LEFT_OFFSET, MAP_TOP_OFFSET, MAP_IMAGE_WIDTH, MAP_IMAGE_HEIGHT)
+
+# Shortens place names to fit the space for them.
+text_fitter = textlayout.TextFitter(display.measure_text, MAX_TEXT_WIDTH)
+
+# Initialize location history, carrying on from before a reboot.
+location_history = history.load(HISTORY_FILE, config.MAX_LOCATION_HISTORY)
+
+# Latest information to show, and the things it's worked out from.
+iss_data = {}
+satellite = None
+clock_set = False
+# Where the ISS will be for a while in ground track mode.
+iss_track = None
+
+# Connection to the backend, kept open between updates, and the buffer
+# its responses are read into rather than allocating, with room for a
+# ground track of a point a minute.
+iss_client = issclient.Client()
+response_buffer = bytearray(512 + (groundtrack.HEADER_SIZE + groundtrack.POINT_SIZE * (config.TRACK_MINUTES + 1) if config.TRACK_MINUTES else 0))
+
+# Set when the screen needs redrawing with pending_render, which is
+# (iss_data, add_to_history).
+render_needed = uasyncio.Event()
+pending_render = None
+
+# Set from the button interrupt handler.
+button_pressed = uasyncio.ThreadSafeFlag()
+
+# Decoded world map, copied into the framebuffer on each update.
+map_buffer = None
+
+# What's on the screen, so that only the parts that change are updated.
+last_frame = None
+partial_updates = 0
+
+# How long each stage of refreshing the screen takes.
+refresh_metrics = metrics.Metrics(REFRESH_STAGES, config.METRICS_SAMPLES)
+boot_start = time.ticks_ms()
+
+# The WiFi connection, and whether it's using the address from last time
+# rather than one from DHCP.
+wlan = None
+cached_address = False
+# Set once the backend has been reached, and once new data has been shown.
+backend_reached = uasyncio.Event()
+data_shown = uasyncio.Event()
 
 
 # Reboot the system.
 def machine_reset():
     time.sleep(1)
     print("Resetting...")
+    logging.flush()
     machine.reset()
 
 # Utility function, displays text horizontally centered.
@@ -50,6 +155,183 @@ def display_centered(text_to_display, y_pos, scale):
     display.text(text_to_display, x_pos, y_pos, badger2040.WIDTH, scale)
     return x_pos
 
+# Set the real time clock from the network, needed to work out where the ISS is.
+def set_clock():
+    try:
+        ntptime.settime()
+        # The Badger's own real time clock keeps going while it's switched off.
+        if config.LOW_POWER or config.FAST_BOOT:
+            badger2040.pico_rtc_to_pcf()
+        return True
+    except Exception as e:
+        print(f"Couldn't set the clock: {e}")
+        return False
+
+# Download the latest TLE for the ISS and save it to flash, returns None on failure.
+async def refresh_tle():
+    try:
+        satellite = orbit.parse((await issclient.fetch(config.TLE_URL)).decode())
+    except Exception as e:
+        print(f"Couldn't download TLE: {e}")
+        return None
+
+    if satellite is not None:
+        orbit.save(TLE_FILE, satellite)
+    return satellite
+
+# Format a time in seconds since 2000 the same way the backend does,
+# e.g. "Mon 02 Jan 3:04pm UTC".
+def format_updated_at(seconds):
+    t = time.gmtime(seconds + orbit.EPOCH_2000)
+    hour = t[3] % 12 or 12
+    am_pm = "am" if t[3] < 12 else "pm"
+    return f"{DAY_NAMES[t[6]]} {t[2]:02} {MONTH_NAMES[t[1] - 1]} {hour}:{t[4]:02}{am_pm} UTC"
+
+# The last data retrieved from the backend for a position worked out on the
+# device, keeping the place names only while the ISS is still in the grid
+# square they were looked up for.  Otherwise they'd name somewhere it has
+# long since left, so the position is shown instead.
+def local_iss_data(iss_data, iss_lat, iss_lon):
+    local_data = { key: value for key, value in iss_data.items() if key != "error" }
+    if "lat" in iss_data:
+        d_lon = abs(iss_lon - iss_data["lon"]) % 360
+        moved = abs(iss_lat - iss_data["lat"]) > PLACE_NAME_RANGE or min(d_lon, 360 - d_lon) > PLACE_NAME_RANGE
+    else:
+        moved = True
+    if moved:
+        for key in issclient.BINARY_FIELDS:
+            local_data.pop(key, None)
+    return local_data
+
+# Work out where the ISS is now from its orbit.
+def propagate_iss_position(satellite, iss_data, lat, lng):
+    refresh_metrics.start("propagate")
+    seconds = orbit.now()
+    iss_lat, iss_lon = satellite.subpoint(seconds)
+    local_data = local_iss_data(iss_data, iss_lat, iss_lon)
+    local_data["lat"] = iss_lat
+    local_data["lon"] = iss_lon
+    local_data["dist"] = round(orbit.distance(lat, lng, iss_lat, iss_lon))
+    local_data["position"] = textlayout.position_text(iss_lat, iss_lon)
+    local_data["updatedAt"] = format_updated_at(seconds)
+    refresh_metrics.stop("propagate")
+    return local_data
+
+# Work out where the ISS is at a time in seconds since 2000 from the ground
+# track, like propagate_iss_position().
+def track_iss_position(track, iss_data, seconds):
+    refresh_metrics.start("propagate")
+    iss_lat, iss_lon, dist = track.position(seconds)
+    local_data = local_iss_data(iss_data, iss_lat, iss_lon)
+    local_data["lat"] = iss_lat
+    local_data["lon"] = iss_lon
+    local_data["dist"] = dist
+    local_data["position"] = textlayout.position_text(iss_lat, iss_lon)
+    local_data["updatedAt"] = format_updated_at(seconds)
+    refresh_metrics.stop("propagate")
+    return local_data
+
+# Decode the world map into the framebuffer and keep a copy of it, on
+# flash as well so that later boots don't need to decode it either.
+def load_map(framebuffer):
+    buffer = bytearray(MAP_BUFFER_SIZE)
+    try:
+        with open(MAP_FILE, "rb") as f:
+            if f.readinto(buffer) == MAP_BUFFER_SIZE:
+                return buffer
+    except OSError:
+        pass
+
+    start = time.ticks_us()
+    jpg = jpegdec.JPEG(display.display)
+    jpg.open_file("worldmap.jpg")
+    jpg.decode(MAP_LEFT_OFFSET, 0, jpegdec.JPEG_SCALE_FULL, dither=False)
+    print(f"Map decoded in {time.ticks_diff(time.ticks_us(), start)}us")
+
+    buffer[:] = framebuffer[MAP_BUFFER_START:]
+    try:
+        with open(MAP_FILE, "wb") as f:
+            f.write(buffer)
+    except OSError as e:
+        print(f"Couldn't save map: {e}")
+    return buffer
+
+# Draw the world map on the right of the screen.
+def draw_map():
+    global map_buffer
+
+    framebuffer = memoryview(display.display)
+    if len(framebuffer) != MAP_BUFFER_START + MAP_BUFFER_SIZE:
+        # Not the framebuffer layout the map was saved in, decode it every time.
+        jpg = jpegdec.JPEG(display.display)
+        jpg.open_file("worldmap.jpg")
+        jpg.decode(MAP_LEFT_OFFSET, 0, jpegdec.JPEG_SCALE_FULL, dither=False)
+    else:
+        if map_buffer is None:
+            map_buffer = load_map(framebuffer)
+        framebuffer[MAP_BUFFER_START:] = map_buffer
+
+# Area of the screen covered by a marker's (left, top, right, bottom)
+# corners, rounded out to whole rows of 8.
+def marker_region(marker):
+    left = max(marker[0], 0)
+    right = min(marker[2] + 1, badger2040.WIDTH)
+    top = max(marker[1] // 8 * 8, 0)
+    bottom = min((marker[3] + 8) // 8 * 8, badger2040.HEIGHT)
+    return [left, top, right, bottom]
+
+# Work out which areas of the screen differ between two frames.
+def changed_regions(old_frame, new_frame):
+    regions = []
+    for key, region in (("distance", DISTANCE_REGION), ("location", LOCATION_REGION), ("updated_at", UPDATED_AT_REGION)):
+        if old_frame[key] != new_frame[key]:
+            regions.append(region)
+
+    # Markers and track lines that have appeared or gone, merging any that overlap.
+    map_regions = []
+    for marker in set(old_frame["markers"]) ^ set(new_frame["markers"]):
+        region = marker_region(marker)
+        merged = True
+        while merged:
+            merged = False
+            for other in map_regions:
+                if region[0] <= other[2] and other[0] <= region[2] and region[1] <= other[3] and other[1] <= region[3]:
+                    map_regions.remove(other)
+                    region = [min(region[0], other[0]), min(region[1], other[1]), max(region[2], other[2]), max(region[3], other[3])]
+                    merged = True
+                    break
+        map_regions.append(region)
+
+    if len(map_regions) > MAX_MAP_REGIONS:
+        map_regions = [[min(r[0] for r in map_regions), min(r[1] for r in map_regions), max(r[2] for r in map_regions), max(r[3] for r in map_regions)]]
+
+    for left, top, right, bottom in map_regions:
+        regions.append((left, top, right - left, bottom - top))
+    return regions
+
+# Send a new frame to the screen, only updating the parts of it that have
+# changed, with a full update every so often to clear any ghosting.
+def refresh_display(frame):
+    global last_frame, partial_updates
+
+    if last_frame is None or partial_updates >= config.FULL_REFRESH_EVERY:
+        display.set_update_speed(badger2040.UPDATE_NORMAL)
+        display.update()
+        partial_updates = 0
+    else:
+        regions = changed_regions(last_frame, frame)
+        if len(regions) > 0:
+            display.set_update_speed(badger2040.UPDATE_FAST)
+            for region in regions:
+                display.partial_update(*region)
+            partial_updates += 1
+
+    # Turn the LED on if the ISS is close enough to us, otherwise off.
+    if last_frame is None or last_frame["led"] != frame["led"]:
+        display.led(frame["led"])
+
+    last_frame = frame
+
 # Expose an access point allowing the user to configure wifi and other details.
 def setup_mode():
     print("Setup mode")
@@ -60,29 +342,20 @@ def setup_mode():
     display_centered("Connect to WiFi network", 35, 2)
     display_centered(config.AP_NAME, 70, 3)
     
+    # Networks in range, kept up to date in the background once the portal
+    # is running.
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
-    networks = wlan.scan()
-    
-    found_wifi_networks = {}
-    
-    for n in networks:
-        ssid = n[0].decode().strip('\x00')
-        if len(ssid) > 0:
-            rssi = n[3]
-            if ssid in found_wifi_networks:
-                if found_wifi_networks[ssid] < rssi:
-                    found_wifi_networks[ssid] = rssi
-            else:
-                found_wifi_networks[ssid] = rssi
-
-    wifi_networks_by_strength = sorted(found_wifi_networks.items(), key = lambda x:x[1], reverse = True)
+    wifi_networks = wifiscan.NetworkList(MAX_WIFI_NETWORKS, WIFI_NETWORK_MAX_AGE)
 
     def ap_index(request):
         if request.headers.get("host").lower() != config.AP_DOMAIN.lower():
             return render_template(f"{TEMPLATE_PATH}/redirect.html", domain = config.AP_DOMAIN.lower())
                 
-        return render_template(f"{TEMPLATE_PATH}/index.html", lat = str(config.DEFAULT_LATITUDE), lng = str(config.DEFAULT_LONGITUDE), loc = config.DEFAULT_PLACE, wifis = wifi_networks_by_strength)
+        return render_template(f"{TEMPLATE_PATH}/index.html", lat = str(config.DEFAULT_LATITUDE), lng = str(config.DEFAULT_LONGITUDE), loc = config.DEFAULT_PLACE, wifis = wifi_networks.strongest())
+
+    def ap_networks(request):
+        return json.dumps([{ "ssid": ssid, "rssi": rssi } for ssid, rssi in wifi_networks.strongest()]), 200, "application/json"
 
     def ap_configure(request):
         print("Saving wifi credentials...")
@@ -103,11 +376,13 @@ def setup_mode():
 
     server.add_route("/", handler = ap_index, methods = ["GET"])
     server.add_route("/configure", handler = ap_configure, methods = ["POST"])
+    server.add_route("/networks.json", handler = ap_networks, methods = ["GET"])
     server.set_callback(ap_catch_all)
 
     ap = access_point(config.AP_NAME)
     ip = ap.ifconfig()[0]
     dns.run_catchall(ip)
+    server.loop.create_task(wifiscan.keep_scanning(wlan, wifi_networks, WIFI_SCAN_INTERVAL))
     
     display.update()
     server.run()
@@ -132,8 +407,8 @@ def prepare_splash_screen():
     
 # Get a new ISS position and associated information from the backend and
 # display it.
-def update_iss_position(iss_data):
-    global location_history
+def update_iss_position(iss_data, add_to_history = True):
+    global last_frame
     
     # If we got an error, just display the error message over whatever is there already.
     if "error" in iss_data:
@@ -142,16 +417,21 @@ def update_iss_position(iss_data):
         display.rectangle(0, 119, badger2040.WIDTH, badger2040.HEIGHT)
         display.set_pen(0)
         display.text("Network Error.", TEXT_LEFT_OFFSET, 120, scale=1)
-        display.update()
+        display.set_update_speed(badger2040.UPDATE_FAST)
+        display.partial_update(0, 112, badger2040.WIDTH, 16)
+
+        # The message covers part of the map, so redraw everything next time.
+        last_frame = None
         return
 
     # No error, get on with displaying the info.
+    refresh_metrics.start("refresh")
     display.clear()
 
     # Load the map.
-    jpg = jpegdec.JPEG(display.display)
-    jpg.open_file("worldmap.jpg")
-    jpg.decode(MAP_LEFT_OFFSET, 0, jpegdec.JPEG_SCALE_FULL, dither=False)
+    refresh_metrics.start("map")
+    draw_map()
+    refresh_metrics.stop("map")
 
     # Draw a blank area to the left of the map for text to go in.
     display.set_pen(15)
@@ -160,183 +440,527 @@ def update_iss_position(iss_data):
 
     # Display how far away the ISS is.
     # Pad with leading 0 to always make it 5 digits.
-    display.text(f"{iss_data['dist']:05}", TEXT_LEFT_OFFSET, 2, scale=4)
+    distance_text = f"{iss_data['dist']:05}"
+    display.text(distance_text, TEXT_LEFT_OFFSET, 2, scale=4)
     display.text("miles away", TEXT_LEFT_OFFSET, 32, scale=1)
     
-    # Display the name of the place, region, country or ocean that it's over.
-    location_text = ""
-    
-    if "ocean" in iss_data:
-        # ISS over the ocean, there will be no further location fields.
-        location_text = iss_data["ocean"]
-    else:
-        if "locality" in iss_data:
-            location_text = f"{iss_data['locality'].replace('-', ' ').replace('/', ' ')}"
-        if "region" in iss_data:
-            location_text = f"{location_text}{', ' if len(location_text) > 0 else ''}{iss_data['region'].replace('-', ' ').replace('/', ' ')}"
-        if "country" in iss_data:
-            location_text = f"{location_text}{', ' if len(location_text) > 0 else ''}{iss_data['country'].replace('-', ' ').replace('/', ' ')}" 
-        
-    if len(location_text) == 0:
-        location_text = "Unknown Location"
-    else:
-        location_text = location_text.strip(" ,")
-
-    # See if the location text needs adjusting to better fit the space.
-    if display.measure_text(location_text, 2) > MAX_TEXT_WIDTH:
-        # The location text is too long, let's first try and remove the region if present.
-        location_parts = location_text.split(', ')
-        if len(location_parts) == 3:
-            # We have locality, region, country - drop the region.
-            location_text = f"{location_parts[0]}, {location_parts[2]}"
-              
-        text_width = display.measure_text(location_text, 2)
-        if text_width > MAX_TEXT_WIDTH:
-            # Taking 1 character to be 6 pixels wide, guesstimate how many
-            # characters we are over length and add in a few to make room
-            # for an ellipsis.
-            slice_off = 0 - (((text_width + 12) - MAX_TEXT_WIDTH) // 6)
-            location_text = f"{location_text[:slice_off].strip(' ')}..."
+    # Display the name of the place, region, country or ocean that it's over,
+    # shortened if needed to better fit the space.
+    refresh_metrics.start("layout")
+    location_text = text_fitter.fit(textlayout.location_text(iss_data), 2)
+    refresh_metrics.stop("layout")
     
     display.text(location_text, TEXT_LEFT_OFFSET, 46, wordwrap=badger2040.WIDTH - MAP_IMAGE_WIDTH - TEXT_LEFT_OFFSET, scale=2)
 
     # Figure out the lat/lon position for the ISS as x/y co-ordinates on the map, taking
     # into account the position of the map on the display.
+    refresh_metrics.start("draw")
     iss_lat = iss_data["lat"]
     iss_lon = iss_data["lon"]
-
-    meridian_offset_px = abs(iss_lon) * (MAP_IMAGE_WIDTH / 360)
-    iss_x = (round(MERIDIAN_X - meridian_offset_px if iss_lon < 0 else MERIDIAN_X + meridian_offset_px)) + MAP_LEFT_OFFSET
-
-    equator_offset_px = abs(iss_lat) * (MAP_IMAGE_HEIGHT / 180)
-    iss_y = (round(EQUATOR_Y - equator_offset_px if iss_lat >= 0 else EQUATOR_Y + equator_offset_px)) + MAP_TOP_OFFSET
+    iss_x, iss_y = world_map.project(iss_lat, iss_lon)
 
     display.circle(iss_x, iss_y, 4)
+    markers = [(iss_x - 4, iss_y - 4, iss_x + 4, iss_y + 4)]
     
-    # Update the previous positions with this one and cap the list size if needed.
-    
-    if len(location_history) == config.MAX_LOCATION_HISTORY:
-        location_history.pop()
-    
-    # Draw the previous positions as smaller circles.
-    for previous_loc in location_history:
-        display.circle(previous_loc[0], previous_loc[1], 2)
+    # Draw the previous positions, either as smaller circles or as a line
+    # following the path the ISS took.
+    if config.HISTORY_STYLE == "track":
+        markers += location_history.draw_track(display, iss_x, iss_y, MAP_LEFT_OFFSET, MAP_TOP_OFFSET, MAP_IMAGE_WIDTH, MAP_IMAGE_HEIGHT)
+    else:
+        markers += location_history.draw_dots(display, 2)
+    refresh_metrics.stop("draw")
     
-    # Add the current location to the history.
-    location_history.insert(0, [ iss_x, iss_y ])
+    # Add the current location to the history.  Positions worked out on the
+    # device between retrievals aren't added, so the history keeps covering
+    # the same length of time.
+    if add_to_history:
+        location_history.add(iss_x, iss_y, iss_lat, iss_lon, orbit.now())
+        try:
+            location_history.save(HISTORY_FILE)
+        except OSError as e:
+            print(f"Couldn't save history: {e}")
 
     # Display when this update was performed.
     display.text(iss_data["updatedAt"], TEXT_LEFT_OFFSET, 120, scale=1)
     
-    # Turn the LED on if the ISS is close enough to us, otherwise off.
-    if iss_data['dist'] <= config.CLOSE_BY_DISTANCE:
-        display.led(128)
-    else:
-        display.led(0)
-            
     # Update the screen with the new information.
-    display.update()
-
-
-# Main program starts here... let's display a splash screen.
-prepare_splash_screen()
-display.update()
-time.sleep(3)
+    refresh_metrics.start("update")
+    refresh_display({
+        "distance": distance_text,
+        "location": location_text,
+        "updated_at": iss_data["updatedAt"],
+        "markers": markers,
+        "led": 128 if iss_data['dist'] <= config.CLOSE_BY_DISTANCE else 0
+    })
+    refresh_metrics.stop("update")
+    refresh_metrics.stop("refresh")
+
+
+# Ask for the screen to be redrawn with new information.  If it hasn't been
+# drawn since the last request, only the latest information is drawn.
+def request_render(new_iss_data, add_to_history = True):
+    global pending_render
+    if pending_render is not None and pending_render[1]:
+        add_to_history = True
+    pending_render = (new_iss_data, add_to_history)
+    render_needed.set()
+
+# Task that redraws the screen whenever it's asked to.  Like the other
+# tasks, it logs anything that goes wrong and carries on, rather than
+# stopping and leaving the screen as it is for good.
+async def render():
+    global pending_render, last_frame
+    while True:
+        await render_needed.wait()
+        render_needed.clear()
+        new_iss_data, add_to_history = pending_render
+        pending_render = None
+        try:
+            update_iss_position(new_iss_data, add_to_history)
+        except Exception as e:
+            logging.exception(f"Couldn't update the screen: {e}")
+            # Whatever was drawn of it isn't on the screen, so redraw it all next time.
+            last_frame = None
+            continue
+        if "error" not in new_iss_data:
+            record_boot_time("boot_to_screen")
+            if add_to_history:
+                record_boot_time("boot_to_data")
+                data_shown.set()
+
+# URL and headers for getting information from the backend.
+def iss_service_request(wifi_credentials):
+    url = f"{config.ISS_SERVICE_URL}?deviceid={config.DEVICE_ID}&lat={wifi_credentials['lat']}&lng={wifi_credentials['lng']}"
+    if config.TRACK_MINUTES and not config.LOW_POWER:
+        url += f"&track={config.TRACK_MINUTES}"
+    headers = {
+        "X-ISS-Locator-Token": config.ISS_SERVICE_PASSPHRASE,
+        "Accept": f"{issclient.BINARY_CONTENT_TYPE}, application/json"
+    }
+    return url, headers
+
+# Get the ISS position and place names from the backend, returns what to draw.
+async def get_iss_data(url, headers, lat, lng):
+    global iss_data, iss_track, clock_set
+
+    # A little bit of manual memory management just in case.
+    gc.collect()
+
+    if not clock_set:
+        clock_set = set_clock()
+
+    try:
+        refresh_metrics.start("fetch")
+        length = await iss_client.get_into(url, response_buffer, headers)
+        refresh_metrics.stop("fetch")
+        refresh_metrics.start("decode")
+        iss_data = issclient.decode_iss_data(response_buffer, length)
+        refresh_metrics.stop("decode")
+        if "updatedAt" not in iss_data:
+            iss_data["updatedAt"] = format_updated_at(iss_data["updatedSeconds"])
+        track = iss_data.pop("track", None)
+        if track is not None:
+            iss_track = track
+            # The track starts at the backend's time.
+            if clock_set and abs(orbit.now() - track.start) > TRACK_MAX_CLOCK_DRIFT:
+                print(f"Clock is {orbit.now() - track.start}s out, setting it again")
+                clock_set = set_clock()
+        backend_reached.set()
+    except Exception as e:
+        print(f"Couldn't get ISS data: {e}")
+        iss_data = { "error": True }
+        if cached_address:
+            forget_wifi_cache()
+
+    # Without the backend, the position can still be shown from the ground
+    # track or the orbit.
+    if "error" in iss_data and clock_set:
+        seconds = orbit.now()
+        if iss_track is not None and iss_track.covers(seconds):
+            return track_iss_position(iss_track, {}, seconds)
+        if satellite is not None:
+            return propagate_iss_position(satellite, {}, lat, lng)
+    return iss_data
+
+# Seconds until the backend should be asked again.  With a ground track
+# that's when it's about to run out, rather than every REFRESH_INTERVAL.
+def next_fetch_delay():
+    if clock_set and iss_track is not None:
+        return max(config.REFRESH_INTERVAL, iss_track.end() - orbit.now() - TRACK_REFETCH_MARGIN)
+    return config.REFRESH_INTERVAL
+
+# Task that gets the ISS position and place names from the backend.
+async def fetch_iss_data(wifi_credentials):
+    url, headers = iss_service_request(wifi_credentials)
+    lat = float(wifi_credentials["lat"])
+    lng = float(wifi_credentials["lng"])
+
+    state_saved = None
+    while True:
+        try:
+            request_render(await get_iss_data(url, headers, lat, lng))
+            # Keep what the backend sent to show straight away next time.
+            if config.FAST_BOOT and "error" not in iss_data and (state_saved is None or time.ticks_diff(time.ticks_ms(), state_saved) > STATE_SAVE_INTERVAL * 1000):
+                try:
+                    save_state()
+                    state_saved = time.ticks_ms()
+                except OSError as e:
+                    print(f"Couldn't save state: {e}")
+        except Exception as e:
+            logging.exception(f"Couldn't get ISS data: {e}")
+        await uasyncio.sleep(next_fetch_delay())
+
+# Task that moves the ISS along its ground track or orbit between updates
+# from the backend, without using the network.
+async def move_iss(lat, lng):
+    while True:
+        await uasyncio.sleep(config.POSITION_INTERVAL)
+        if not clock_set:
+            continue
+        try:
+            seconds = orbit.now()
+            if iss_track is not None and iss_track.covers(seconds):
+                request_render(track_iss_position(iss_track, iss_data, seconds), add_to_history = False)
+            elif satellite is not None:
+                request_render(propagate_iss_position(satellite, iss_data, lat, lng), add_to_history = False)
+        except Exception as e:
+            logging.exception(f"Couldn't work out the ISS position: {e}")
+
+# Download a new TLE if the one we have is more than a day old.
+async def check_tle():
+    global satellite
+    if clock_set and (satellite is None or satellite.age(orbit.now()) > config.TLE_MAX_AGE):
+        gc.collect()
+        satellite = await refresh_tle() or satellite
+
+# Task that downloads a new TLE once a day, retrying every so often if that fails.
+async def keep_tle_current():
+    while True:
+        try:
+            await check_tle()
+        except Exception as e:
+            logging.exception(f"Couldn't check the TLE: {e}")
+        await uasyncio.sleep(TLE_RETRY_INTERVAL)
+
+# Save what's needed to carry on after being switched off.  The history is
+# saved separately as it changes.
+def save_state():
+    state = {
+        "iss_data": iss_data,
+        "saved_at": orbit.now(),
+        "frame": last_frame,
+        "partial_updates": partial_updates
+    }
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f)
+
+# Load the state saved before being switched off, returns whether there was one.
+def load_state():
+    global iss_data, last_frame, partial_updates
+    try:
+        with open(STATE_FILE, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    iss_data = state["iss_data"]
+    # The screen still shows the last frame, so carry on with partial updates.
+    # The LED went off with the power though.
+    last_frame = state["frame"]
+    if last_frame is not None:
+        last_frame["markers"] = [tuple(marker) for marker in last_frame["markers"]]
+        last_frame["led"] = 0
+    partial_updates = state["partial_updates"]
+    return True
+
+# Low power mode: update the screen once, then switch off until the next
+# update is due.  The Badger's real time clock switches it back on.
+async def update_and_sleep(wifi_credentials):
+    start = time.ticks_ms()
+    url, headers = iss_service_request(wifi_credentials)
+
+    await check_tle()
+    update_iss_position(await get_iss_data(url, headers, float(wifi_credentials["lat"]), float(wifi_credentials["lng"])))
+    if clock_set:
+        save_state()
+    if config.FAST_BOOT and backend_reached.is_set():
+        save_wifi_cache(wifi_credentials["ssid"])
+
+    awake = time.ticks_diff(time.ticks_ms(), start) // 1000
+    minutes = max(1, round((config.REFRESH_INTERVAL - awake) / 60))
+    print(f"Awake for {awake}s, sleeping for {minutes} minutes")
+    logging.flush()
+    badger2040.sleep_for(minutes)
+
+    # Still here, so running from USB power which can't be switched off.
+    # sleep_for() has waited instead, so start again as if woken up.
+    machine.reset()
 
-# First, see if there's a configured WiFi network.
-try:
-    os.stat(WIFI_FILE)
-    
-    # File was found, read the configuration and try to connect.
-    f = open(WIFI_FILE, "r")
-    wifi_credentials = json.load(f)
-    f.close()
-    
-    display.text("Connecting...", 160, 100, scale=2)
-    display.update()
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(wifi_credentials["ssid"], wifi_credentials["password"])
+# Record how long after starting up something was first shown.
+def record_boot_time(stage):
+    if refresh_metrics.count(stage) == 0:
+        elapsed = time.ticks_diff(time.ticks_ms(), boot_start)
+        refresh_metrics.record(stage, elapsed * 1000, 0)
+        print(f"{stage}: {elapsed}ms")
+
+# The access point and DHCP lease from the last time the network was
+# connected to, or None if there isn't one.
+def load_wifi_cache(ssid):
+    try:
+        with open(WIFI_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cache if cache.get("ssid") == ssid else None
+
+# The cached details to reconnect with, if the DHCP lease is recent enough
+# to still be ours.  The clock comes from the Badger's real time clock,
+# and if that hasn't been set the lease looks too old to use.
+def current_wifi_cache(ssid):
+    cache = load_wifi_cache(ssid)
+    if cache is None:
+        return None
+    age = orbit.now() - cache.get("saved_at", 0)
+    return cache if 0 <= age < WIFI_LEASE_TIME else None
+
+# The cached address doesn't work, so stop using it, now and next time.
+def forget_wifi_cache():
+    global cached_address
+    print("Cached WiFi address not working, using DHCP")
+    cached_address = False
+    try:
+        os.remove(WIFI_CACHE_FILE)
+    except OSError:
+        pass
+    wlan.ifconfig("dhcp")
+
+# Remember the access point and DHCP lease, and when the lease was known to
+# be ours.  A cached static address holds no lease, so only one from DHCP
+# is remembered.  Finding the access point means scanning, which holds
+# everything else up for a second or two, so it's only done when they change.
+def save_wifi_cache(ssid):
+    if cached_address or not clock_set:
+        return
 
-    while not wlan.isconnected() and wlan.status() >= 0:
-        print("Connecting...")
-        time.sleep(0.2)
-
-    wifi_status_text = ""
-
-    if wlan.status() == network.STAT_GOT_IP:
-        print("Connected")
-        wifi_status_text = "Connected!"
-    elif wlan.status() == network.STAT_WRONG_PASSWORD:
-        wifi_status_text = "Wrong WiFi password."
-        print("Wrong password")
-    elif wlan.status() == network.STAT_NO_AP_FOUND:
-        wifi_status_text = "Wrong WiFi SSID."
-        print("Wrong SSID")
+    cache = load_wifi_cache(ssid)
+    address = list(wlan.ifconfig())
+    if cache is None or cache["ifconfig"] != address:
+        strongest = None
+        for result in wlan.scan():
+            if result[0] == ssid.encode() and (strongest is None or result[3] > strongest[3]):
+                strongest = result
+        if strongest is None:
+            return
+        cache = {
+            "ssid": ssid,
+            "bssid": binascii.hexlify(strongest[1]).decode(),
+            "channel": strongest[2],
+            "ifconfig": address
+        }
+    cache["saved_at"] = orbit.now()
+
+    try:
+        with open(WIFI_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Couldn't save WiFi details: {e}")
+
+# Task that remembers the access point and DHCP lease once the backend has
+# been reached with them, after the screen has been updated.
+async def remember_wifi(ssid):
+    await backend_reached.wait()
+    await data_shown.wait()
+    try:
+        save_wifi_cache(ssid)
+    except Exception as e:
+        logging.exception(f"Couldn't save the WiFi details: {e}")
+
+# Start connecting to the WiFi network, which carries on in the background.
+# With the access point and address from last time, connecting skips
+# scanning for the network and asking for an address.
+def start_connecting(wifi_credentials, cache):
+    global cached_address
+    if cache is not None:
+        wlan.ifconfig(tuple(cache["ifconfig"]))
+        wlan.connect(wifi_credentials["ssid"], wifi_credentials["password"], bssid = binascii.unhexlify(cache["bssid"]), channel = cache["channel"])
+        cached_address = True
     else:
-        print("Wifi connection error.")
-        wifi_status_text = "Unknown WiFi error."
-
-
-    display.set_pen(15)
-    display.clear()
-    display.set_pen(0)
-    display_centered(wifi_status_text, 56, 2)
-    
-    if wlan.status() != network.STAT_GOT_IP:
-        display_centered("Press A and C buttons to reset.", 85, 2)
-        
-    display.update()
-    
-    # Bad WiFi configuration, so wait for them to press A&C then reboot.
-    if (wlan.status() != network.STAT_GOT_IP):
-        print("Deleted wifi.json, waiting to reboot.")
-        os.remove(WIFI_FILE)
-        
-        while True:
-            if display.pressed(badger2040.BUTTON_A) and display.pressed(badger2040.BUTTON_C):
-                machine_reset()
-                
-            time.sleep(0.2)            
-
-    # Let the WiFi status message show for a moment.  Will actually show a little
-    # longer than this as it will stay on the screen while the first ISS position is
-    # retrieved from the server.
-    time.sleep(2)
+        wlan.connect(wifi_credentials["ssid"], wifi_credentials["password"])
+
+# Wait until connected or the connection fails, returns the status.  If
+# reconnecting with the details from last time doesn't work, tries again
+# normally.
+def wait_for_connection(wifi_credentials):
+    global cached_address
+    start = time.ticks_ms()
+    while not wlan.isconnected() and wlan.status() >= 0:
+        if cached_address and time.ticks_diff(time.ticks_ms(), start) > FAST_CONNECT_TIMEOUT * 1000:
+            break
+        time.sleep_ms(20)
+
+    if cached_address and wlan.status() != network.STAT_GOT_IP:
+        print("Couldn't reconnect quickly, connecting normally")
+        wlan.disconnect()
+        forget_wifi_cache()
+        start_connecting(wifi_credentials, None)
+        return wait_for_connection(wifi_credentials)
+    return wlan.status()
+
+# Timings of each stage of refreshing the screen, as JSON or in the
+# Prometheus text format (which Prometheus asks for when scraping).
+def metrics_route(request):
+    if request.query.get("format") == "prometheus" or "text/plain" in request.headers.get("accept", ""):
+        return refresh_metrics.prometheus({ "device": config.DEVICE_ID }), 200, "text/plain; version=0.0.4"
+    return json.dumps(refresh_metrics.summary()), 200, "application/json"
+
+# Called from an interrupt when a button is pressed.
+def button_interrupt(pin):
+    button_pressed.set()
+
+# Task that resets the device when the A and C buttons are pressed together.
+async def watch_buttons():
+    for button in (badger2040.BUTTON_A, badger2040.BUTTON_C):
+        machine.Pin(button, machine.Pin.IN, machine.Pin.PULL_DOWN).irq(trigger = machine.Pin.IRQ_RISING, handler = button_interrupt)
 
-    # Main loop - basically get the ISS position and other information periodically
-    # from the backend and display it.
-    last_updated = 0
-    
     while True:
-        # Check for the reset key press.
         if display.pressed(badger2040.BUTTON_A) and display.pressed(badger2040.BUTTON_C):
-            print("Deleted wifi.json, will reboot.")
-            os.remove(WIFI_FILE)
+            try:
+                os.remove(WIFI_FILE)
+                print("Deleted wifi.json, will reboot.")
+            except OSError:
+                pass
             machine_reset()
-        
-        # Is it time to run the update?
-        if last_updated == 0 or time.ticks_diff(time.ticks_ms(), last_updated) >= (config.REFRESH_INTERVAL * 1000):
-            # A little bit of manual memory management just in case.
-            gc.collect()
 
-            try:
-                iss_data = urequests.get(
-                    f"{config.ISS_SERVICE_URL}?deviceid={config.DEVICE_ID}&lat={wifi_credentials['lat']}&lng={wifi_credentials['lng']}",
-                    headers = {
-                        "X-ISS-Locator-Token": config.ISS_SERVICE_PASSPHRASE
-                    }
-                ).json()
+        await button_pressed.wait()
+        # Give the other button a moment to go down too.
+        await uasyncio.sleep_ms(100)
+
+# Main program.  In low power mode, being woken up by the real time clock
+# just needs the screen updating, so skip straight to that.
+def main():
+    global boot_start, clock_set, last_frame, satellite, wlan
+
+    boot_start = time.ticks_ms()
+    woken_for_update = False
+    # The Badger's real time clock has the time if it was set before
+    # switching off, for low power mode and the lease in fast boot mode.
+    if config.LOW_POWER or config.FAST_BOOT:
+        badger2040.pcf_to_pico_rtc()
+    if config.LOW_POWER:
+        woken_for_update = badger2040.woken_by_rtc() and load_state()
+        clock_set = woken_for_update
+
+    # In fast boot mode, the last ISS screen is shown again while connecting
+    # to the WiFi.  Otherwise let's display a splash screen, which stays up
+    # until the WiFi is connected.
+    show_last_screen = not woken_for_update and config.FAST_BOOT and load_state() and "lat" in iss_data
+    if not woken_for_update and not show_last_screen:
+        prepare_splash_screen()
+
+    # First, see if there's a configured WiFi network.
+    try:
+        os.stat(WIFI_FILE)
+    
+        # File was found, read the configuration and try to connect.
+        f = open(WIFI_FILE, "r")
+        wifi_credentials = json.load(f)
+        f.close()
+    
+        # Connecting carries on while the screen updates.
+        wlan = network.WLAN(network.STA_IF)
+        wlan.active(True)
+        print("Connecting...")
+        start_connecting(wifi_credentials, current_wifi_cache(wifi_credentials["ssid"]) if config.FAST_BOOT else None)
+
+        # Show the splash screen and that we're connecting in one go, rather
+        # than updating the screen twice.
+        if not woken_for_update and not show_last_screen:
+            display.text("Connecting...", 160, 100, scale=2)
+            display.update()
+
+        if show_last_screen:
+            last_frame = None
+            update_iss_position(iss_data, add_to_history = False)
+            record_boot_time("boot_to_screen")
+
+        wait_for_connection(wifi_credentials)
+        wifi_status_text = ""
+
+        if wlan.status() == network.STAT_GOT_IP:
+            print("Connected")
+            wifi_status_text = "Connected!"
+        elif wlan.status() == network.STAT_WRONG_PASSWORD:
+            wifi_status_text = "Wrong WiFi password."
+            print("Wrong password")
+        elif wlan.status() == network.STAT_NO_AP_FOUND:
+            wifi_status_text = "Wrong WiFi SSID."
+            print("Wrong SSID")
+        else:
+            print("Wifi connection error.")
+            wifi_status_text = "Unknown WiFi error."
+
+
+        # The WiFi worked before going to sleep, so if it doesn't now just show
+        # the error on the map and try again at the next update.
+        if woken_for_update and wlan.status() != network.STAT_GOT_IP:
+            update_iss_position({ "error": True })
+            save_state()
+            logging.flush()
+            badger2040.sleep_for(max(1, config.REFRESH_INTERVAL // 60))
+            machine.reset()
+
+        # When showing the last screen, only show the status if it's bad.
+        if not woken_for_update and not (show_last_screen and wlan.status() == network.STAT_GOT_IP):
+            display.set_pen(15)
+            display.clear()
+            display.set_pen(0)
+            display_centered(wifi_status_text, 56, 2)
         
-            except:
-                iss_data = { "error": True }
+            if wlan.status() != network.STAT_GOT_IP:
+                display_centered("Press A and C buttons to reset.", 85, 2)
             
-            update_iss_position(iss_data)
-            last_updated = time.ticks_ms()
+            display.update()
+    
+        # Bad WiFi configuration, so wait for them to press A&C then reboot.
+        if (wlan.status() != network.STAT_GOT_IP):
+            print("Deleted wifi.json, waiting to reboot.")
+            os.remove(WIFI_FILE)
         
-        time.sleep(0.2)
+            server.loop.create_task(watch_buttons())
+            server.loop.run_forever()
+
+        # The ISS position is worked out on the device from its orbit, which needs
+        # the right time and a recent TLE.
+        if not clock_set:
+            clock_set = set_clock()
+        satellite = orbit.load(TLE_FILE)
+
+        if config.LOW_POWER:
+            server.loop.create_task(watch_buttons())
+            server.loop.run_until_complete(update_and_sleep(wifi_credentials))
+
+        # Get the place names and other information periodically from the backend,
+        # and work out the ISS position locally in between.
+        lat = float(wifi_credentials["lat"])
+        lng = float(wifi_credentials["lng"])
+        server.loop.create_task(watch_buttons())
+        server.loop.create_task(render())
+        server.loop.create_task(fetch_iss_data(wifi_credentials))
+        server.loop.create_task(move_iss(lat, lng))
+        server.loop.create_task(keep_tle_current())
+        if config.FAST_BOOT:
+            server.loop.create_task(remember_wifi(wifi_credentials["ssid"]))
+        server.add_route("/metrics", handler = metrics_route, methods = ["GET"])
+        server.start(port = config.METRICS_PORT)
+        logging.start_flush_task()
+        server.loop.run_forever()
                             
-except Exception:
-    # Either no wifi configuration file found, or something went wrong, 
-    # so go into setup mode.
-    setup_mode()
\ No newline at end of file
+    except Exception:
+        # Either no wifi configuration file found, or something went wrong, 
+        # so go into setup mode.
+        setup_mode()
+
+
+# Run when the device boots, but not when imported for testing on a computer.
+if __name__ == "__main__":
+    main()
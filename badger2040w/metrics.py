@@ -0,0 +1,129 @@
+# Records how long each stage of refreshing the screen takes, and how much
+# memory it allocates, so that slow refreshes in the field can be tracked
+# down.  Each stage keeps its last few samples in fixed size ring buffers
+# of arrays, so recording doesn't allocate, and reports the minimum,
+# average and maximum of them as JSON or in the Prometheus text format.
+import gc
+import time
+
+from arrays import zeros
+
+# Prefix of the Prometheus metric names.
+PREFIX = "isstracker"
+
+
+class Metrics:
+    def __init__(self, stages, capacity=32):
+        self.stages = stages
+        self.capacity = capacity
+        self._index = {stage: i for i, stage in enumerate(stages)}
+        count = len(stages)
+        # Samples for stage i are at [i * capacity:(i + 1) * capacity].
+        self._time_us = zeros("i", count * capacity)
+        self._allocated = zeros("i", count * capacity)
+        # How many samples each stage has had in all.
+        self._count = zeros("I", count)
+        # ticks_us and gc.mem_alloc() when each stage started.
+        self._start_us = zeros("I", count)
+        self._start_alloc = zeros("I", count)
+
+    def start(self, stage):
+        i = self._index[stage]
+        self._start_alloc[i] = gc.mem_alloc()
+        self._start_us[i] = time.ticks_us() & 0x3FFFFFFF
+
+    # Record a sample for a stage from when start() was last called for it.
+    def stop(self, stage):
+        end_us = time.ticks_us() & 0x3FFFFFFF
+        i = self._index[stage]
+        # ticks_us() wraps at 2**30 on the Pico.
+        elapsed = (end_us - self._start_us[i]) & 0x3FFFFFFF
+        # Negative if the garbage collector ran part way through.
+        self.record(stage, elapsed, gc.mem_alloc() - self._start_alloc[i])
+
+    # How many samples a stage has had in all.
+    def count(self, stage):
+        return self._count[self._index[stage]]
+
+    def record(self, stage, time_us, allocated):
+        i = self._index[stage]
+        slot = i * self.capacity + self._count[i] % self.capacity
+        self._time_us[slot] = time_us
+        self._allocated[slot] = allocated
+        self._count[i] += 1
+
+    # Minimum, average and maximum of a stage's samples in values, or None
+    # if there aren't any.
+    def _summary(self, values, i):
+        count = min(self._count[i], self.capacity)
+        if count == 0:
+            return None
+        start = i * self.capacity
+        low = high = total = values[start]
+        for slot in range(start + 1, start + count):
+            value = values[slot]
+            total += value
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+        return low, total // count, high
+
+    def clear(self):
+        for i in range(len(self.stages)):
+            self._count[i] = 0
+
+    # Summary of every stage as a dict that can be turned into JSON.
+    def summary(self):
+        stages = {}
+        for i, stage in enumerate(self.stages):
+            time_us = self._summary(self._time_us, i)
+            if time_us is None:
+                continue
+            allocated = self._summary(self._allocated, i)
+            stages[stage] = {
+                "count": self._count[i],
+                "samples": min(self._count[i], self.capacity),
+                "time_us": {"min": time_us[0], "avg": time_us[1], "max": time_us[2]},
+                "allocated": {"min": allocated[0], "avg": allocated[1], "max": allocated[2]}
+            }
+        return {
+            "stages": stages,
+            "mem_free": gc.mem_free(),
+            "mem_alloc": gc.mem_alloc()
+        }
+
+    # The summary in the Prometheus text exposition format, with labels
+    # (a dict) added to every metric, e.g. to tell devices apart.
+    def prometheus(self, labels=None):
+        label_text = ""
+        if labels:
+            label_text = "".join(f',{name}="{value}"' for name, value in labels.items())
+        summary = self.summary()
+        stages = summary["stages"]
+
+        lines = []
+        for name, key, unit, help_text in (
+            ("stage_time", "time_us", "microseconds", "Time taken by each stage of a refresh over recent samples."),
+            ("stage_allocated", "allocated", "bytes", "Memory allocated by each stage of a refresh over recent samples.")
+        ):
+            for statistic in ("min", "avg", "max"):
+                metric = f"{PREFIX}_{name}_{unit}_{statistic}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} gauge")
+                for stage, values in stages.items():
+                    lines.append(f'{metric}{{stage="{stage}"{label_text}}} {values[key][statistic]}')
+
+        metric = f"{PREFIX}_stage_samples_total"
+        lines.append(f"# HELP {metric} Samples recorded for each stage of a refresh.")
+        lines.append(f"# TYPE {metric} counter")
+        for stage, values in stages.items():
+            lines.append(f'{metric}{{stage="{stage}"{label_text}}} {values["count"]}')
+
+        device_labels = f"{{{label_text[1:]}}}" if label_text else ""
+        for key in ("mem_free", "mem_alloc"):
+            metric = f"{PREFIX}_{key}_bytes"
+            lines.append(f"# HELP {metric} gc.{key}() now.")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{device_labels} {summary[key]}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,355 @@
+# Works out where the ISS is on the device, using the SGP4 orbit model and
+# a two line element set (TLE) that only needs downloading about once a
+# day.  This is the near earth part of SGP4 (orbits of under 225 minutes,
+# which the ISS's ~92 minute orbit is), following Vallado et al,
+# "Revisiting Spacetrack Report #3" (AIAA 2006-6753).
+#
+# The Pico's floats are single precision, so times are kept as whole
+# seconds since 2000-01-01 UTC and split into days and fractions of a day
+# before anything big gets multiplied by them.
+import math
+import time
+
+# WGS-72 constants, which TLEs are generated with.
+EARTH_RADIUS_KM = 6378.135
+XKE = 60.0 / math.sqrt(EARTH_RADIUS_KM ** 3 / 398600.8)
+J2 = 0.001082616
+J3 = -0.00000253881
+J4 = -0.00000165597
+J3OJ2 = J3 / J2
+# Flattening used when converting to geodetic latitude.
+FLATTENING = 1 / 298.26
+# Same radius the haversine package uses in the cloud function.
+EARTH_RADIUS_MILES = 3960
+
+TWO_PI = 2 * math.pi
+MINUTES_PER_DAY = 1440
+SECONDS_PER_DAY = 86400
+
+# Offset between the time.time() epoch and 2000-01-01, ports differ.
+EPOCH_2000 = 946684800 if time.gmtime(0)[0] == 1970 else 0
+
+
+# Seconds since 2000-01-01 00:00 UTC, from the real time clock.
+def now():
+    return int(time.time()) - EPOCH_2000
+
+
+# Days since 2000-01-01 at the start of the given year.
+def _days_to_year(year):
+    return (year - 2000) * 365 + (year - 1997) // 4
+
+
+# Parses a number in TLE "assumed decimal point" form, e.g. " 28098-4".
+def _tle_exp(field):
+    field = field.strip()
+    if not field:
+        return 0.0
+    sign = -1 if field[0] == "-" else 1
+    field = field.lstrip("+-")
+    return sign * float("0." + field[:-2]) * 10 ** int(field[-2:])
+
+
+class Satellite:
+    def __init__(self, line1, line2):
+        self.line1 = line1
+        self.line2 = line2
+
+        # Epoch, split into whole days since 2000 and the fraction of a day.
+        year = int(line1[18:20])
+        year += 2000 if year < 57 else 1900
+        day_of_year = line1[20:32].strip()
+        whole, fraction = day_of_year.split(".")
+        self.epoch_days = _days_to_year(year) + int(whole) - 1
+        self.epoch_fraction = float("0." + fraction)
+
+        self.bstar = _tle_exp(line1[53:61])
+
+        deg = math.pi / 180
+        self.inclo = float(line2[8:16]) * deg
+        self.nodeo = float(line2[17:25]) * deg
+        self.ecco = float("0." + line2[26:33].strip())
+        self.argpo = float(line2[34:42]) * deg
+        self.mo = float(line2[43:51]) * deg
+        # Revolutions per day to radians per minute.
+        no_kozai = float(line2[52:63]) * TWO_PI / MINUTES_PER_DAY
+
+        self._init(no_kozai)
+
+    # Seconds since 2000-01-01 UTC of the TLE epoch (rounded).
+    def epoch(self):
+        return self.epoch_days * SECONDS_PER_DAY + int(self.epoch_fraction * SECONDS_PER_DAY)
+
+    # Minutes between the TLE epoch and a time in seconds since 2000.
+    def minutes_since_epoch(self, seconds):
+        return (seconds - self.epoch_days * SECONDS_PER_DAY) / 60 - self.epoch_fraction * MINUTES_PER_DAY
+
+    def _init(self, no_kozai):
+        ecco = self.ecco
+        inclo = self.inclo
+        bstar = self.bstar
+
+        ss = 78.0 / EARTH_RADIUS_KM + 1.0
+        qzms2t = ((120.0 - 78.0) / EARTH_RADIUS_KM) ** 4
+        x2o3 = 2.0 / 3.0
+
+        # Recover the original mean motion and semi major axis.
+        eccsq = ecco * ecco
+        omeosq = 1.0 - eccsq
+        rteosq = math.sqrt(omeosq)
+        cosio = math.cos(inclo)
+        cosio2 = cosio * cosio
+        ak = (XKE / no_kozai) ** x2o3
+        d1 = 0.75 * J2 * (3.0 * cosio2 - 1.0) / (rteosq * omeosq)
+        delta = d1 / (ak * ak)
+        adel = ak * (1.0 - delta * delta - delta * (1.0 / 3.0 + 134.0 * delta * delta / 81.0))
+        delta = d1 / (adel * adel)
+        self.no = no = no_kozai / (1.0 + delta)
+        ao = (XKE / no) ** x2o3
+        sinio = math.sin(inclo)
+        po = ao * omeosq
+        con42 = 1.0 - 5.0 * cosio2
+        self.con41 = con41 = -con42 - cosio2 - cosio2
+        posq = po * po
+        rp = ao * (1.0 - ecco)
+
+        if TWO_PI / no >= 225.0:
+            raise ValueError("deep space orbits aren't supported")
+
+        # Orbits with a perigee under 220km use a simplified model.
+        self.isimp = rp < (220.0 / EARTH_RADIUS_KM + 1.0)
+        sfour = ss
+        qzms24 = qzms2t
+        perige = (rp - 1.0) * EARTH_RADIUS_KM
+        if perige < 156.0:
+            sfour = perige - 78.0
+            if perige < 98.0:
+                sfour = 20.0
+            qzms24 = ((120.0 - sfour) / EARTH_RADIUS_KM) ** 4
+            sfour = sfour / EARTH_RADIUS_KM + 1.0
+
+        pinvsq = 1.0 / posq
+        tsi = 1.0 / (ao - sfour)
+        self.eta = eta = ao * ecco * tsi
+        etasq = eta * eta
+        eeta = ecco * eta
+        psisq = abs(1.0 - etasq)
+        coef = qzms24 * tsi ** 4
+        coef1 = coef / psisq ** 3.5
+        cc2 = coef1 * no * (ao * (1.0 + 1.5 * etasq + eeta * (4.0 + etasq)) +
+                            0.375 * J2 * tsi / psisq * con41 * (8.0 + 3.0 * etasq * (8.0 + etasq)))
+        self.cc1 = cc1 = bstar * cc2
+        cc3 = 0.0
+        if ecco > 1.0e-4:
+            cc3 = -2.0 * coef * tsi * J3OJ2 * no * sinio / ecco
+        self.x1mth2 = x1mth2 = 1.0 - cosio2
+        self.cc4 = 2.0 * no * coef1 * ao * omeosq * (
+            eta * (2.0 + 0.5 * etasq) + ecco * (0.5 + 2.0 * etasq) -
+            J2 * tsi / (ao * psisq) * (
+                -3.0 * con41 * (1.0 - 2.0 * eeta + etasq * (1.5 - 0.5 * eeta)) +
+                0.75 * x1mth2 * (2.0 * etasq - eeta * (1.0 + etasq)) * math.cos(2.0 * self.argpo)))
+        self.cc5 = 2.0 * coef1 * ao * omeosq * (1.0 + 2.75 * (etasq + eeta) + eeta * etasq)
+
+        # Secular rates from gravity.
+        cosio4 = cosio2 * cosio2
+        temp1 = 1.5 * J2 * pinvsq * no
+        temp2 = 0.5 * temp1 * J2 * pinvsq
+        temp3 = -0.46875 * J4 * pinvsq * pinvsq * no
+        self.mdot = no + 0.5 * temp1 * rteosq * con41 + 0.0625 * temp2 * rteosq * (13.0 - 78.0 * cosio2 + 137.0 * cosio4)
+        self.argpdot = (-0.5 * temp1 * con42 + 0.0625 * temp2 * (7.0 - 114.0 * cosio2 + 395.0 * cosio4) +
+                        temp3 * (3.0 - 36.0 * cosio2 + 49.0 * cosio4))
+        xhdot1 = -temp1 * cosio
+        self.nodedot = xhdot1 + (0.5 * temp2 * (4.0 - 19.0 * cosio2) + 2.0 * temp3 * (3.0 - 7.0 * cosio2)) * cosio
+        self.omgcof = bstar * cc3 * math.cos(self.argpo)
+        self.xmcof = 0.0
+        if ecco > 1.0e-4:
+            self.xmcof = -x2o3 * coef * bstar / eeta
+        self.nodecf = 3.5 * omeosq * xhdot1 * cc1
+        self.t2cof = 1.5 * cc1
+        if abs(cosio + 1.0) > 1.5e-12:
+            self.xlcof = -0.25 * J3OJ2 * sinio * (3.0 + 5.0 * cosio) / (1.0 + cosio)
+        else:
+            self.xlcof = -0.25 * J3OJ2 * sinio * (3.0 + 5.0 * cosio) / 1.5e-12
+        self.aycof = -0.5 * J3OJ2 * sinio
+        self.delmo = (1.0 + eta * math.cos(self.mo)) ** 3
+        self.sinmao = math.sin(self.mo)
+        self.x7thm1 = 7.0 * cosio2 - 1.0
+
+        if not self.isimp:
+            cc1sq = cc1 * cc1
+            self.d2 = d2 = 4.0 * ao * tsi * cc1sq
+            temp = d2 * tsi * cc1 / 3.0
+            self.d3 = d3 = (17.0 * ao + sfour) * temp
+            self.d4 = d4 = 0.5 * temp * ao * tsi * (221.0 * ao + 31.0 * sfour) * cc1
+            self.t3cof = d2 + 2.0 * cc1sq
+            self.t4cof = 0.25 * (3.0 * d3 + cc1 * (12.0 * d2 + 10.0 * cc1sq))
+            self.t5cof = 0.2 * (3.0 * d4 + 12.0 * cc1 * d3 + 6.0 * d2 * d2 + 15.0 * cc1sq * (2.0 * d2 + cc1sq))
+
+    # Position in km in the TEME frame, t minutes after the TLE epoch.
+    def propagate(self, t):
+        # Secular gravity and atmospheric drag.
+        xmdf = self.mo + self.mdot * t
+        argpdf = self.argpo + self.argpdot * t
+        nodedf = self.nodeo + self.nodedot * t
+        argpm = argpdf
+        mm = xmdf
+        t2 = t * t
+        nodem = nodedf + self.nodecf * t2
+        tempa = 1.0 - self.cc1 * t
+        tempe = self.bstar * self.cc4 * t
+        templ = self.t2cof * t2
+
+        if not self.isimp:
+            delomg = self.omgcof * t
+            delm = self.xmcof * ((1.0 + self.eta * math.cos(xmdf)) ** 3 - self.delmo)
+            temp = delomg + delm
+            mm = xmdf + temp
+            argpm = argpdf - temp
+            t3 = t2 * t
+            t4 = t3 * t
+            tempa = tempa - self.d2 * t2 - self.d3 * t3 - self.d4 * t4
+            tempe = tempe + self.bstar * self.cc5 * (math.sin(mm) - self.sinmao)
+            templ = templ + self.t3cof * t3 + t4 * (self.t4cof + t * self.t5cof)
+
+        am = (XKE / self.no) ** (2.0 / 3.0) * tempa * tempa
+        nm = XKE / am ** 1.5
+        em = self.ecco - tempe
+        if em < 1.0e-6:
+            em = 1.0e-6
+        mm = mm + self.no * templ
+        xlm = mm + argpm + nodem
+        nodem = math.fmod(nodem, TWO_PI)
+        argpm = math.fmod(argpm, TWO_PI)
+        xlm = math.fmod(xlm, TWO_PI)
+
+        # Long period periodics.
+        sinip = math.sin(self.inclo)
+        cosip = math.cos(self.inclo)
+        axnl = em * math.cos(argpm)
+        temp = 1.0 / (am * (1.0 - em * em))
+        aynl = em * math.sin(argpm) + temp * self.aycof
+        xl = xlm + temp * self.xlcof * axnl
+
+        # Solve Kepler's equation.
+        u = math.fmod(xl - nodem, TWO_PI)
+        eo1 = u
+        tem5 = 9999.9
+        ktr = 1
+        while abs(tem5) >= 1.0e-12 and ktr <= 10:
+            sineo1 = math.sin(eo1)
+            coseo1 = math.cos(eo1)
+            tem5 = 1.0 - coseo1 * axnl - sineo1 * aynl
+            tem5 = (u - aynl * coseo1 + axnl * sineo1 - eo1) / tem5
+            if abs(tem5) >= 0.95:
+                tem5 = 0.95 if tem5 > 0.0 else -0.95
+            eo1 = eo1 + tem5
+            ktr += 1
+
+        # Short period periodics.
+        ecose = axnl * coseo1 + aynl * sineo1
+        esine = axnl * sineo1 - aynl * coseo1
+        el2 = axnl * axnl + aynl * aynl
+        pl = am * (1.0 - el2)
+        if pl < 0.0:
+            raise ValueError("orbit has decayed")
+        rl = am * (1.0 - ecose)
+        betal = math.sqrt(1.0 - el2)
+        temp = esine / (1.0 + betal)
+        sinu = am / rl * (sineo1 - aynl - axnl * temp)
+        cosu = am / rl * (coseo1 - axnl + aynl * temp)
+        su = math.atan2(sinu, cosu)
+        sin2u = (cosu + cosu) * sinu
+        cos2u = 1.0 - 2.0 * sinu * sinu
+        temp = 1.0 / pl
+        temp1 = 0.5 * J2 * temp
+        temp2 = temp1 * temp
+
+        mrt = rl * (1.0 - 1.5 * temp2 * betal * self.con41) + 0.5 * temp1 * self.x1mth2 * cos2u
+        su = su - 0.25 * temp2 * self.x7thm1 * sin2u
+        xnode = nodem + 1.5 * temp2 * cosip * sin2u
+        xinc = self.inclo + 1.5 * temp2 * cosip * sinip * cos2u
+
+        # Orientation vectors, scaled to km.
+        sinsu = math.sin(su)
+        cossu = math.cos(su)
+        snod = math.sin(xnode)
+        cnod = math.cos(xnode)
+        sini = math.sin(xinc)
+        cosi = math.cos(xinc)
+        xmx = -snod * cosi
+        xmy = cnod * cosi
+        scale = mrt * EARTH_RADIUS_KM
+        return (
+            (xmx * sinsu + cnod * cossu) * scale,
+            (xmy * sinsu + snod * cossu) * scale,
+            sini * sinsu * scale,
+        )
+
+    # Latitude and longitude (degrees) of the point on the ground below the
+    # satellite at a time in seconds since 2000-01-01 UTC.
+    def subpoint(self, seconds):
+        x, y, z = self.propagate(self.minutes_since_epoch(seconds))
+        lon = math.degrees(math.atan2(y, x)) - sidereal_degrees(seconds)
+        lon = (lon + 540.0) % 360.0 - 180.0
+
+        # Geodetic latitude, a few iterations is plenty.
+        r = math.sqrt(x * x + y * y)
+        e2 = FLATTENING * (2.0 - FLATTENING)
+        lat = math.atan2(z, r)
+        for _ in range(3):
+            sin_lat = math.sin(lat)
+            c = 1.0 / math.sqrt(1.0 - e2 * sin_lat * sin_lat)
+            lat = math.atan2(z + EARTH_RADIUS_KM * c * e2 * sin_lat, r)
+
+        return math.degrees(lat), lon
+
+    # Age of the TLE in days at a time in seconds since 2000-01-01 UTC.
+    def age(self, seconds):
+        return self.minutes_since_epoch(seconds) / MINUTES_PER_DAY
+
+
+# Greenwich mean sidereal time in degrees.  The whole days and the fraction
+# of a day since J2000 are kept apart so that single precision floats
+# don't lose the fraction.
+def sidereal_degrees(seconds):
+    days, remainder = divmod(seconds - SECONDS_PER_DAY // 2, SECONDS_PER_DAY)
+    centuries = (days + remainder / SECONDS_PER_DAY) / 36525.0
+    gmst = (280.46061837 + 0.98564736629 * days + 360.98564736629 * remainder / SECONDS_PER_DAY +
+            0.000387933 * centuries * centuries)
+    return gmst % 360.0
+
+
+# Great circle distance in miles between two lat/lon points in degrees.
+def distance(lat1, lon1, lat2, lon2):
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    d_lat = lat2 - lat1
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# Reads a TLE from text with an optional name line, returns a Satellite or
+# None if no valid TLE was found.
+def parse(text):
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    for i in range(len(lines) - 1):
+        if lines[i].startswith("1 ") and lines[i + 1].startswith("2 "):
+            try:
+                return Satellite(lines[i], lines[i + 1])
+            except (ValueError, IndexError):
+                return None
+    return None
+
+
+def load(file):
+    try:
+        with open(file, "r") as f:
+            return parse(f.read())
+    except OSError:
+        return None
+
+
+def save(file, satellite):
+    with open(file, "w") as f:
+        f.write(f"{satellite.line1}\n{satellite.line2}\n")
@@ -1,22 +1,106 @@
-import uasyncio, usocket
+import uasyncio, usocket, time
 from . import logging
 
+# per client rate limiting, each client can send a burst of
+# _rate_limit_burst queries and then _rate_limit_per_second after that.
+# tokens are counted in thousandths to keep the arithmetic in small ints
+_rate_limit_per_second = 20
+_rate_limit_burst = 40
+_max_clients = 16
+_clients = {}
+
+def set_rate_limit(per_second, burst):
+  global _rate_limit_per_second, _rate_limit_burst
+  _rate_limit_per_second = per_second
+  _rate_limit_burst = burst
+
+# builds the answer record that follows the question in every reply to an
+# A query, it only depends on the ip address so is built once
+def _answer_for(ip_address):
+  answer = b"\xC0\x0C" # pointer to domain name at byte 12
+  answer += b"\x00\x01\x00\x01" # type and class (A record / IN class)
+  answer += b"\x00\x00\x00\x3C" # time to live 60 seconds
+  answer += b"\x00\x04" # response length (4 bytes = 1 ipv4 address)
+  answer += bytes(map(int, ip_address.split("."))) # ip address parts
+  return answer
+
+# returns True if the client is within its rate limit
+def _allow(client, now):
+  bucket = _clients.get(client)
+  if bucket is None:
+    if len(_clients) >= _max_clients:
+      _clients.pop(next(iter(_clients)))
+    bucket = [_rate_limit_burst * 1000, now]
+    _clients[client] = bucket
+
+  tokens = bucket[0] + time.ticks_diff(now, bucket[1]) * _rate_limit_per_second
+  bucket[0] = min(tokens, _rate_limit_burst * 1000)
+  bucket[1] = now
+  if bucket[0] < 1000:
+    return False
+  bucket[0] -= 1000
+  return True
+
+# builds the reply to a query in response, returning its length or 0 if
+# the packet shouldn't be answered. A queries get the catch all address,
+# other types (AAAA, HTTPS...) get an empty answer so that clients accept
+# there's no such record rather than retrying
+def _build_response(request, length, response, answer):
+  # only answer standard queries (qr = 0, opcode = 0) with one question
+  if length < 17 or request[2] & 0xF8 or request[4] or request[5] != 1:
+    return 0
+
+  # skip over the labels of the name in the question
+  position = 12
+  while position < length and request[position]:
+    if request[position] & 0xC0:
+      return 0
+    position += request[position] + 1
+  question_end = position + 5
+  if question_end > length:
+    return 0
+  query_type = (request[position + 1] << 8) | request[position + 2]
+  query_class = (request[position + 3] << 8) | request[position + 4]
+
+  # header and question, anything after the question (edns options etc.)
+  # isn't echoed back
+  response[0:question_end] = memoryview(request)[0:question_end]
+  response[2] = 0x84 | (request[2] & 0x01) # response, authoritative, copy recursion desired
+  response[3] = 0x80 # recursion available, no error
+  response[6] = response[7] = 0 # an count
+  response[8] = response[9] = 0 # ns count
+  response[10] = response[11] = 0 # ar count
+
+  if query_class == 1 and (query_type == 1 or query_type == 255):
+    response[7] = 1
+    response[question_end:question_end + len(answer)] = answer
+    return question_end + len(answer)
+  return question_end
+
+# answers one query received from client, returns True if a reply was sent
+def _reply(socket, request, length, client, response, answer):
+  if not _allow(client[0], time.ticks_ms()):
+    return False
+  size = _build_response(request, length, response, answer)
+  if size:
+    socket.sendto(memoryview(response)[:size], client)
+  return size != 0
+
 async def _handler(socket, ip_address):
+  answer = _answer_for(ip_address)
+  request = bytearray(512)
+  response = bytearray(512)
+  recvfrom_into = getattr(socket, "recvfrom_into", None)
+
   while True:
     try:
       yield uasyncio.core._io_queue.queue_read(socket)
-      request, client = socket.recvfrom(256)
-      response = request[:2] # request id
-      response += b"\x81\x80" # response flags
-      response += request[4:6] + request[4:6] # qd/an count
-      response += b"\x00\x00\x00\x00" # ns/ar count
-      response += request[12:] # origional request body
-      response += b"\xC0\x0C" # pointer to domain name at byte 12
-      response += b"\x00\x01\x00\x01" # type and class (A record / IN class)
-      response += b"\x00\x00\x00\x3C" # time to live 60 seconds
-      response += b"\x00\x04" # response length (4 bytes = 1 ipv4 address)
-      response += bytes(map(int, ip_address.split("."))) # ip address parts
-      socket.sendto(response, client)
+      if recvfrom_into:
+        length, client = recvfrom_into(request)
+        _reply(socket, request, length, client, response, answer)
+      else:
+        data, client = socket.recvfrom(512)
+        _reply(socket, data, len(data), client, response, answer)
     except Exception as e:
       logging.error(e)
 
@@ -29,4 +113,4 @@ def run_catchall(ip_address, port=53):
   _socket.bind(usocket.getaddrinfo(ip_address, port, 0, usocket.SOCK_DGRAM)[0][-1])
 
   loop = uasyncio.get_event_loop()
-  loop.create_task(_handler(_socket, ip_address))
\ No newline at end of file
+  loop.create_task(_handler(_socket, ip_address))
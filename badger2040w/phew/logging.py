@@ -1,4 +1,4 @@
-import machine, os, gc
+import machine, os, gc, _thread
 
 log_file = "log.txt"
 
@@ -11,11 +11,32 @@ LOG_ALL = LOG_INFO | LOG_WARNING | LOG_ERROR | LOG_DEBUG | LOG_EXCEPTION
 
 _logging_types = LOG_INFO | LOG_WARNING | LOG_ERROR | LOG_EXCEPTION
 
-# the log file will be truncated if it exceeds _log_truncate_at bytes in
-# size. the defaults values are designed to limit the log to at most
-# three blocks on the Pico
-_log_truncate_at = 11 * 1024
-_log_truncate_to =  8 * 1024
+# the log is split over _log_segment_count files: log.txt is written to
+# and log.txt.1, log.txt.2... hold older entries. once log.txt reaches
+# _log_segment_size bytes the oldest segment is deleted and the others
+# renamed, so no log data is ever copied. the default values are designed
+# to limit the log to at most three blocks on the Pico. a size of 0 turns
+# rotation off and lets log.txt grow
+_log_segment_count = 3
+_log_segment_size = 4 * 1024 - 256
+
+# entries are collected in a ring buffer in ram and written to flash in
+# batches - when the buffer fills, when the flush task's timer fires or
+# straight away for errors and exceptions. set _log_buffer_entries to 1
+# to write every entry as it is logged
+_log_buffer_entries = 16
+_log_flush_interval = 10
+_buffer = [None] * _log_buffer_entries
+_buffer_start = 0
+_buffer_count = 0
+_flush_task = None
+# the buffer is shared with anything logging or flushing from the other
+# core, e.g. a reset started with _thread
+_buffer_lock = _thread.allocate_lock()
+
+# size of the current segment, tracked as entries are written rather than
+# stat'ed each time (None until the file is first written to)
+_log_size = None
 
 def datetime_string():
   dt = machine.RTC().datetime()
@@ -27,11 +48,27 @@ def file_size(file):
   except OSError:
     return None
 
+# size 0 or less never rotates the log
+def set_segments(count, size):
+  global _log_segment_count, _log_segment_size
+  _log_segment_count = max(count, 1)
+  _log_segment_size = max(size, 0)
+
+# kept for compatibility, sizes the segments so that the log stays under
+# truncate_at bytes (and holds at least roughly truncate_to after rotating).
+# truncate_at 0 or less turns truncation off, as it always has
 def set_truncate_thresholds(truncate_at, truncate_to):
-  global _log_truncate_at
-  global _log_truncate_to
-  _log_truncate_at = truncate_at
-  _log_truncate_to = truncate_to
+  global _log_segment_size
+  _log_segment_size = max(truncate_at // _log_segment_count, 1) if truncate_at > 0 else 0
+
+def set_buffering(entries, flush_interval=None):
+  global _log_buffer_entries, _log_flush_interval, _buffer, _buffer_start
+  flush()
+  _log_buffer_entries = max(entries, 1)
+  _buffer = [None] * _log_buffer_entries
+  _buffer_start = 0
+  if flush_interval is not None:
+    _log_flush_interval = flush_interval
 
 def enable_logging_types(types):
   global _logging_types
@@ -41,54 +78,126 @@ def disable_logging_types(types):
   global _logging_types
   _logging_types = _logging_types & ~types
 
-# truncates the log file down to a target size while maintaining
-# clean line breaks
-def truncate(file, target_size):
-  # get the current size of the log file
-  size = file_size(file)
+def _segment_name(index):
+  return log_file if index == 0 else f"{log_file}.{index}"
 
-  # calculate how many bytes we're aiming to discard
-  discard = size - target_size
-  if discard <= 0:
+# starts a new segment, dropping the oldest one
+def rotate():
+  global _log_size
+  try:
+    os.remove(_segment_name(_log_segment_count - 1))
+  except OSError:
+    pass
+
+  for index in range(_log_segment_count - 2, -1, -1):
+    try:
+      os.rename(_segment_name(index), _segment_name(index + 1))
+    except OSError:
+      pass
+
+  _log_size = 0
+
+# returns up to the last count lines of the log, oldest first. segments
+# are read backwards a block at a time so only the blocks holding the
+# requested lines are loaded
+def tail(count):
+  flush()
+  lines = []
+  partial = b""
+
+  for index in range(_log_segment_count):
+    try:
+      f = open(_segment_name(index), "rb")
+    except OSError:
+      continue
+
+    with f:
+      position = f.seek(0, 2)
+      while position > 0 and len(lines) < count:
+        size = min(256, position)
+        position -= size
+        f.seek(position)
+        # the first line in the block may carry on in the previous block
+        parts = (f.read(size) + partial).split(b"\n")
+        partial = parts[0]
+        for line in reversed(parts[1:]):
+          if line:
+            lines.append(line)
+
+    # segments end on a line break, so whatever is left is a whole line
+    if partial:
+      lines.append(partial)
+      partial = b""
+    if len(lines) >= count:
+      break
+
+  return [str(line, "utf-8") for line in reversed(lines[:count])]
+
+# writes any buffered entries to the log file
+def flush():
+  with _buffer_lock:
+    _flush()
+
+def _flush():
+  global _buffer_start, _buffer_count, _log_size
+  if _buffer_count == 0:
     return
 
-  with open(file, "rb") as infile:
-    with open(file + ".tmp", "wb") as outfile:
-      # skip a bunch of the input file until we've discarded
-      # at least enough
-      while discard > 0:
-        chunk = infile.read(1024)
-        discard -= len(chunk)
-
-      # try to find a line break nearby to split first chunk on
-      break_position = max(
-        chunk.find (b"\n", -discard), # search forward
-        chunk.rfind(b"\n", -discard) # search backwards
-      )
-      if break_position != -1: # if we found a line break..
-        outfile.write(chunk[break_position + 1:])
-
-      # now copy the rest of the file
-      while True:
-        chunk = infile.read(1024)
-        if not chunk: 
-          break
-        outfile.write(chunk)
-
-  # delete the old file and replace with the new
-  os.remove(file)
-  os.rename(file + ".tmp", file)
+  if _log_size is None:
+    _log_size = file_size(log_file) or 0
 
+  logfile = None
+  try:
+    while _buffer_count:
+      entry = _buffer[_buffer_start]
+      _buffer[_buffer_start] = None
+      _buffer_start = (_buffer_start + 1) % len(_buffer)
+      _buffer_count -= 1
+
+      # sizes are in bytes, place names and ssids may not be ascii
+      entry_size = len(entry.encode())
+      # start a new segment if this entry would overflow the current one
+      if _log_segment_size and _log_size and _log_size + entry_size > _log_segment_size:
+        if logfile:
+          logfile.close()
+          logfile = None
+        rotate()
+
+      if logfile is None:
+        logfile = open(log_file, "a")
+      logfile.write(entry)
+      _log_size += entry_size
+  finally:
+    if logfile:
+      logfile.close()
+
+async def _flush_periodically():
+  import uasyncio
+  while True:
+    await uasyncio.sleep(_log_flush_interval)
+    flush()
+
+# starts a task on the event loop that flushes the buffer every
+# _log_flush_interval seconds
+def start_flush_task():
+  global _flush_task
+  if _flush_task is None:
+    import uasyncio
+    _flush_task = uasyncio.get_event_loop().create_task(_flush_periodically())
 
 def log(level, text):
+  global _buffer_count
   datetime = datetime_string()
   log_entry = "{0} [{1:8} /{2:>4}kB] {3}".format(datetime, level, round(gc.mem_free() / 1024), text)
   print(log_entry)
-  with open(log_file, "a") as logfile:
-    logfile.write(log_entry + '\n')
 
-  if _log_truncate_at and file_size(log_file) > _log_truncate_at:
-    truncate(log_file, _log_truncate_to)
+  with _buffer_lock:
+    _buffer[(_buffer_start + _buffer_count) % len(_buffer)] = log_entry + '\n'
+    _buffer_count += 1
+
+    # errors are written straight away in case they precede a crash
+    if _buffer_count == len(_buffer) or level == "error" or level == "exception":
+      _flush()
 
 def info(*items):
   if _logging_types & LOG_INFO:
@@ -1,10 +1,23 @@
 import uasyncio, os, time
 from . import logging
 
-_routes = []
+# routes without parameters are looked up directly by path, routes with
+# <name> parameters are stored in a trie keyed by path segment. both map
+# to a dict of method -> Route so a path with the wrong method can be
+# told apart from a path that doesn't exist
+_static_routes = {}
+_dynamic_routes = None
 catchall_handler = None
 loop = uasyncio.get_event_loop()
 
+# persistent connection limits. every open connection holds one of the
+# pico w's handful of lwip sockets, so once _max_connections are open any
+# new connection is served a single request and then closed
+_keep_alive_timeout = 5
+_keep_alive_max_requests = 20
+_max_connections = 4
+_connection_count = 0
+
 
 def file_exists(filename):
   try:
@@ -13,31 +26,61 @@ def file_exists(filename):
     return False
 
 
+_HEX_DIGITS = b"0123456789abcdefABCDEF"
+
+# bytes from the client as text. bytes that aren't utf-8 are each taken as
+# a character instead so that a stray byte can't fail the whole request
+def _decode_text(data):
+  try:
+    return str(data, "utf-8")
+  except UnicodeError:
+    return "".join(chr(c) for c in data)
+
 def urldecode(text):
-  text = text.replace("+", " ")
-  result = ""
+  if isinstance(text, str):
+    text = text.encode("utf-8")
+  text = text.replace(b"+", b" ")
+  # decoded text is never longer than the encoded text
+  result = bytearray(len(text))
+  view = memoryview(text)
+  length = 0
   token_caret = 0
-  # decode any % encoded characters
+  # decode any % encoded characters in a single pass, collecting bytes so
+  # that multi-byte utf-8 sequences decode correctly
   while True:
-    start = text.find("%", token_caret)
+    start = text.find(b"%", token_caret)
     if start == -1:
-      result += text[token_caret:]
+      start = len(text)
+    result[length:length + start - token_caret] = view[token_caret:start]
+    length += start - token_caret
+    if start == len(text):
       break
-    result += text[token_caret:start]
-    code = int(text[start + 1:start + 3], 16)
-    result += chr(code)
-    token_caret = start + 3
-  return result
+    # slices rather than indexes, micropython's bytes only tests membership
+    # of other bytes, not ints
+    if start + 2 < len(text) and text[start + 1:start + 2] in _HEX_DIGITS and text[start + 2:start + 3] in _HEX_DIGITS:
+      result[length] = int(text[start + 1:start + 3], 16)
+      token_caret = start + 3
+    else:
+      # not an escape after all (or cut short), keep the % as is
+      result[length] = 0x25
+      token_caret = start + 1
+    length += 1
+  return _decode_text(memoryview(result)[:length])
 
 def _parse_query_string(query_string):
   result = {}
   for parameter in query_string.split("&"):
-    key, value = parameter.split("=", 1)
-    key = urldecode(key)
-    value = urldecode(value)
-    result[key] = value
+    if parameter:
+      _add_parameter(result, parameter)
   return result
 
+def _add_parameter(result, parameter):
+  separator = parameter.find("=" if isinstance(parameter, str) else b"=")
+  if separator == -1:
+    result[urldecode(parameter)] = ""
+  else:
+    result[urldecode(parameter[:separator])] = urldecode(parameter[separator + 1:])
+
 
 class Request:
   def __init__(self, method, uri, protocol):
@@ -47,6 +90,7 @@ class Request:
     self.form = {}
     self.data = {}
     self.query = {}
+    self.path_parts = None
     query_string_start = uri.find("?") if uri.find("?") != -1 else len(uri)
     self.path = uri[:query_string_start]
     self.query_string = uri[query_string_start + 1:]
@@ -62,9 +106,9 @@ data: {self.data}"""
 
 
 class Response:
-  def __init__(self, body, status=200, headers={}):
+  def __init__(self, body, status=200, headers=None):
     self.status = status
-    self.headers = headers
+    self.headers = headers if headers is not None else {}
     self.body = body
 
   def add_header(self, name, value):
@@ -90,24 +134,83 @@ content_type_map = {
 }
 
 
+# etag and any precompressed .gz sibling of each file served, keyed on the
+# file's (mtime, size) so that a changed file gets a new etag and its .gz
+# is looked for again
+_static_cache = {}
+
+
+def clear_static_cache():
+  _static_cache.clear()
+
+
+# returns (size, etag, gzip file, gzip size) for a file or None if the
+# file doesn't exist
+def _static_info(file):
+  try:
+    stat = os.stat(file)
+  except OSError:
+    return None
+  if stat[0] & 0x4000:
+    return None
+
+  signature = (stat[8], stat[6])
+  info = _static_cache.get(file)
+  if info is None or info[0] != signature:
+    gzip_file = file + ".gz"
+    try:
+      gzip_size = os.stat(gzip_file)[6]
+    except OSError:
+      gzip_file = None
+      gzip_size = 0
+
+    # weak etag as the gzipped and plain copies share it
+    info = (signature, stat[6], f"W/\"{stat[6]:x}-{stat[8]:x}\"", gzip_file, gzip_size)
+    _static_cache[file] = info
+  return info[1:]
+
+
 class FileResponse(Response):
-  def __init__(self, file, status=200, headers={}):
+  def __init__(self, file, status=200, headers=None):
     self.status = 404
-    self.headers = headers
+    self.headers = headers = headers if headers is not None else {}
+    self.body = b""
     self.file = file
+    self.gzip_file = None
 
-    try:
-      if (os.stat(self.file)[0] & 0x4000) == 0:
-        self.status = 200
+    info = _static_info(file)
+    if info:
+      size, etag, self.gzip_file, self.gzip_size = info
+      self.status = 200
 
-        # auto set content type
-        extension = self.file.split(".")[-1].lower()
-        if extension in content_type_map:
-          headers["Content-Type"] = content_type_map[extension]
+      # auto set content type
+      extension = self.file.split(".")[-1].lower()
+      if extension in content_type_map:
+        headers["Content-Type"] = content_type_map[extension]
 
-        headers["Content-Length"] = os.stat(self.file)[6]
-    except OSError:
-      return False
+      headers["Content-Length"] = size
+      headers["ETag"] = etag
+      headers["Cache-Control"] = "no-cache"
+
+  # answers conditional requests with 304 and switches to the gzipped copy
+  # of the file if there is one and the client accepts it
+  def negotiate(self, request):
+    if self.status != 200:
+      return
+
+    # the 304 needs vary too, caches key what it confirms on it
+    if self.gzip_file:
+      self.headers["Vary"] = "Accept-Encoding"
+
+    if request.headers.get("if-none-match") == self.headers["ETag"]:
+      self.status = 304
+      del self.headers["Content-Length"]
+      return
+
+    if self.gzip_file and "gzip" in request.headers.get("accept-encoding", ""):
+      self.file = self.gzip_file
+      self.headers["Content-Encoding"] = "gzip"
+      self.headers["Content-Length"] = self.gzip_size
 
 
 class Route:
@@ -116,27 +219,19 @@ class Route:
     self.methods = methods
     self.handler = handler
     self.path_parts = path.split("/")
-
-  # returns True if the supplied request matches this route
-  def matches(self, request):
-    if request.method not in self.methods:
-      return False
-    compare_parts = request.path.split("/")
-    if len(compare_parts) != len(self.path_parts):
-      return False
-    for part, compare in zip(self.path_parts, compare_parts):
-      if not part.startswith("<") and part != compare:
-        return False
-    return True
+    self.is_static = not any(part.startswith("<") for part in self.path_parts)
 
   # call the route handler passing any named parameters in the path
   def call_handler(self, request):
+    if self.is_static:
+      return self.handler(request)
+
+    if request.path_parts is None:
+      request.path_parts = request.path.split("/")
     parameters = {}
-    for part, compare in zip(self.path_parts, request.path.split("/")):
+    for part, compare in zip(self.path_parts, request.path_parts):
       if part.startswith("<"):
-        name = part[1:-1]
-        parameters[name] = compare
-
+        parameters[part[1:-1]] = compare
     return self.handler(request, **parameters)
         
   def __str__(self):
@@ -149,6 +244,15 @@ methods: {self.methods}
     return f"<Route object {self.path} ({', '.join(self.methods)})>"
 
 
+# a node in the parameterised route trie, literal segments are matched
+# before a <name> parameter segment
+class _RouteNode:
+  def __init__(self):
+    self.children = {}
+    self.parameter_node = None
+    self.routes = None
+
+
 # parses the headers for a http request (or the headers attached to
 # each field in a multipart/form-data)
 async def _parse_headers(reader):
@@ -162,52 +266,236 @@ async def _parse_headers(reader):
   return headers
 
 
-# returns the route matching the supplied path or None
+# walks the route trie for the remaining path segments, backtracking to
+# parameter segments when the literal segments lead nowhere
+def _match_node(node, parts, index):
+  if index == len(parts):
+    return node.routes
+
+  child = node.children.get(parts[index])
+  if child:
+    routes = _match_node(child, parts, index + 1)
+    if routes:
+      return routes
+
+  if node.parameter_node:
+    return _match_node(node.parameter_node, parts, index + 1)
+
+  return None
+
+
+# returns the route matching the request (or None) and the routes that are
+# registered for the request path under any method
 def _match_route(request):
-  for route in _routes:
-    if route.matches(request):
-      return route
+  routes = _static_routes.get(request.path)
+
+  if (not routes or request.method not in routes) and _dynamic_routes is not None:
+    # split the path once, the route handler reuses the parts
+    if request.path_parts is None:
+      request.path_parts = request.path.split("/")
+    dynamic_routes = _match_node(_dynamic_routes, request.path_parts, 0)
+    if dynamic_routes and (not routes or request.method in dynamic_routes):
+      routes = dynamic_routes
+
+  if not routes:
+    return None, None
+  return routes.get(request.method), routes
+
+
+# limits on request bodies, anything larger or with more form fields is
+# rejected with 413 so a misbehaving client can't exhaust the heap
+_max_body_size = 4 * 1024
+_max_form_fields = 16
+_body_window_size = 512
+
+
+def set_body_limits(max_size=None, max_fields=None):
+  global _max_body_size, _max_form_fields
+  if max_size is not None:
+    _max_body_size = max_size
+  if max_fields is not None:
+    _max_form_fields = max_fields
+
+
+class _BodyTooLarge(Exception):
+  pass
+
+
+# bytearray has no find() on micropython, so search a bytes copy of the
+# window slice instead (bounded by the window size)
+def _find(window, needle, start, end):
+  index = bytes(memoryview(window)[start:end]).find(needle)
+  return index if index == -1 else index + start
+
+
+# reads a request body incrementally through a fixed size window so that
+# memory use doesn't depend on what the client sends
+class _BodyReader:
+  def __init__(self, reader, length, prefix=b""):
+    if length > _max_body_size:
+      raise _BodyTooLarge()
+    self.reader = reader
+    self.remaining = length
+    self.window = bytearray(_body_window_size)
+    self.view = memoryview(self.window)
+    self.start = 0
+    self.end = len(prefix)
+    self.window[0:self.end] = prefix
+
+  # moves unread data to the front of the window and reads more after it,
+  # returns False if there is nothing more to read
+  async def _fill(self):
+    if self.remaining == 0:
+      return False
+    if self.start:
+      count = self.end - self.start
+      self.view[0:count] = self.view[self.start:self.end]
+      self.start, self.end = 0, count
+    space = len(self.window) - self.end
+    if space == 0:
+      return False
+    chunk = await self.reader.read(min(space, self.remaining))
+    if not chunk:
+      # client went away before sending the whole body
+      self.remaining = 0
+      return False
+    self.window[self.end:self.end + len(chunk)] = chunk
+    self.end += len(chunk)
+    self.remaining -= len(chunk)
+    return True
+
+  # consumes the body up to and including the delimiter, appending what
+  # came before it to sink (if supplied). returns False if the body ended
+  # without the delimiter
+  async def read_until(self, delimiter, sink=None):
+    while True:
+      index = _find(self.window, delimiter, self.start, self.end)
+      if index != -1:
+        if sink is not None:
+          sink.extend(self.view[self.start:index])
+        self.start = index + len(delimiter)
+        return True
+
+      # keep enough of the tail that a delimiter split across reads
+      # is still found
+      keep = min(len(delimiter) - 1, self.end - self.start)
+      if sink is not None:
+        sink.extend(self.view[self.start:self.end - keep])
+      self.start = self.end - keep
+
+      if not await self._fill():
+        if sink is not None:
+          sink.extend(self.view[self.start:self.end])
+        self.start = self.end
+        return False
+
+  # returns the next count bytes of the body (count must fit the window)
+  async def read(self, count):
+    while self.end - self.start < count:
+      if not await self._fill():
+        break
+    data = bytes(self.view[self.start:min(self.start + count, self.end)])
+    self.start += len(data)
+    return data
+
+  # throws away the rest of the body
+  async def discard(self):
+    self.start = self.end = 0
+    while await self._fill():
+      self.start = self.end = 0
+
+
+# parses the name out of a multipart content-disposition header
+def _disposition_name(header):
+  for parameter in header.split(b";"):
+    parameter = parameter.strip()
+    if parameter.startswith(b"name="):
+      return str(parameter[5:].strip(b"\""), "utf-8")
   return None
 
 
 # if the content type is multipart/form-data then parse the fields
-async def _parse_form_data(reader, headers):
-  boundary = headers["content-type"].split("boundary=")[1]
-  # discard first boundary line
-  dummy = await reader.readline()
+async def _parse_form_data(body, headers):
+  boundary = headers["content-type"].split("boundary=")[1].split(";")[0].strip("\"")
+  delimiter = b"\r\n--" + boundary.encode("utf-8")
 
   form = {}
+  # skip the preamble, the first delimiter isn't preceded by a crlf
+  # but the window was primed with one
+  if not await body.read_until(delimiter):
+    return form
+
   while True:
-    # get the field name
-    field_headers = await _parse_headers(reader)
-    if len(field_headers) == 0:
+    # "--" after a delimiter marks the end of the form
+    if await body.read(2) != b"\r\n":
       break
-    name = field_headers["content-disposition"].split("name=\"")[1][:-1]
-    # get the field value
-    value = ""
-    while True:
-      line = await reader.readline()
-      line = line.decode().strip()
-      # if we hit a boundary then save the value and move to next field
-      if line == "--" + boundary:
-        form[name] = value
-        break
-      # if we hit end of form data boundary then save value and return
-      if line == "--" + boundary + "--":
-        form[name] = value
-        return form
-      value += line
-  return None
+
+    part_headers = bytearray()
+    if not await body.read_until(b"\r\n\r\n", part_headers):
+      break
+    if len(part_headers) > _body_window_size:
+      raise _BodyTooLarge()
+
+    value = bytearray()
+    found = await body.read_until(delimiter, value)
+
+    name = None
+    for line in bytes(part_headers).split(b"\r\n"):
+      if line.lower().startswith(b"content-disposition:"):
+        name = _disposition_name(line)
+    if name is not None:
+      if name not in form and len(form) >= _max_form_fields:
+        raise _BodyTooLarge()
+      form[name] = _decode_text(value)
+
+    if not found:
+      break
+
+  await body.discard()
+  return form
+
+
+# if the content type is application/x-www-form-urlencoded then parse the
+# fields one at a time as they arrive
+async def _parse_urlencoded_body(body):
+  form = {}
+  while True:
+    parameter = bytearray()
+    found = await body.read_until(b"&", parameter)
+    if parameter:
+      if len(form) >= _max_form_fields:
+        raise _BodyTooLarge()
+      _add_parameter(form, bytes(parameter))
+    if not found:
+      return form
 
 
 # if the content type is application/json then parse the body
 async def _parse_json_body(reader, headers):
   import json
   content_length_bytes = int(headers["content-length"])
+  if content_length_bytes > _max_body_size:
+    raise _BodyTooLarge()
   body = await reader.readexactly(content_length_bytes)
   return json.loads(body.decode())
 
 
+# parses the request body into request.form or request.data depending on
+# its content type, any other body is discarded
+async def _parse_body(request, reader, content_length):
+  content_type = request.headers.get("content-type", "")
+  if content_type.startswith("application/json"):
+    request.data = await _parse_json_body(reader, request.headers)
+  elif content_type.startswith("multipart/form-data"):
+    body = _BodyReader(reader, content_length, b"\r\n")
+    request.form = await _parse_form_data(body, request.headers)
+  elif content_type.startswith("application/x-www-form-urlencoded"):
+    request.form = await _parse_urlencoded_body(_BodyReader(reader, content_length))
+  else:
+    # not something we parse, but don't let a huge body tie up the server
+    await _BodyReader(reader, content_length).discard()
+
+
 status_message_map = {
   200: "OK", 201: "Created", 202: "Accepted", 
   203: "Non-Authoritative Information", 204: "No Content",
@@ -218,41 +506,172 @@ status_message_map = {
   400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
   404: "Not Found", 405: "Method Not Allowed", 406: "Not Acceptable",
   408: "Request Timeout", 409: "Conflict", 410: "Gone",
-  414: "URI Too Long", 415: "Unsupported Media Type", 
+  413: "Payload Too Large", 414: "URI Too Long", 415: "Unsupported Media Type", 
   416: "Range Not Satisfiable", 418: "I'm a teapot",
   500: "Internal Server Error", 501: "Not Implemented"
 }
 
 
-# handle an incoming request to the web server
-async def _handle_request(reader, writer):
+# response output buffers, allocated once and reused for every response to
+# keep heap churn (and gc pauses) down. a buffer is always handed to
+# writer.write() before the next await so concurrent responses can't
+# interleave their contents
+_head_buffer = bytearray(256)
+_file_buffer = bytearray(1024)
+_flush_threshold = 512
+_body_buffer = bytearray(_flush_threshold)
+_status_lines = {}
+
+
+# sets how many bytes of generator output are collected before being
+# written to the client
+def set_flush_threshold(threshold):
+  global _flush_threshold, _body_buffer
+  _flush_threshold = threshold
+  _body_buffer = bytearray(threshold)
+
+
+# copies data into the buffer at position, growing the buffer if needed,
+# and returns the new position
+def _append(buffer, position, data):
+  end = position + len(data)
+  buffer[position:end] = data
+  return end
+
+
+# writes the status line, headers and optionally a short body in one go
+def _write_head(writer, status, status_message, headers, body=None):
+  status_line = _status_lines.get(status)
+  if status_line is None:
+    status_line = f"HTTP/1.1 {status} {status_message}\r\n".encode("ascii")
+    _status_lines[status] = status_line
+
+  buffer = _head_buffer
+  position = _append(buffer, 0, status_line)
+  for key, value in headers.items():
+    position = _append(buffer, position, key.encode("ascii"))
+    position = _append(buffer, position, b": ")
+    position = _append(buffer, position, str(value).encode("ascii"))
+    position = _append(buffer, position, b"\r\n")
+
+  # blank line to denote end of headers
+  position = _append(buffer, position, b"\r\n")
+  if body:
+    position = _append(buffer, position, body)
+
+  writer.write(memoryview(buffer)[:position])
+
+
+# streams a file to the client through the reusable file buffer
+async def _write_file(writer, f):
+  view = memoryview(_file_buffer)
+  while True:
+    count = f.readinto(view)
+    if not count:
+      break
+    writer.write(view[:count])
+    await writer.drain()
+
+
+# writes out a block of generator output, framed as a chunk if needed
+async def _write_block(writer, data, chunked):
+  if chunked:
+    writer.write(f"{len(data):x}\r\n".encode("ascii"))
+    writer.write(data)
+    writer.write(b"\r\n")
+  else:
+    writer.write(data)
+  await writer.drain()
+
+
+# writes the output of a generator, coalescing small chunks into blocks of
+# up to _flush_threshold bytes before each drain
+async def _write_generator(writer, body, chunked):
+  buffer = _body_buffer
+  view = memoryview(buffer)
+  pending = 0
+
+  for chunk in body:
+    if isinstance(chunk, str):
+      chunk = chunk.encode("utf-8")
+    if not chunk:
+      continue
+
+    if pending + len(chunk) > len(buffer):
+      if pending:
+        await _write_block(writer, view[:pending], chunked)
+        pending = 0
+      # chunks that won't fit in the buffer are written as they are
+      if len(chunk) >= len(buffer):
+        await _write_block(writer, chunk, chunked)
+        continue
+
+    buffer[pending:pending + len(chunk)] = chunk
+    pending += len(chunk)
+
+  if pending:
+    await _write_block(writer, view[:pending], chunked)
+
+  if chunked:
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+# handle a single request on the connection, returns True if the
+# connection can be kept open for another request
+async def _handle_one_request(reader, writer, persist, idle_timeout):
   response = None
 
+  if idle_timeout is None:
+    request_line = await reader.readline()
+  else:
+    # waiting for the next request on a persistent connection, give up if
+    # the client stays idle
+    request_line = await uasyncio.wait_for(reader.readline(), idle_timeout)
   request_start_time = time.ticks_ms()
+  if not request_line:
+    return False
 
-  request_line = await reader.readline()
   try:
     method, uri, protocol = request_line.decode().split()
   except Exception as e:
     logging.error(e)
-    return
+    return False
 
   request = Request(method, uri, protocol)
   request.headers = await _parse_headers(reader)
-  if "content-length" in request.headers and "content-type" in request.headers:
-    if request.headers["content-type"].startswith("multipart/form-data"):
-      request.form = await _parse_form_data(reader, request.headers)
-    if request.headers["content-type"].startswith("application/json"):
-      request.data = await _parse_json_body(reader, request.headers)
-    if request.headers["content-type"].startswith("application/x-www-form-urlencoded"):
-      form_data = await reader.read(int(request.headers["content-length"]))
-      request.form = _parse_query_string(form_data.decode()) 
-
-  route = _match_route(request)
-  if route:
-    response = route.call_handler(request)
-  elif catchall_handler:
-    response = catchall_handler(request)
+
+  # http/1.1 connections persist unless the client asks otherwise, older
+  # clients have to ask for it
+  connection = request.headers.get("connection", "").lower()
+  if protocol == "HTTP/1.1":
+    keep_alive = persist and connection != "close"
+  else:
+    keep_alive = persist and connection == "keep-alive"
+
+  content_length = int(request.headers.get("content-length", 0))
+  if content_length:
+    try:
+      await _parse_body(request, reader, content_length)
+    except _BodyTooLarge:
+      # the rest of the body is left unread so the connection can't be reused
+      response = ("Payload too large.", 413, "text/plain")
+      keep_alive = False
+
+  if response is None:
+    route, routes = _match_route(request)
+    if route:
+      response = route.call_handler(request)
+    elif catchall_handler:
+      # the catchall gets anything without a handler, including other
+      # methods on a known path (e.g. redirecting to a captive portal)
+      response = catchall_handler(request)
+    elif routes:
+      response = Response("Method not allowed.", 405, {
+        "Content-Type": "text/plain", "Allow": ", ".join(routes)
+      })
+    else:
+      response = ("Not found.", 404, "text/plain")
 
   # if shorthand body generator only notation used then convert to tuple
   if type(response).__name__ == "generator":
@@ -269,52 +688,128 @@ async def _handle_request(reader, writer):
     content_type = response[2] if len(response) >= 3 else "text/html"
     response = Response(body, status=status)
     response.add_header("Content-Type", content_type)
-    if hasattr(body, '__len__'):
-      response.add_header("Content-Length", len(body))
+
+  if isinstance(response.body, str):
+    response.body = response.body.encode("utf-8")
+
+  # a persistent connection needs every body to be delimited, generators
+  # of unknown length are sent chunked (http/1.1 only)
+  chunked = False
+  if isinstance(response, FileResponse):
+    response.negotiate(request)
+    if response.status not in (200, 304):
+      response.headers["Content-Length"] = 0
+  elif type(response.body).__name__ == "generator":
+    if keep_alive and protocol == "HTTP/1.1":
+      chunked = True
+      response.headers["Transfer-Encoding"] = "chunked"
+    else:
+      keep_alive = False
+  elif "Content-Length" not in response.headers:
+    response.headers["Content-Length"] = len(response.body)
+
+  if keep_alive:
+    response.headers["Connection"] = "keep-alive"
+    response.headers["Keep-Alive"] = f"timeout={_keep_alive_timeout}"
+  else:
+    response.headers["Connection"] = "close"
   
-  # write status line
   status_message = status_message_map.get(response.status, "Unknown")
-  writer.write(f"HTTP/1.1 {response.status} {status_message}\r\n".encode("ascii"))
 
-  # write headers
-  for key, value in response.headers.items():
-    writer.write(f"{key}: {value}\r\n".encode("ascii"))
+  # small string/bytes bodies go out in the same write as the headers
+  body = response.body
+  inline_body = isinstance(body, (bytes, bytearray)) and len(body) <= _flush_threshold
+  _write_head(writer, response.status, status_message, response.headers, body if inline_body else None)
 
-  # blank line to denote end of headers
-  writer.write("\r\n".encode("ascii"))
- 
   if isinstance(response, FileResponse):
     # file
-    with open(response.file, "rb") as f:
-      while True:
-        chunk = f.read(1024)
-        if not chunk:
-          break
-        writer.write(chunk)
-        await writer.drain()
-  elif type(response.body).__name__ == "generator":
-    # generator
-    for chunk in response.body:
-      writer.write(chunk)
+    if response.status == 200:
+      with open(response.file, "rb") as f:
+        await _write_file(writer, f)
+    else:
       await writer.drain()
-  else:
+  elif type(body).__name__ == "generator":
+    # generator
+    await _write_generator(writer, body, chunked)
+  elif not inline_body:
     # string/bytes
-    writer.write(response.body)
+    writer.write(body)
     await writer.drain()
-  
-  writer.close()
-  await writer.wait_closed()
-  
+  else:
+    await writer.drain()
+
   processing_time = time.ticks_ms() - request_start_time
   logging.info(f"> {request.method} {request.path} ({response.status} {status_message}) [{processing_time}ms]")
 
+  return keep_alive
+
+
+# handle an incoming connection to the web server, serving requests on it
+# until the client closes it, it goes idle or reaches the request limit
+async def _handle_request(reader, writer):
+  global _connection_count
+  _connection_count += 1
+
+  try:
+    persist = _connection_count <= _max_connections
+    requests_left = _keep_alive_max_requests
+    idle_timeout = None
+    keep_alive = True
+    while keep_alive:
+      requests_left -= 1
+      keep_alive = await _handle_one_request(reader, writer, persist and requests_left > 0, idle_timeout)
+      idle_timeout = _keep_alive_timeout
+  except uasyncio.TimeoutError:
+    pass
+  except Exception as e:
+    logging.error(e)
+  finally:
+    _connection_count -= 1
+
+  writer.close()
+  await writer.wait_closed()
+
 
 # adds a new route to the routing table
 def add_route(path, handler, methods=["GET"]):
-  global _routes
-  _routes.append(Route(path, handler, methods))
-  # descending complexity order so most complex routes matched first
-  _routes = sorted(_routes, key=lambda route: len(route.path_parts), reverse=True)
+  global _dynamic_routes
+  route = Route(path, handler, methods)
+
+  if route.is_static:
+    routes = _static_routes.setdefault(path, {})
+  else:
+    if _dynamic_routes is None:
+      _dynamic_routes = _RouteNode()
+    node = _dynamic_routes
+    for part in route.path_parts:
+      if part.startswith("<"):
+        if node.parameter_node is None:
+          node.parameter_node = _RouteNode()
+        node = node.parameter_node
+      else:
+        if part not in node.children:
+          node.children[part] = _RouteNode()
+        node = node.children[part]
+    if node.routes is None:
+      node.routes = {}
+    routes = node.routes
+
+  # the first route added for a path and method takes precedence
+  for method in methods:
+    if method not in routes:
+      routes[method] = route
+
+
+# sets the idle timeout (seconds) and request cap for persistent
+# connections and how many connections may be open at once
+def set_keep_alive(timeout=None, max_requests=None, max_connections=None):
+  global _keep_alive_timeout, _keep_alive_max_requests, _max_connections
+  if timeout is not None:
+    _keep_alive_timeout = timeout
+  if max_requests is not None:
+    _keep_alive_max_requests = max_requests
+  if max_connections is not None:
+    _max_connections = max_connections
 
 
 def set_callback(handler):
@@ -346,9 +841,16 @@ def serve_file(file):
   return FileResponse(file)
 
 
-def run(host = "0.0.0.0", port = 80):
+# starts the web server on the event loop without running the loop, for
+# programs that have their own tasks and run it themselves
+def start(host = "0.0.0.0", port = 80):
   logging.info("> starting web server on port {}".format(port))
   loop.create_task(uasyncio.start_server(_handle_request, host, port))
+
+
+def run(host = "0.0.0.0", port = 80):
+  start(host, port)
+  logging.start_flush_task()
   loop.run_forever()
 
 def stop():
@@ -1,65 +1,133 @@
+import os
 from . import logging
 
-async def render_template(template, **kwargs):
+# compiled templates are cached keyed by path, each entry remembers the
+# mtime and size of the file it was built from so that edited templates
+# are recompiled. once the cache holds more than _cache_budget bytes of
+# template the least recently used entries are evicted
+_cache = {}
+_cache_order = []
+_cache_size = 0
+_cache_budget = 32 * 1024
+
+def set_cache_budget(budget):
+  global _cache_budget
+  _cache_budget = budget
+  _evict()
+
+def clear_cache():
+  global _cache_size
+  _cache.clear()
+  _cache_order.clear()
+  _cache_size = 0
+
+def _evict():
+  global _cache_size
+  # always keep the most recently used entry even if it alone is over budget
+  while _cache_size > _cache_budget and len(_cache_order) > 1:
+    path = _cache_order.pop(0)
+    _cache_size -= _cache.pop(path)[2]
+
+# splits the template into a list of literal byte chunks and (expression,
+# code) tuples so that rendering never has to search the file again
+def _compile(template, data):
+  parts = []
+  token_caret = 0
+
+  while True:
+    # find the next tag that needs evaluating
+    start = data.find(b"{{", token_caret)
+    end = data.find(b"}}", start)
+
+    # no more tags, the rest of the file is literal
+    if start == -1 or end == -1:
+      if token_caret < len(data):
+        parts.append(data[token_caret:])
+      break
+
+    if start > token_caret:
+      parts.append(data[token_caret:start])
+
+    expression = data[start + 2:end].strip().decode("utf-8")
+    try:
+      code = compile(expression, template, "eval")
+    except NameError:
+      # port built without compile(), fall back to evaluating the source
+      code = expression
+    except SyntaxError:
+      # an expression that can't be parsed would never render anything
+      code = None
+
+    if code is not None:
+      parts.append((expression, code))
+
+    token_caret = end + 2
+
+  return parts
+
+# returns the compiled parts for a template, compiling and caching it if
+# it isn't cached or the file has changed since it was compiled
+def _load(template):
+  global _cache_size
+
+  stat = os.stat(template)
+  signature = (stat[8], stat[6])
+
+  entry = _cache.get(template)
+  if entry and entry[0] == signature:
+    if _cache_order[-1] != template:
+      _cache_order.remove(template)
+      _cache_order.append(template)
+    return entry[1]
+
+  with open(template, "rb") as f:
+    parts = _compile(template, f.read())
+
+  if entry:
+    _cache_order.remove(template)
+    _cache_size -= entry[2]
+
+  _cache[template] = (signature, parts, stat[6])
+  _cache_order.append(template)
+  _cache_size += stat[6]
+  _evict()
+
+  return parts
+
+def _escape(text):
+  text = text.replace("&", "&amp;")
+  text = text.replace('"', "&quot;")
+  text = text.replace("'", "&apos;")
+  text = text.replace(">", "&gt;")
+  return text.replace("<", "&lt;")
+
+def render_template(template, **kwargs):
   import time
   start_time = time.ticks_ms()
 
-  with open(template, "rb") as f:
-    # read the whole template file, we could work on single lines but
-    # the performance is much worse - so long as our templates are
-    # just a handful of kB it's ok to do this
-    data = f.read()
-    token_caret = 0
-
-    while True:
-      # find the next tag that needs evaluating
-      start = data.find(b"{{", token_caret)
-      end = data.find(b"}}", start)
-
-      match = start != -1 and end != -1
-
-      # no more magic to handle, just return what's left
-      if not match:
-        yield data[token_caret:]
-        break
-
-      expression = data[start + 2:end].strip()
-
-      # output the bit before the tag
-      yield data[token_caret:start]
-
-      # merge locals with the supplied named arguments and
-      # the response object
-      params = {}
-      params.update(locals())
-      params.update(kwargs)
-      #params["response"] = response
-
-      # parse the expression
-      try:
-        if expression.decode("utf-8") in params:
-          result = params[expression.decode("utf-8")]
-          result = result.replace("&", "&amp;")
-          result = result.replace('"', "&quot;")
-          result = result.replace("'", "&apos;")
-          result = result.replace(">", "&gt;")
-          result = result.replace("<", "&lt;")
-        else:
-          result = eval(expression, globals(), params)
-
-        if type(result).__name__ == "generator":
-          # if expression returned a generator then iterate it fully
-          # and yield each result
-          for chunk in result:
-            yield chunk
-        else:
-          # yield the result of the expression
-          if result is not None:
-            yield str(result)
-      except:
-        pass
-
-      # discard the parsed bit
-      token_caret = end + 2
-
-  logging.debug("> parsed template:", template, "(took", time.ticks_ms() - start_time, "ms)")
\ No newline at end of file
+  for part in _load(template):
+    # literal chunks are output as is
+    if isinstance(part, bytes):
+      yield part
+      continue
+
+    expression, code = part
+    try:
+      if expression in kwargs:
+        result = _escape(str(kwargs[expression]))
+      else:
+        result = eval(code, globals(), kwargs)
+
+      if type(result).__name__ == "generator":
+        # if expression returned a generator then iterate it fully
+        # and yield each result
+        for chunk in result:
+          yield chunk
+      else:
+        # yield the result of the expression
+        if result is not None:
+          yield str(result)
+    except:
+      pass
+
+  logging.debug("> rendered template:", template, "(took", time.ticks_ms() - start_time, "ms)")
@@ -0,0 +1,129 @@
+# Converts latitude and longitude to pixel positions on a map image.  The
+# pixel for every step of latitude and longitude is worked out once, into
+# lookup tables, so projecting a point is two table lookups rather than
+# floating point arithmetic.
+#
+# Projections where x only depends on longitude and y only on latitude
+# (like the equirectangular world map) subclass Projection and provide
+# longitude_to_x() and latitude_to_y().  Others can override project().
+import math
+from array import array
+
+# Lookup table entries per degree when the pixel edges don't fall on a
+# regular grid (Mercator's latitudes), or the grid they do fall on would
+# be finer than MAX_STEPS_PER_DEGREE.  Points within half a step of a pixel
+# edge can then be a pixel out.
+STEPS_PER_DEGREE = 8
+MAX_STEPS_PER_DEGREE = 64
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+# The fewest table entries per degree that put every pixel edge of a
+# linear scale of pixels over degrees on the boundary between two entries,
+# so that looking a point up gives the same pixel as working it out.
+def exact_steps(pixels, degrees):
+    # Pixel edges are at (2k + 1) * degrees / (2 * pixels) degrees.
+    steps = 2 * pixels // _gcd(2 * pixels, degrees)
+    return steps if steps <= MAX_STEPS_PER_DEGREE else STEPS_PER_DEGREE
+
+
+class Projection:
+    def __init__(self, left, top, width, height, lon_steps=STEPS_PER_DEGREE, lat_steps=STEPS_PER_DEGREE):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.lon_steps = lon_steps
+        self.lat_steps = lat_steps
+
+        # Entry n is the pixel, from the map's left or top edge, for the
+        # middle of the nth step from 180 degrees west or 90 degrees south.
+        # The middle is never on a pixel edge, so round() ties don't matter.
+        typecode = "B" if width < 256 and height < 256 else "h"
+        self.x_table = array(typecode, (self.longitude_to_x((step + 0.5) / lon_steps - 180) for step in range(360 * lon_steps)))
+        self.y_table = array(typecode, (self.latitude_to_y((step + 0.5) / lat_steps - 90) for step in range(180 * lat_steps)))
+
+    # Pixel x from the map's left edge for a longitude in degrees, only
+    # used to build the table.
+    def longitude_to_x(self, lon):
+        raise NotImplementedError
+
+    # Pixel y from the map's top edge for a latitude in degrees, only used
+    # to build the table.
+    def latitude_to_y(self, lat):
+        raise NotImplementedError
+
+    # Pixel position of a point, as (x, y).  180 degrees east is the same
+    # place as 180 west, so it's at the left edge.
+    def project(self, lat, lon):
+        lon_index = int((lon + 180) * self.lon_steps) % len(self.x_table)
+        lat_index = int((lat + 90) * self.lat_steps)
+        if lat_index < 0:
+            lat_index = 0
+        elif lat_index >= len(self.y_table):
+            lat_index = len(self.y_table) - 1
+        return self.left + self.x_table[lon_index], self.top + self.y_table[lat_index]
+
+    # Project many points at once, from sequences of latitudes and
+    # longitudes into xs and ys (new array("h")s if not given, which are
+    # returned).
+    def project_many(self, lats, lons, xs=None, ys=None):
+        count = len(lats)
+        if xs is None:
+            xs = array("h", bytes(2 * count))
+        if ys is None:
+            ys = array("h", bytes(2 * count))
+
+        # Locals are much faster to look up than attributes in MicroPython.
+        x_table = self.x_table
+        y_table = self.y_table
+        left = self.left
+        top = self.top
+        lon_steps = self.lon_steps
+        lat_steps = self.lat_steps
+        lon_wrap = len(x_table)
+        lat_last = len(y_table) - 1
+        lon_offset = 180 * lon_steps
+        lat_offset = 90 * lat_steps
+        for i in range(count):
+            xs[i] = left + x_table[int(lons[i] * lon_steps + lon_offset) % lon_wrap]
+            lat_index = int(lats[i] * lat_steps + lat_offset)
+            ys[i] = top + y_table[0 if lat_index < 0 else lat_last if lat_index > lat_last else lat_index]
+        return xs, ys
+
+
+# Longitude and latitude map linearly to x and y, with 0, 0 in the middle.
+# The tables are fine enough for every pixel edge to fall between two
+# entries, so positions are exactly what the arithmetic would give: for the
+# 192x128 world map that's 1/16 degree of longitude and 1/64 of latitude,
+# around 17KB.
+class Equirectangular(Projection):
+    def __init__(self, left, top, width, height):
+        super().__init__(left, top, width, height, exact_steps(width, 360), exact_steps(height, 180))
+
+    def longitude_to_x(self, lon):
+        return self.width // 2 + round(lon * self.width / 360)
+
+    def latitude_to_y(self, lat):
+        return self.height // 2 - round(lat * self.height / 180)
+
+
+# Web Mercator, cut off at max_lat degrees north and south.
+class Mercator(Projection):
+    def __init__(self, left, top, width, height, max_lat=85.05, steps_per_degree=STEPS_PER_DEGREE):
+        self.max_lat = max_lat
+        super().__init__(left, top, width, height, exact_steps(width, 360), steps_per_degree)
+
+    def longitude_to_x(self, lon):
+        return self.width // 2 + round(lon * self.width / 360)
+
+    def latitude_to_y(self, lat):
+        lat = max(-self.max_lat, min(self.max_lat, lat))
+        max_y = math.log(math.tan(math.pi / 4 + math.radians(self.max_lat) / 2))
+        y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+        return self.height // 2 - round(y / max_y * (self.height // 2))
@@ -0,0 +1,140 @@
+# Fits place names into the space available for them on the screen.  Text
+# that's too wide gets shortened by each of FALLBACKS in turn until it
+# fits, and as a last resort is cut off with an ellipsis at the exact
+# point found by measuring it.  Results are remembered, as the ISS passes
+# over the same places orbit after orbit.
+
+ELLIPSIS = "..."
+# Words shortened if the text doesn't fit with them in full.
+ABBREVIATIONS = (
+    ("United States", "USA"),
+    ("United Kingdom", "UK"),
+    ("Democratic Republic of the", "DR"),
+    ("Republic of", "Rep."),
+    ("Republic", "Rep."),
+    ("Province", "Prov."),
+    ("Territory", "Terr."),
+    ("Islands", "Is."),
+    ("Island", "I."),
+    ("North ", "N. "),
+    ("South ", "S. "),
+    ("East ", "E. "),
+    ("West ", "W. "),
+)
+
+
+# Place name parts with dashes and slashes turned into spaces, so they can
+# wrap onto the next line.
+def clean(part):
+    if "-" in part:
+        part = part.replace("-", " ")
+    if "/" in part:
+        part = part.replace("/", " ")
+    return part
+
+
+# The text describing where the ISS is from the backend's data: the ocean,
+# or as much of the locality, region and country as is known, or failing
+# that its position if given (see position_text()).
+def location_text(iss_data):
+    if "ocean" in iss_data:
+        # ISS over the ocean, there will be no further location fields.
+        return iss_data["ocean"]
+
+    parts = []
+    for key in ("locality", "region", "country"):
+        part = iss_data.get(key)
+        if part:
+            part = clean(part).strip(" ,")
+            if part:
+                parts.append(part)
+
+    if len(parts) == 0:
+        return iss_data.get("position", "Unknown Location")
+    return ", ".join(parts)
+
+
+# A latitude and longitude as text, e.g. "52.9N 1.2W".
+def position_text(lat, lon):
+    return f"{abs(lat):.1f}{'N' if lat >= 0 else 'S'} {abs(lon):.1f}{'E' if lon >= 0 else 'W'}"
+
+
+# With locality, region and country, drop the region.
+def drop_region(text):
+    parts = text.split(", ")
+    if len(parts) == 3:
+        return f"{parts[0]}, {parts[2]}"
+    return text
+
+
+def abbreviate(text):
+    for long, short in ABBREVIATIONS:
+        if long in text:
+            text = text.replace(long, short)
+    return text
+
+
+# Ways of shortening the text to try, in order, each applied to the result
+# of the one before.
+FALLBACKS = (drop_region, abbreviate)
+
+
+class TextFitter:
+    def __init__(self, measure, max_width, cache_size=16):
+        # measure(text, scale) returns the width of text in pixels, e.g.
+        # display.measure_text.
+        self.measure = measure
+        self.max_width = max_width
+        self.cache_size = cache_size
+        self._cache = {}
+        self._cache_order = []
+
+    # Returns text shortened if needed so that it's no wider than max_width.
+    def fit(self, text, scale):
+        key = (text, scale)
+        fitted = self._cache.get(key)
+        if fitted is not None:
+            # Move to the end of the order, it's the most recently used.
+            self._cache_order.remove(key)
+            self._cache_order.append(key)
+            return fitted
+
+        fitted = self._fit(text, scale)
+
+        if len(self._cache_order) >= self.cache_size:
+            del self._cache[self._cache_order.pop(0)]
+        self._cache[key] = fitted
+        self._cache_order.append(key)
+        return fitted
+
+    def _fits(self, text, scale):
+        return self.measure(text, scale) <= self.max_width
+
+    def _fit(self, text, scale):
+        if self._fits(text, scale):
+            return text
+
+        for fallback in FALLBACKS:
+            shortened = fallback(text)
+            if shortened != text:
+                text = shortened
+                if self._fits(text, scale):
+                    return text
+
+        # Binary search for the longest start of the text that fits with an
+        # ellipsis after it.  Text only gets wider as characters are added,
+        # so this finds the same place as trying every length would.
+        low = 0
+        high = len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._fits(text[:middle] + ELLIPSIS, scale):
+                low = middle
+            else:
+                high = middle - 1
+
+        return text[:low].rstrip(" ,") + ELLIPSIS
+
+    def clear_cache(self):
+        self._cache = {}
+        self._cache_order = []
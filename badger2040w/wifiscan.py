@@ -0,0 +1,86 @@
+# Keeps a list of the WiFi networks in range up to date while the setup
+# portal is running, by scanning every so often from a uasyncio task
+# rather than once before the portal starts.  Each scan is merged into the
+# list: a network seen on more than one access point keeps its strongest
+# signal from the latest scan, networks that haven't been seen for a while
+# are dropped, and if there are too many only the strongest are kept.
+# Scanning holds everything else up, so it only carries on while someone is
+# looking at the list.
+import time
+import uasyncio
+
+
+class NetworkList:
+    def __init__(self, capacity=24, max_age=60):
+        self.capacity = capacity
+        # Seconds since a network was last seen before it's dropped.
+        self.max_age = max_age
+        # SSID -> (signal strength in dBm, ticks_ms when last seen).
+        self.networks = {}
+        # (ssid, rssi) tuples, strongest first.
+        self.by_strength = []
+        # ticks_ms when the list was last asked for, None if it hasn't been.
+        self.asked_at = None
+
+    # Merge in the results of a WLAN.scan().
+    def merge(self, results, now=None):
+        if now is None:
+            now = time.ticks_ms()
+
+        strongest = {}
+        for result in results:
+            try:
+                ssid = result[0].decode().strip("\x00")
+            except UnicodeError:
+                continue
+            # Hidden networks have no SSID to show.
+            if ssid:
+                rssi = result[3]
+                if rssi > strongest.get(ssid, -1000):
+                    strongest[ssid] = rssi
+
+        networks = self.networks
+        for ssid, rssi in strongest.items():
+            networks[ssid] = (rssi, now)
+
+        max_age_ms = self.max_age * 1000
+        for ssid in [ssid for ssid, (_, seen) in networks.items() if time.ticks_diff(now, seen) > max_age_ms]:
+            del networks[ssid]
+
+        by_strength = sorted(((ssid, rssi) for ssid, (rssi, _) in networks.items()), key=lambda network: network[1], reverse=True)
+        if len(by_strength) > self.capacity:
+            for ssid, _ in by_strength[self.capacity:]:
+                del networks[ssid]
+            del by_strength[self.capacity:]
+        self.by_strength = by_strength
+
+    # Networks as (ssid, rssi) tuples, strongest first.  Asking for them
+    # keeps the scans going.
+    def strongest(self):
+        self.asked_at = time.ticks_ms()
+        return self.by_strength
+
+    # Whether the list has been asked for in the last seconds.
+    def asked_for(self, seconds):
+        return self.asked_at is not None and time.ticks_diff(time.ticks_ms(), self.asked_at) <= seconds * 1000
+
+
+def _scan(wlan, network_list):
+    try:
+        network_list.merge(wlan.scan())
+    except OSError as e:
+        print(f"Couldn't scan for WiFi networks: {e}")
+
+
+# Task that scans for networks.  Each scan holds up the other tasks while it
+# runs (a second or two), including the portal and its DNS, so there's one
+# scan after delay seconds for the first page to show, then one every
+# interval seconds only while the list has been asked for since the last
+# (the setup page asks every 10 seconds while it's open).
+async def keep_scanning(wlan, network_list, interval, delay=1):
+    await uasyncio.sleep(delay)
+    _scan(wlan, network_list)
+    while True:
+        await uasyncio.sleep(interval)
+        if network_list.asked_for(interval):
+            _scan(wlan, network_list)
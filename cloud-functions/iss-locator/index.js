@@ -1,9 +1,31 @@
 const dateformat = require('dateformat');
 const functions = require('@google-cloud/functions-framework');
 const haversine = require('haversine');
+const orbit = require('./orbit');
 
 const SECURITY_HEADER_NAME = 'X-ISS-Locator-Token';
 
+// Compact binary response for devices that ask for it with an Accept header
+// or ?format=bin.  A 16 byte little endian header:
+//   uint8 version, uint8 bit mask of the location fields present,
+//   float32 lat, float32 lon, uint16 distance in miles,
+//   uint32 time of the update in seconds since 2000-01-01 UTC
+// followed by each location field present, in BINARY_FIELDS order, as a
+// uint8 length and that many bytes of UTF-8.  If the ground track was asked
+// for, BINARY_TRACK_FLAG is set in the bit mask and the track follows:
+//   uint32 time of the first point in seconds since 2000-01-01 UTC,
+//   uint16 seconds between points, uint16 number of points
+// then for each point int16 lat and int16 lon in hundredths of a degree
+// and uint16 distance in miles.
+const BINARY_CONTENT_TYPE = 'application/vnd.iss-locator';
+const BINARY_VERSION = 1;
+const BINARY_HEADER_SIZE = 16;
+const BINARY_FIELDS = ['locality', 'region', 'country', 'ocean'];
+const BINARY_TRACK_FLAG = 0x80;
+const BINARY_TRACK_HEADER_SIZE = 8;
+const BINARY_TRACK_POINT_SIZE = 6;
+const EPOCH_2000_MS = Date.UTC(2000, 0, 1);
+
 const COUNTRY_NAME_MAP = {
   'United States': 'USA',
   'United Arab Emirates': 'UAE',
@@ -27,6 +49,44 @@ require('dotenv').config();
 
 const CLIENT_PASSPHRASES = process.env.CLIENT_PASSPHRASES.split('|')
 
+// Upstream services, overridable for testing against local stubs.
+const ISS_POSITION_URL = process.env.ISS_POSITION_URL || 'http://api.open-notify.org/iss-now.json';
+const GEOCODER_URL = process.env.GEOCODER_URL || 'https://maps.googleapis.com/maps/api/geocode/json';
+const OCEAN_URL = process.env.OCEAN_URL || 'https://secure.geonames.org/oceanJSON';
+const TLE_URL = process.env.TLE_URL || 'https://celestrak.org/NORAD/elements/gp.php?CATNR=25544&FORMAT=TLE';
+
+// The ISS position is shared by every request for this long, it moves
+// about 8km a second so a few seconds doesn't matter on a 192 pixel map.
+const ISS_POSITION_TTL_MS = parseInt(process.env.ISS_POSITION_TTL_MS || '5000', 10);
+
+// Place names are cached for squares of this many degrees (0.25 is about
+// 28km at the equator), keeping the most recently used GEOCODE_CACHE_SIZE.
+const GEOCODE_GRID_DEGREES = parseFloat(process.env.GEOCODE_GRID_DEGREES || '0.25');
+const GEOCODE_CACHE_SIZE = parseInt(process.env.GEOCODE_CACHE_SIZE || '5000', 10);
+
+// GeoNames status value for "no ocean found here".
+const GEONAMES_NO_RESULT = 15;
+
+// The ISS TLE, for working out ground tracks, is downloaded again after
+// this long.  Celestrak updates it a few times a day.
+const TLE_TTL_MS = parseInt(process.env.TLE_TTL_MS || '21600000', 10);
+
+// Ground tracks are at most this long, with points at least this far apart.
+const TRACK_MAX_MINUTES = 180;
+const TRACK_MIN_STEP_SECONDS = 10;
+const TRACK_MAX_STEP_SECONDS = 600;
+const TRACK_DEFAULT_STEP_SECONDS = 60;
+
+let issPositionCache = null;
+let issPositionInFlight = null;
+let satelliteCache = null;
+let satelliteInFlight = null;
+
+// Map iteration order is insertion order, so re-inserting an entry when
+// it's used keeps the least recently used one first.
+const geocodeCache = new Map();
+const geocodeInFlight = new Map();
+
 function findAddressComponent(addressComponents, componentToFind, useShortForm) {
   const matches = addressComponents.filter(comp => comp.types.includes(componentToFind));
 
@@ -41,6 +101,237 @@ function formatCountryName(countryName) {
   return COUNTRY_NAME_MAP[countryName] ? COUNTRY_NAME_MAP[countryName] : countryName;
 }
 
+// Gets the ISS position, from the cache if it's recent enough.  Requests
+// that arrive while it's being fetched share the same upstream request.
+async function getIssPosition() {
+  if (issPositionCache && issPositionCache.expires > Date.now()) {
+    return issPositionCache.position;
+  }
+
+  if (!issPositionInFlight) {
+    issPositionInFlight = (async () => {
+      try {
+        const apiResponse = await fetch(ISS_POSITION_URL);
+        const issInfo = await apiResponse.json();
+        const position = {
+          latitude: issInfo.iss_position.latitude,
+          longitude: issInfo.iss_position.longitude
+        };
+
+        issPositionCache = { position, expires: Date.now() + ISS_POSITION_TTL_MS };
+        return position;
+      } finally {
+        issPositionInFlight = null;
+      }
+    })();
+  }
+
+  return issPositionInFlight;
+}
+
+// Gets the ISS orbit from its TLE, downloading it if the cached one is too
+// old, in the same way as getIssPosition().  If the download fails the old
+// one is used for up to a day more.
+async function getSatellite() {
+  if (satelliteCache && satelliteCache.expires > Date.now()) {
+    return satelliteCache.satellite;
+  }
+
+  if (!satelliteInFlight) {
+    satelliteInFlight = (async () => {
+      try {
+        const apiResponse = await fetch(TLE_URL);
+        const satellite = orbit.parseTle(await apiResponse.text());
+
+        if (!satellite) {
+          throw new Error('No TLE in response.');
+        }
+
+        satelliteCache = { satellite, expires: Date.now() + TLE_TTL_MS };
+        return satellite;
+      } catch (e) {
+        if (satelliteCache && satelliteCache.expires + 86400000 > Date.now()) {
+          return satelliteCache.satellite;
+        }
+
+        throw e;
+      } finally {
+        satelliteInFlight = null;
+      }
+    })();
+  }
+
+  return satelliteInFlight;
+}
+
+// Where the ISS will be every step seconds for the next minutes, starting
+// now (to the second), with the distance from lat, lng to each point.
+// Points are [lat, lon, distance in miles], to two decimal places.
+async function getTrack(lat, lng, minutes, step) {
+  const satellite = await getSatellite();
+  const start = Math.floor(Date.now() / 1000) * 1000;
+  const count = Math.floor(minutes * 60 / step) + 1;
+  const points = [];
+
+  for (let n = 0; n < count; n++) {
+    const position = satellite.subpoint(start + n * step * 1000);
+    const pointLat = Math.round(position.latitude * 100) / 100;
+    const pointLon = Math.round(position.longitude * 100) / 100;
+
+    points.push([pointLat, pointLon, Math.round(haversine(
+      { latitude: lat, longitude: lng },
+      { latitude: pointLat, longitude: pointLon },
+      { unit: 'mile' }
+    ))]);
+  }
+
+  return { start, step, points };
+}
+
+// Reverse geocode a position to the locality, region and country, or the
+// ocean it's over.  Returns an object with whichever of these are known,
+// and throws if either service fails (e.g. rate limiting, which GeoNames
+// reports with a 200 response) so that failures aren't cached.
+async function geocode(lat, lon) {
+  const location = {};
+
+  let apiResponse = await fetch(`${GEOCODER_URL}?result_type=country|locality|administrative_area_level_1|natural_feature&language=en_GB&latlng=${lat},${lon}&key=${process.env.GEOCODER_API_KEY}`);
+  if (!apiResponse.ok) {
+    throw new Error(`Geocoder returned ${apiResponse.status}.`);
+  }
+  const geocodeInfo = await apiResponse.json();
+
+  if (geocodeInfo.status !== 'OK' && geocodeInfo.status !== 'ZERO_RESULTS') {
+    throw new Error(`Geocoder returned ${geocodeInfo.status}.`);
+  }
+
+  if (geocodeInfo.status === 'ZERO_RESULTS') {
+    // Try for an ocean name if possible.
+    apiResponse = await fetch(`${OCEAN_URL}?lat=${lat}&lng=${lon}&username=${process.env.GEONAMES_USER}`);
+    if (!apiResponse.ok) {
+      throw new Error(`GeoNames returned ${apiResponse.status}.`);
+    }
+    const oceanInfo = await apiResponse.json();
+
+    // Errors come back as { status: { message, value } }, and so does not
+    // being over an ocean, which is a real answer.
+    if (oceanInfo.status && oceanInfo.status.value !== GEONAMES_NO_RESULT) {
+      throw new Error(`GeoNames returned ${oceanInfo.status.message}.`);
+    }
+    if (oceanInfo.ocean) { location.ocean = oceanInfo.ocean.name; }
+  } else {
+    // Retrieve fields of interest from geocoder response, if present.
+    const locality = findAddressComponent(geocodeInfo.results[0].address_components, 'locality');
+    const country = findAddressComponent(geocodeInfo.results[0].address_components, 'country');
+
+    // If we have a locality and the country is the USA then let's send the short
+    // name for the region which will be the state name.
+    // TODO: Potentially also Canadian provinces?
+    if (country) { location.country = formatCountryName(country); }
+
+    const region = findAddressComponent(geocodeInfo.results[0].address_components, 'administrative_area_level_1', ('USA' === location.country && locality));
+
+    if (locality) { location.locality = locality; }
+    if (region) { location.region = region; }
+  }
+
+  return location;
+}
+
+// Looks up where a position is, from the cache if anywhere in the same
+// grid square has been looked up recently.
+async function getLocation(lat, lon) {
+  const key = `${Math.floor(lat / GEOCODE_GRID_DEGREES)},${Math.floor(lon / GEOCODE_GRID_DEGREES)}`;
+
+  const cached = geocodeCache.get(key);
+  if (cached) {
+    geocodeCache.delete(key);
+    geocodeCache.set(key, cached);
+    return cached;
+  }
+
+  let inFlight = geocodeInFlight.get(key);
+  if (!inFlight) {
+    inFlight = (async () => {
+      try {
+        const location = await geocode(lat, lon);
+
+        geocodeCache.set(key, location);
+        if (geocodeCache.size > GEOCODE_CACHE_SIZE) {
+          geocodeCache.delete(geocodeCache.keys().next().value);
+        }
+
+        return location;
+      } finally {
+        geocodeInFlight.delete(key);
+      }
+    })();
+    geocodeInFlight.set(key, inFlight);
+  }
+
+  return inFlight;
+}
+
+function wantsBinary(req) {
+  return req.query.format === 'bin' || (req.header('Accept') || '').includes(BINARY_CONTENT_TYPE);
+}
+
+// The start of UTF-8 text at most maxBytes long, cut at the start of a
+// character rather than part way through one.
+function truncateUtf8(buffer, maxBytes) {
+  if (buffer.length <= maxBytes) {
+    return buffer;
+  }
+
+  let end = maxBytes;
+  // Continuation bytes are 10xxxxxx.
+  while (end > 0 && (buffer[end] & 0xC0) === 0x80) {
+    end--;
+  }
+  return buffer.subarray(0, end);
+}
+
+function encodeBinary(response) {
+  const header = Buffer.alloc(BINARY_HEADER_SIZE);
+  const parts = [header];
+  let fieldMask = 0;
+
+  BINARY_FIELDS.forEach((field, bit) => {
+    if (response[field]) {
+      // Lengths are one byte, place names are never anywhere near that long.
+      const value = truncateUtf8(Buffer.from(response[field], 'utf8'), 255);
+      fieldMask |= 1 << bit;
+      parts.push(Buffer.from([value.length]), value);
+    }
+  });
+
+  header.writeUInt8(BINARY_VERSION, 0);
+  header.writeUInt8(fieldMask, 1);
+  header.writeFloatLE(response.lat, 2);
+  header.writeFloatLE(response.lon, 6);
+  header.writeUInt16LE(Math.min(response.dist, 0xFFFF), 10);
+  header.writeUInt32LE(Math.floor((response.timestamp - EPOCH_2000_MS) / 1000), 12);
+
+  if (response.track) {
+    const points = response.track.points;
+    const track = Buffer.alloc(BINARY_TRACK_HEADER_SIZE + points.length * BINARY_TRACK_POINT_SIZE);
+
+    header.writeUInt8(fieldMask | BINARY_TRACK_FLAG, 1);
+    track.writeUInt32LE(Math.floor((response.track.start - EPOCH_2000_MS) / 1000), 0);
+    track.writeUInt16LE(response.track.step, 4);
+    track.writeUInt16LE(points.length, 6);
+    points.forEach(([lat, lon, dist], n) => {
+      const offset = BINARY_TRACK_HEADER_SIZE + n * BINARY_TRACK_POINT_SIZE;
+      track.writeInt16LE(Math.round(lat * 100), offset);
+      track.writeInt16LE(Math.round(lon * 100), offset + 2);
+      track.writeUInt16LE(Math.min(dist, 0xFFFF), offset + 4);
+    });
+    parts.push(track);
+  }
+
+  return Buffer.concat(parts);
+}
+
 functions.http('isslocator', async (req, res) => {
   res.set('Access-Control-Allow-Origin', '*');
 
@@ -66,18 +357,17 @@ functions.http('isslocator', async (req, res) => {
   }
 
   // Get ISS Position.
-  let apiResponse = await fetch('http://api.open-notify.org/iss-now.json');
-  const issInfo = await apiResponse.json();
+  const issPosition = await getIssPosition();
   const response = {
-    lat: parseFloat(issInfo.iss_position.latitude),
-    lon: parseFloat(issInfo.iss_position.longitude),
+    lat: parseFloat(issPosition.latitude),
+    lon: parseFloat(issPosition.longitude),
     dist: Math.round(haversine(
       {
         latitude: req.query.lat,
         longitude: req.query.lng
       }, {
-      latitude: issInfo.iss_position.latitude,
-      longitude: issInfo.iss_position.longitude
+      latitude: issPosition.latitude,
+      longitude: issPosition.longitude
     },
       {
         unit: 'mile'
@@ -87,34 +377,25 @@ functions.http('isslocator', async (req, res) => {
   };
 
   // Reverse geocode the ISS location to get city, country info if possible.
-  apiResponse = await fetch(`https://maps.googleapis.com/maps/api/geocode/json?result_type=country|locality|administrative_area_level_1|natural_feature&language=en_GB&latlng=${response.lat},${response.lon}&key=${process.env.GEOCODER_API_KEY}`);
-  const geocodeInfo = await apiResponse.json();
+  try {
+    Object.assign(response, await getLocation(response.lat, response.lon));
+  } catch (e) {
+    // Unknown, service was down?
+  }
 
-  if (geocodeInfo.status === 'ZERO_RESULTS') {
-    // Try for an ocean name if possible.
-    try {
-      apiResponse = await fetch(`https://secure.geonames.org/oceanJSON?lat=${response.lat}&lng=${response.lon}&username=${process.env.GEONAMES_USER}`);
-      const oceanInfo = await apiResponse.json();
+  // Where the ISS will be for the next track minutes, if asked for, so that
+  // devices can move it along by themselves rather than asking again.
+  if (req.query.track) {
+    const minutes = Math.min(parseInt(req.query.track, 10) || 0, TRACK_MAX_MINUTES);
+    const step = Math.min(Math.max(parseInt(req.query.step, 10) || TRACK_DEFAULT_STEP_SECONDS, TRACK_MIN_STEP_SECONDS), TRACK_MAX_STEP_SECONDS);
 
-      if (oceanInfo.ocean) { response.ocean = oceanInfo.ocean.name; }
-    } catch (e) {
-      // Unknown, service was down?
+    if (minutes > 0) {
+      try {
+        response.track = await getTrack(parseFloat(req.query.lat), parseFloat(req.query.lng), minutes, step);
+      } catch (e) {
+        // No TLE, devices carry on without a track.
+      }
     }
-  } else {
-    // Retrieve fields of interest from geocoder response, if present.
-    const locality = findAddressComponent(geocodeInfo.results[0].address_components, 'locality');
-    const country = findAddressComponent(geocodeInfo.results[0].address_components, 'country');
-
-    // If we have a locality and the country is the USA then let's send the short
-    // name for the region which will be the state name.
-    // TODO: Potentially also Canadian provinces?
-    if (country) { response.country = formatCountryName(country); }
-
-    const region = findAddressComponent(geocodeInfo.results[0].address_components, 'administrative_area_level_1', ('USA' === response.country && locality));
-
-    if (locality) { response.locality = locality; }
-    if (region) { response.region = region; }
-
   }
 
   rightNow = new Date();
@@ -122,5 +403,11 @@ functions.http('isslocator', async (req, res) => {
   response.updatedAt = `${dateformat(rightNow, 'ddd dd mmm h:MMtt')} UTC`;
   response.timestamp = rightNow.getTime();
 
+  res.set('Vary', 'Accept');
+
+  if (wantsBinary(req)) {
+    return res.type(BINARY_CONTENT_TYPE).send(encodeBinary(response));
+  }
+
   return res.json(response);
 });
\ No newline at end of file
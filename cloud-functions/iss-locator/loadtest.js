@@ -0,0 +1,146 @@
+// Load test for the isslocator function against local stub upstream
+// services, reporting request latency percentiles and how many calls
+// reached each upstream service.
+//
+// Usage: npm run loadtest -- [requests] [concurrency] [devices]
+const http = require('http');
+
+const REQUESTS = parseInt(process.argv[2] || '2000', 10);
+const CONCURRENCY = parseInt(process.argv[3] || '50', 10);
+const DEVICES = parseInt(process.argv[4] || '200', 10);
+const PASSPHRASE = 'loadtest';
+
+// Typical upstream response times in ms.
+const ISS_POSITION_DELAY_MS = 150;
+const GEOCODER_DELAY_MS = 120;
+const OCEAN_DELAY_MS = 200;
+
+const upstreamCalls = { issPosition: 0, geocoder: 0, ocean: 0 };
+
+function listen(server) {
+  return new Promise((resolve) => server.listen(0, '127.0.0.1', () => resolve(server.address().port)));
+}
+
+function sendJson(res, delay, body) {
+  setTimeout(() => {
+    res.setHeader('Content-Type', 'application/json');
+    res.end(JSON.stringify(body));
+  }, delay);
+}
+
+// The ISS heads east along the equator at about 4 degrees a minute, over
+// land when its longitude is positive and the ocean otherwise.
+function stubLongitude() {
+  return ((Date.now() / 15000) % 360) - 180;
+}
+
+async function startStubUpstreams() {
+  const issPosition = http.createServer((req, res) => {
+    upstreamCalls.issPosition += 1;
+    sendJson(res, ISS_POSITION_DELAY_MS, {
+      message: 'success',
+      timestamp: Math.floor(Date.now() / 1000),
+      iss_position: { latitude: '0.0000', longitude: stubLongitude().toFixed(4) }
+    });
+  });
+
+  const geocoder = http.createServer((req, res) => {
+    upstreamCalls.geocoder += 1;
+    const lon = parseFloat(new URL(req.url, 'http://localhost').searchParams.get('latlng').split(',')[1]);
+    sendJson(res, GEOCODER_DELAY_MS, lon < 0 ? { status: 'ZERO_RESULTS', results: [] } : {
+      status: 'OK',
+      results: [{
+        address_components: [
+          { long_name: 'Stubville', short_name: 'Stubville', types: ['locality'] },
+          { long_name: 'Stub Region', short_name: 'SR', types: ['administrative_area_level_1'] },
+          { long_name: 'United Kingdom', short_name: 'GB', types: ['country'] }
+        ]
+      }]
+    });
+  });
+
+  const ocean = http.createServer((req, res) => {
+    upstreamCalls.ocean += 1;
+    sendJson(res, OCEAN_DELAY_MS, { ocean: { name: 'Stub Ocean' } });
+  });
+
+  const ports = await Promise.all([listen(issPosition), listen(geocoder), listen(ocean)]);
+  process.env.ISS_POSITION_URL = `http://127.0.0.1:${ports[0]}/iss-now.json`;
+  process.env.GEOCODER_URL = `http://127.0.0.1:${ports[1]}/geocode/json`;
+  process.env.OCEAN_URL = `http://127.0.0.1:${ports[2]}/oceanJSON`;
+  return [issPosition, geocoder, ocean];
+}
+
+function percentile(sorted, p) {
+  return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p / 100))];
+}
+
+async function main() {
+  const upstreams = await startStubUpstreams();
+  process.env.CLIENT_PASSPHRASES = PASSPHRASE;
+  process.env.GEOCODER_API_KEY = 'stub';
+  process.env.GEONAMES_USER = 'stub';
+
+  // Loaded after the environment is set up, as it reads it at startup.
+  const { getTestServer } = require('@google-cloud/functions-framework/testing');
+  require('./index');
+  const server = getTestServer('isslocator');
+  const port = await listen(server);
+  const agent = new http.Agent({ keepAlive: true, maxSockets: CONCURRENCY });
+
+  function request(device) {
+    // Devices spread around the world.
+    const lat = ((device * 37) % 140) - 70;
+    const lng = ((device * 73) % 360) - 180;
+    const start = process.hrtime.bigint();
+
+    return new Promise((resolve, reject) => {
+      http.get({
+        host: '127.0.0.1',
+        port,
+        path: `/?deviceid=device${device}&lat=${lat}&lng=${lng}`,
+        headers: { 'X-ISS-Locator-Token': PASSPHRASE },
+        agent
+      }, (res) => {
+        res.resume();
+        res.on('end', () => {
+          if (res.statusCode !== 200) {
+            reject(new Error(`status ${res.statusCode}`));
+          } else {
+            resolve(Number(process.hrtime.bigint() - start) / 1e6);
+          }
+        });
+      }).on('error', reject);
+    });
+  }
+
+  const latencies = [];
+  let next = 0;
+  const started = Date.now();
+
+  async function worker() {
+    while (next < REQUESTS) {
+      const device = next % DEVICES;
+      next += 1;
+      latencies.push(await request(device));
+    }
+  }
+
+  await Promise.all(Array.from({ length: CONCURRENCY }, worker));
+  const elapsed = (Date.now() - started) / 1000;
+
+  latencies.sort((a, b) => a - b);
+  console.log(`${REQUESTS} requests from ${DEVICES} devices, ${CONCURRENCY} at a time, in ${elapsed.toFixed(1)}s (${(REQUESTS / elapsed).toFixed(0)} requests/s)`);
+  console.log(`latency p50 ${percentile(latencies, 50).toFixed(1)}ms, p99 ${percentile(latencies, 99).toFixed(1)}ms, max ${latencies[latencies.length - 1].toFixed(1)}ms`);
+  console.log(`upstream calls: iss position ${upstreamCalls.issPosition}, geocoder ${upstreamCalls.geocoder}, ocean ${upstreamCalls.ocean}`);
+  console.log(`without caching that would have been ${REQUESTS} iss position and ${REQUESTS} geocoder calls`);
+
+  agent.destroy();
+  server.close();
+  upstreams.forEach((upstream) => upstream.close());
+}
+
+main().catch((e) => {
+  console.error(e);
+  process.exit(1);
+});
@@ -0,0 +1,318 @@
+// Works out where the ISS will be from a two line element set (TLE), for
+// the ground track mode.  This is the near earth part of the SGP4 orbit
+// model (orbits of under 225 minutes, which the ISS's ~92 minute orbit
+// is), following Vallado et al, "Revisiting Spacetrack Report #3" (AIAA
+// 2006-6753), and is a port of orbit.py on the device.  Times are in ms
+// since 1970 like Date.now().
+
+// WGS-72 constants, which TLEs are generated with.
+const EARTH_RADIUS_KM = 6378.135;
+const XKE = 60.0 / Math.sqrt(EARTH_RADIUS_KM ** 3 / 398600.8);
+const J2 = 0.001082616;
+const J3 = -0.00000253881;
+const J4 = -0.00000165597;
+const J3OJ2 = J3 / J2;
+// Flattening used when converting to geodetic latitude.
+const FLATTENING = 1 / 298.26;
+
+const TWO_PI = 2 * Math.PI;
+const DEG = Math.PI / 180;
+const MINUTES_PER_DAY = 1440;
+const MS_PER_DAY = 86400000;
+const J2000_MS = Date.UTC(2000, 0, 1, 12);
+
+// Parses a number in TLE "assumed decimal point" form, e.g. " 28098-4".
+function tleExp(field) {
+  field = field.trim();
+  if (!field) {
+    return 0.0;
+  }
+
+  const sign = field[0] === '-' ? -1 : 1;
+  field = field.replace(/^[+-]/, '');
+  return sign * parseFloat(`0.${field.slice(0, -2)}`) * 10 ** parseInt(field.slice(-2), 10);
+}
+
+// Greenwich mean sidereal time in degrees.
+function siderealDegrees(ms) {
+  const days = (ms - J2000_MS) / MS_PER_DAY;
+  const centuries = days / 36525.0;
+  const gmst = 280.46061837 + 360.98564736629 * days + 0.000387933 * centuries * centuries;
+  return ((gmst % 360.0) + 360.0) % 360.0;
+}
+
+class Satellite {
+  constructor(line1, line2) {
+    this.line1 = line1;
+    this.line2 = line2;
+
+    let year = parseInt(line1.slice(18, 20), 10);
+    year += year < 57 ? 2000 : 1900;
+    const dayOfYear = parseFloat(line1.slice(20, 32));
+    this.epochMs = Date.UTC(year, 0, 1) + (dayOfYear - 1) * MS_PER_DAY;
+
+    this.bstar = tleExp(line1.slice(53, 61));
+
+    this.inclo = parseFloat(line2.slice(8, 16)) * DEG;
+    this.nodeo = parseFloat(line2.slice(17, 25)) * DEG;
+    this.ecco = parseFloat(`0.${line2.slice(26, 33).trim()}`);
+    this.argpo = parseFloat(line2.slice(34, 42)) * DEG;
+    this.mo = parseFloat(line2.slice(43, 51)) * DEG;
+    // Revolutions per day to radians per minute.
+    const noKozai = parseFloat(line2.slice(52, 63)) * TWO_PI / MINUTES_PER_DAY;
+
+    if ([this.bstar, this.inclo, this.nodeo, this.ecco, this.argpo, this.mo, noKozai, this.epochMs].some(Number.isNaN)) {
+      throw new Error('Invalid TLE.');
+    }
+
+    this.init(noKozai);
+  }
+
+  init(noKozai) {
+    const ecco = this.ecco;
+    const inclo = this.inclo;
+    const bstar = this.bstar;
+
+    const ss = 78.0 / EARTH_RADIUS_KM + 1.0;
+    const qzms2t = ((120.0 - 78.0) / EARTH_RADIUS_KM) ** 4;
+    const x2o3 = 2.0 / 3.0;
+
+    // Recover the original mean motion and semi major axis.
+    const eccsq = ecco * ecco;
+    const omeosq = 1.0 - eccsq;
+    const rteosq = Math.sqrt(omeosq);
+    const cosio = Math.cos(inclo);
+    const cosio2 = cosio * cosio;
+    const ak = (XKE / noKozai) ** x2o3;
+    const d1 = 0.75 * J2 * (3.0 * cosio2 - 1.0) / (rteosq * omeosq);
+    let delta = d1 / (ak * ak);
+    const adel = ak * (1.0 - delta * delta - delta * (1.0 / 3.0 + 134.0 * delta * delta / 81.0));
+    delta = d1 / (adel * adel);
+    const no = this.no = noKozai / (1.0 + delta);
+    const ao = (XKE / no) ** x2o3;
+    const sinio = Math.sin(inclo);
+    const po = ao * omeosq;
+    const con42 = 1.0 - 5.0 * cosio2;
+    const con41 = this.con41 = -con42 - cosio2 - cosio2;
+    const posq = po * po;
+    const rp = ao * (1.0 - ecco);
+
+    if (TWO_PI / no >= 225.0) {
+      throw new Error('Deep space orbits aren\'t supported.');
+    }
+
+    // Orbits with a perigee under 220km use a simplified model.
+    this.isimp = rp < (220.0 / EARTH_RADIUS_KM + 1.0);
+    let sfour = ss;
+    let qzms24 = qzms2t;
+    const perige = (rp - 1.0) * EARTH_RADIUS_KM;
+    if (perige < 156.0) {
+      sfour = perige < 98.0 ? 20.0 : perige - 78.0;
+      qzms24 = ((120.0 - sfour) / EARTH_RADIUS_KM) ** 4;
+      sfour = sfour / EARTH_RADIUS_KM + 1.0;
+    }
+
+    const pinvsq = 1.0 / posq;
+    const tsi = 1.0 / (ao - sfour);
+    const eta = this.eta = ao * ecco * tsi;
+    const etasq = eta * eta;
+    const eeta = ecco * eta;
+    const psisq = Math.abs(1.0 - etasq);
+    const coef = qzms24 * tsi ** 4;
+    const coef1 = coef / psisq ** 3.5;
+    const cc2 = coef1 * no * (ao * (1.0 + 1.5 * etasq + eeta * (4.0 + etasq)) +
+      0.375 * J2 * tsi / psisq * con41 * (8.0 + 3.0 * etasq * (8.0 + etasq)));
+    const cc1 = this.cc1 = bstar * cc2;
+    let cc3 = 0.0;
+    if (ecco > 1.0e-4) {
+      cc3 = -2.0 * coef * tsi * J3OJ2 * no * sinio / ecco;
+    }
+    const x1mth2 = this.x1mth2 = 1.0 - cosio2;
+    this.cc4 = 2.0 * no * coef1 * ao * omeosq * (
+      eta * (2.0 + 0.5 * etasq) + ecco * (0.5 + 2.0 * etasq) -
+      J2 * tsi / (ao * psisq) * (
+        -3.0 * con41 * (1.0 - 2.0 * eeta + etasq * (1.5 - 0.5 * eeta)) +
+        0.75 * x1mth2 * (2.0 * etasq - eeta * (1.0 + etasq)) * Math.cos(2.0 * this.argpo)));
+    this.cc5 = 2.0 * coef1 * ao * omeosq * (1.0 + 2.75 * (etasq + eeta) + eeta * etasq);
+
+    // Secular rates from gravity.
+    const cosio4 = cosio2 * cosio2;
+    const temp1 = 1.5 * J2 * pinvsq * no;
+    const temp2 = 0.5 * temp1 * J2 * pinvsq;
+    const temp3 = -0.46875 * J4 * pinvsq * pinvsq * no;
+    this.mdot = no + 0.5 * temp1 * rteosq * con41 + 0.0625 * temp2 * rteosq * (13.0 - 78.0 * cosio2 + 137.0 * cosio4);
+    this.argpdot = -0.5 * temp1 * con42 + 0.0625 * temp2 * (7.0 - 114.0 * cosio2 + 395.0 * cosio4) +
+      temp3 * (3.0 - 36.0 * cosio2 + 49.0 * cosio4);
+    const xhdot1 = -temp1 * cosio;
+    this.nodedot = xhdot1 + (0.5 * temp2 * (4.0 - 19.0 * cosio2) + 2.0 * temp3 * (3.0 - 7.0 * cosio2)) * cosio;
+    this.omgcof = bstar * cc3 * Math.cos(this.argpo);
+    this.xmcof = ecco > 1.0e-4 ? -x2o3 * coef * bstar / eeta : 0.0;
+    this.nodecf = 3.5 * omeosq * xhdot1 * cc1;
+    this.t2cof = 1.5 * cc1;
+    this.xlcof = -0.25 * J3OJ2 * sinio * (3.0 + 5.0 * cosio) / (Math.abs(cosio + 1.0) > 1.5e-12 ? 1.0 + cosio : 1.5e-12);
+    this.aycof = -0.5 * J3OJ2 * sinio;
+    this.delmo = (1.0 + eta * Math.cos(this.mo)) ** 3;
+    this.sinmao = Math.sin(this.mo);
+    this.x7thm1 = 7.0 * cosio2 - 1.0;
+
+    if (!this.isimp) {
+      const cc1sq = cc1 * cc1;
+      const d2 = this.d2 = 4.0 * ao * tsi * cc1sq;
+      const temp = d2 * tsi * cc1 / 3.0;
+      const d3 = this.d3 = (17.0 * ao + sfour) * temp;
+      const d4 = this.d4 = 0.5 * temp * ao * tsi * (221.0 * ao + 31.0 * sfour) * cc1;
+      this.t3cof = d2 + 2.0 * cc1sq;
+      this.t4cof = 0.25 * (3.0 * d3 + cc1 * (12.0 * d2 + 10.0 * cc1sq));
+      this.t5cof = 0.2 * (3.0 * d4 + 12.0 * cc1 * d3 + 6.0 * d2 * d2 + 15.0 * cc1sq * (2.0 * d2 + cc1sq));
+    }
+  }
+
+  // Position in km in the TEME frame, t minutes after the TLE epoch.
+  propagate(t) {
+    // Secular gravity and atmospheric drag.
+    const xmdf = this.mo + this.mdot * t;
+    const argpdf = this.argpo + this.argpdot * t;
+    const nodedf = this.nodeo + this.nodedot * t;
+    let argpm = argpdf;
+    let mm = xmdf;
+    const t2 = t * t;
+    let nodem = nodedf + this.nodecf * t2;
+    let tempa = 1.0 - this.cc1 * t;
+    let tempe = this.bstar * this.cc4 * t;
+    let templ = this.t2cof * t2;
+
+    if (!this.isimp) {
+      const delomg = this.omgcof * t;
+      const delm = this.xmcof * ((1.0 + this.eta * Math.cos(xmdf)) ** 3 - this.delmo);
+      const temp = delomg + delm;
+      mm = xmdf + temp;
+      argpm = argpdf - temp;
+      const t3 = t2 * t;
+      const t4 = t3 * t;
+      tempa = tempa - this.d2 * t2 - this.d3 * t3 - this.d4 * t4;
+      tempe = tempe + this.bstar * this.cc5 * (Math.sin(mm) - this.sinmao);
+      templ = templ + this.t3cof * t3 + t4 * (this.t4cof + t * this.t5cof);
+    }
+
+    const am = (XKE / this.no) ** (2.0 / 3.0) * tempa * tempa;
+    let em = this.ecco - tempe;
+    if (em < 1.0e-6) {
+      em = 1.0e-6;
+    }
+    mm = mm + this.no * templ;
+    const xlm = (mm + argpm + nodem) % TWO_PI;
+    nodem = nodem % TWO_PI;
+    argpm = argpm % TWO_PI;
+
+    // Long period periodics.
+    const sinip = Math.sin(this.inclo);
+    const cosip = Math.cos(this.inclo);
+    const axnl = em * Math.cos(argpm);
+    let temp = 1.0 / (am * (1.0 - em * em));
+    const aynl = em * Math.sin(argpm) + temp * this.aycof;
+    const xl = xlm + temp * this.xlcof * axnl;
+
+    // Solve Kepler's equation.
+    const u = (xl - nodem) % TWO_PI;
+    let eo1 = u;
+    let tem5 = 9999.9;
+    let sineo1 = 0;
+    let coseo1 = 0;
+    for (let ktr = 1; Math.abs(tem5) >= 1.0e-12 && ktr <= 10; ktr++) {
+      sineo1 = Math.sin(eo1);
+      coseo1 = Math.cos(eo1);
+      tem5 = 1.0 - coseo1 * axnl - sineo1 * aynl;
+      tem5 = (u - aynl * coseo1 + axnl * sineo1 - eo1) / tem5;
+      if (Math.abs(tem5) >= 0.95) {
+        tem5 = tem5 > 0.0 ? 0.95 : -0.95;
+      }
+      eo1 = eo1 + tem5;
+    }
+
+    // Short period periodics.
+    const ecose = axnl * coseo1 + aynl * sineo1;
+    const esine = axnl * sineo1 - aynl * coseo1;
+    const el2 = axnl * axnl + aynl * aynl;
+    const pl = am * (1.0 - el2);
+    if (pl < 0.0) {
+      throw new Error('Orbit has decayed.');
+    }
+    const rl = am * (1.0 - ecose);
+    const betal = Math.sqrt(1.0 - el2);
+    temp = esine / (1.0 + betal);
+    const sinu = am / rl * (sineo1 - aynl - axnl * temp);
+    const cosu = am / rl * (coseo1 - axnl + aynl * temp);
+    let su = Math.atan2(sinu, cosu);
+    const sin2u = (cosu + cosu) * sinu;
+    const cos2u = 1.0 - 2.0 * sinu * sinu;
+    temp = 1.0 / pl;
+    const temp1 = 0.5 * J2 * temp;
+    const temp2 = temp1 * temp;
+
+    const mrt = rl * (1.0 - 1.5 * temp2 * betal * this.con41) + 0.5 * temp1 * this.x1mth2 * cos2u;
+    su = su - 0.25 * temp2 * this.x7thm1 * sin2u;
+    const xnode = nodem + 1.5 * temp2 * cosip * sin2u;
+    const xinc = this.inclo + 1.5 * temp2 * cosip * sinip * cos2u;
+
+    // Orientation vectors, scaled to km.
+    const sinsu = Math.sin(su);
+    const cossu = Math.cos(su);
+    const snod = Math.sin(xnode);
+    const cnod = Math.cos(xnode);
+    const sini = Math.sin(xinc);
+    const cosi = Math.cos(xinc);
+    const xmx = -snod * cosi;
+    const xmy = cnod * cosi;
+    const scale = mrt * EARTH_RADIUS_KM;
+    return [
+      (xmx * sinsu + cnod * cossu) * scale,
+      (xmy * sinsu + snod * cossu) * scale,
+      sini * sinsu * scale
+    ];
+  }
+
+  // Latitude and longitude (degrees) of the point on the ground below the
+  // satellite at a time in ms since 1970.
+  subpoint(ms) {
+    const [x, y, z] = this.propagate((ms - this.epochMs) / 60000);
+    let lon = Math.atan2(y, x) / DEG - siderealDegrees(ms);
+    lon = ((lon + 540.0) % 360.0 + 360.0) % 360.0 - 180.0;
+
+    // Geodetic latitude, a few iterations is plenty.
+    const r = Math.sqrt(x * x + y * y);
+    const e2 = FLATTENING * (2.0 - FLATTENING);
+    let lat = Math.atan2(z, r);
+    for (let i = 0; i < 3; i++) {
+      const sinLat = Math.sin(lat);
+      const c = 1.0 / Math.sqrt(1.0 - e2 * sinLat * sinLat);
+      lat = Math.atan2(z + EARTH_RADIUS_KM * c * e2 * sinLat, r);
+    }
+
+    return { latitude: lat / DEG, longitude: lon };
+  }
+
+  // Age of the TLE in days at a time in ms since 1970.
+  age(ms) {
+    return (ms - this.epochMs) / MS_PER_DAY;
+  }
+}
+
+// Reads a TLE from text with an optional name line, returns a Satellite or
+// null if no valid TLE was found.
+function parseTle(text) {
+  const lines = text.split('\n').map(line => line.trim()).filter(line => line);
+
+  for (let i = 0; i < lines.length - 1; i++) {
+    if (lines[i].startsWith('1 ') && lines[i + 1].startsWith('2 ')) {
+      try {
+        return new Satellite(lines[i], lines[i + 1]);
+      } catch (e) {
+        return null;
+      }
+    }
+  }
+
+  return null;
+}
+
+module.exports = { Satellite, parseTle, siderealDegrees };
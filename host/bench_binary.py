@@ -0,0 +1,77 @@
+# Compares decoding the backend's JSON response, as main.py used to with
+# urequests' .json(), against decoding the compact binary response from
+# a preallocated buffer with issclient.decode_iss_data(), for time and
+# peak memory allocated per decode.
+#
+# Usage: python host/bench_binary.py [iterations]
+import json
+import struct
+import sys
+import time
+import tracemalloc
+
+import shims
+
+shims.install()
+
+import issclient
+
+# Typical responses from the backend, over land and over the ocean.
+RESPONSES = (
+    {"lat": 52.9539, "lon": -1.1505, "dist": 58, "units": "mi", "country": "UK", "locality": "Nottingham",
+     "region": "England", "updatedAt": "Mon 02 Jan 3:04pm UTC", "timestamp": 1704207840000},
+    {"lat": -41.2868, "lon": -132.4317, "dist": 10874, "units": "mi", "ocean": "South Pacific Ocean",
+     "updatedAt": "Mon 02 Jan 3:09pm UTC", "timestamp": 1704208140000},
+)
+EPOCH_2000_MS = 946684800000
+
+
+# Same encoding as encodeBinary() in the cloud function.
+def encode_binary(response):
+    field_mask = 0
+    strings = b""
+    for bit, field in enumerate(issclient.BINARY_FIELDS):
+        if response.get(field):
+            value = response[field].encode()[:255]
+            field_mask |= 1 << bit
+            strings += bytes([len(value)]) + value
+    seconds = (response["timestamp"] - EPOCH_2000_MS) // 1000
+    return struct.pack(issclient.BINARY_HEADER, issclient.BINARY_VERSION, field_mask,
+                       response["lat"], response["lon"], response["dist"], seconds) + strings
+
+
+def measure(name, sizes, iterations, decode):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    decode()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"{name:7} {sizes:>12} {elapsed / iterations * 1e6:8.2f}us/decode {peak:7} bytes peak")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    buffer = bytearray(512)
+
+    for response in RESPONSES:
+        body = json.dumps(response, separators=(",", ":")).encode()
+        binary = encode_binary(response)
+        where = response.get("ocean") or response.get("locality")
+        print(f"{where}:")
+
+        # urequests' .json() decodes the body, as bytes, with json.loads().
+        measure("json", f"{len(body)} bytes", iterations, lambda: json.loads(body))
+
+        buffer[:len(binary)] = binary
+        decoded = issclient.decode_iss_data(buffer, len(binary))
+        assert abs(decoded["lat"] - response["lat"]) < 1e-4 and decoded["dist"] == response["dist"]
+        measure("binary", f"{len(binary)} bytes", iterations, lambda: issclient.decode_iss_data(buffer, len(binary)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Fetches a binary ISS response repeatedly from a local keep-alive HTTP
+# server, opening a new connection for every request (as urequests did)
+# and with issclient.Client's persistent connection, and reports the time
+# per request and how many connections were made.  The server drops idle
+# connections every so often, to check that Client reconnects.
+#
+# Over the internet each new connection also costs a DNS lookup and a TLS
+# handshake (hundreds of ms on a Pico W), which this doesn't include.
+#
+# Usage: python host/bench_client.py [requests]
+import asyncio
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import shims
+
+shims.install()
+
+import issclient
+
+BODY = bytes.fromhex("010500004e428fc2f5bd7b0000bd242d064c6f6e646f6e02554b")
+# The server closes the connection after this many requests on it.
+REQUESTS_PER_CONNECTION = 25
+
+connections = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send the headers and body without waiting, like a real server would.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        global connections
+        connections += 1
+        self.served = 0
+        super().setup()
+
+    def do_GET(self):
+        self.served += 1
+        self.send_response(200)
+        self.send_header("Content-Type", issclient.BINARY_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+        if self.served >= REQUESTS_PER_CONNECTION:
+            # Close without telling the client, like an idle timeout.
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(name, url, count, get):
+    global connections
+    connections = 0
+    buffer = bytearray(512)
+    start = time.perf_counter()
+    for _ in range(count):
+        length = await get(url, buffer)
+        assert issclient.decode_iss_data(buffer, length)["locality"] == "London"
+    elapsed = time.perf_counter() - start
+    print(f"{name:10} {elapsed / count * 1000:6.3f}ms/request, {connections} connections for {count} requests")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_port}/isslocator?lat=52.9&lng=-1.1"
+
+    client = issclient.Client()
+    asyncio.run(run("new each", url, count, issclient.fetch_into))
+    asyncio.run(run("persistent", url, count, client.get_into))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Replays a burst of the DNS queries phones send when they join the
+# "ISSTracker" access point (connectivity checks for A, AAAA and HTTPS
+# records, with EDNS options) at phew's catch all DNS responder over UDP
+# on localhost, and at the original responder, and reports replies/s.
+#
+# Usage: python host/bench_dns.py [bursts]
+import socket
+import struct
+import sys
+import time
+
+import shims
+
+shims.install()
+
+from phew import dns
+
+IP_ADDRESS = "192.168.4.1"
+PROBE_NAMES = (
+    "connectivitycheck.gstatic.com", "www.google.com", "clients3.google.com",
+    "captive.apple.com", "www.apple.com", "gsp1.apple.com",
+    "www.msftconnecttest.com", "dns.msftncsi.com", "isstracker.net",
+    "detectportal.firefox.com", "mask.icloud.com", "time.android.com",
+)
+# A, AAAA and HTTPS (SVCB) queries, as sent by current iOS and Android.
+QUERY_TYPES = (1, 28, 65)
+
+
+def query(query_id, name, query_type):
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 1)
+    question = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+    question += struct.pack(">HH", query_type, 1)
+    edns = b"\x00\x00\x29\x05\xc0\x00\x00\x00\x00\x00\x00"
+    return header + question + edns
+
+
+def captured_burst():
+    queries = []
+    query_id = 1
+    for name in PROBE_NAMES:
+        for query_type in QUERY_TYPES:
+            queries.append(query(query_id, name, query_type))
+            query_id += 1
+    return queries
+
+
+# The original phew handler: an A record for everything, built by
+# concatenation, echoing back the whole request including EDNS options.
+def original_reply(sock, request, client, ip_address):
+    response = request[:2]
+    response += b"\x81\x80"
+    response += request[4:6] + request[4:6]
+    response += b"\x00\x00\x00\x00"
+    response += request[12:]
+    response += b"\xC0\x0C"
+    response += b"\x00\x01\x00\x01"
+    response += b"\x00\x00\x00\x3C"
+    response += b"\x00\x04"
+    response += bytes(map(int, ip_address.split(".")))
+    sock.sendto(response, client)
+    return True
+
+
+def replay(name, burst, bursts, handle):
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    replies = 0
+    answers = 0
+    start = time.perf_counter()
+    for _ in range(bursts):
+        for packet in burst:
+            client.sendto(packet, server.getsockname())
+            if handle(server):
+                replies += 1
+                reply = client.recv(512)
+                answers += struct.unpack_from(">H", reply, 6)[0]
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:9} {replies} replies ({answers} A answers) to {bursts * len(burst)} queries in {elapsed * 1000:7.1f}ms ({replies / elapsed:8.0f} replies/s)")
+    server.close()
+    client.close()
+
+
+def main():
+    bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    burst = captured_burst()
+    answer = dns._answer_for(IP_ADDRESS)
+    request = bytearray(512)
+    response = bytearray(512)
+
+    def original(server):
+        data, client = server.recvfrom(512)
+        return original_reply(server, data, client, IP_ADDRESS)
+
+    def precomputed(server):
+        length, client = server.recvfrom_into(request)
+        return dns._reply(server, request, length, client, response, answer)
+
+    replay("original", burst, bursts, original)
+    # throughput without the rate limiter getting in the way
+    dns.set_rate_limit(1000000, 1000000)
+    replay("phew", burst, bursts, precomputed)
+    # and what a single phone flooding the access point gets through
+    dns.set_rate_limit(20, 40)
+    dns._clients.clear()
+    replay("limited", burst, bursts, precomputed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Measures phew.server throughput with a local asyncio client, first
+# opening a new connection for every request and then sending them all
+# over one persistent (keep-alive) connection.
+#
+# Usage: python host/bench_keepalive.py [requests]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import shims
+
+shims.install()
+# phew logs every request to log.txt in the working directory
+os.chdir(tempfile.mkdtemp())
+
+from phew import logging, server
+
+logging.disable_logging_types(logging.LOG_INFO)
+
+
+@server.route("/", methods=["GET"])
+def index(request):
+    return "<html><body>ISS Tracker</body></html>"
+
+
+@server.route("/page", methods=["GET"])
+def page(request):
+    def body():
+        yield "<html><body>"
+        yield "ISS Tracker"
+        yield "</body></html>"
+    return body()
+
+
+async def read_response(reader):
+    headers = {}
+    status_line = await reader.readline()
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, value = line.decode().strip().split(": ", 1)
+        headers[name.lower()] = value
+
+    if status_line.split()[1] in (b"204", b"304"):
+        body = b""
+    elif headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+    return status_line, headers, body
+
+
+async def without_keep_alive(port, path, count):
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+        await read_response(reader)
+        writer.close()
+        await writer.wait_closed()
+
+
+async def with_keep_alive(port, path, count):
+    server.set_keep_alive(max_requests=count + 1)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(count):
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        status_line, headers, body = await read_response(reader)
+        if headers["connection"] != "keep-alive":
+            sys.exit("server closed the persistent connection")
+    writer.close()
+    await writer.wait_closed()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    listener = await asyncio.start_server(server._handle_request, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    for path in ("/", "/page"):
+        for name, client in (("close", without_keep_alive), ("keep-alive", with_keep_alive)):
+            start = time.perf_counter()
+            await client(port, path, count)
+            elapsed = time.perf_counter() - start
+            print(f"{path:6} {name:11} {count} requests in {elapsed * 1000:8.1f}ms ({count / elapsed:8.0f} req/s)")
+
+    listener.close()
+    await listener.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
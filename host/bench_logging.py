@@ -0,0 +1,90 @@
+# Logs 10,000 entries with phew's buffered, segmented logger and with the
+# original logger, which opened, appended to and stat'ed log.txt for every
+# entry and rewrote the whole file to truncate it.
+#
+# Usage: python host/bench_logging.py [entries]
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+
+import shims
+
+shims.install()
+os.chdir(tempfile.mkdtemp())
+
+from phew import logging
+
+
+# The original phew truncate(): copies the end of the log into a new file.
+def truncate(file, target_size):
+    discard = logging.file_size(file) - target_size
+    if discard <= 0:
+        return
+
+    with open(file, "rb") as infile:
+        with open(file + ".tmp", "wb") as outfile:
+            while discard > 0:
+                chunk = infile.read(1024)
+                discard -= len(chunk)
+
+            break_position = max(chunk.find(b"\n", -discard), chunk.rfind(b"\n", -discard))
+            if break_position != -1:
+                outfile.write(chunk[break_position + 1:])
+
+            while True:
+                chunk = infile.read(1024)
+                if not chunk:
+                    break
+                outfile.write(chunk)
+
+    os.remove(file)
+    os.rename(file + ".tmp", file)
+
+
+# The original phew log(): one open/write/close plus a stat per entry.
+def unbuffered_log(level, text):
+    datetime = logging.datetime_string()
+    log_entry = "{0} [{1:8} /{2:>4}kB] {3}".format(datetime, level, round(gc.mem_free() / 1024), text)
+    print(log_entry)
+    with open(logging.log_file, "a") as logfile:
+        logfile.write(log_entry + '\n')
+
+    if logging.file_size(logging.log_file) > 11 * 1024:
+        truncate(logging.log_file, 8 * 1024)
+
+
+def bench(name, log, entries):
+    for segment in os.listdir("."):
+        os.remove(segment)
+    logging._log_size = None
+
+    start = time.perf_counter()
+    # the device prints each entry to the usb serial port, don't time the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(entries):
+            log("info", f"> GET /generate_204 (302 Found) [{i % 40}ms]")
+        logging.flush()
+    elapsed = time.perf_counter() - start
+
+    size = sum(os.stat(segment).st_size for segment in os.listdir("."))
+    print(f"{name:10} {entries} entries in {elapsed * 1000:8.1f}ms ({elapsed / entries * 1e6:6.1f}us/entry), log is {size} bytes")
+    return elapsed
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    unbuffered = bench("unbuffered", unbuffered_log, entries)
+    buffered = bench("buffered", logging.log, entries)
+    print(f"speedup    {unbuffered / buffered:.2f}x")
+
+    start = time.perf_counter()
+    lines = logging.tail(20)
+    print(f"tail(20)   {(time.perf_counter() - start) * 1e6:.0f}us, last line: {lines[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Projects 10,000 random lat/lon points onto the world map with the
+# original per point arithmetic from main.py, with projection.py's lookup
+# tables one point at a time and in a batch, and reports how far the
+# lookup table positions are from the original ones.  These are CPython's
+# times, so compare them with each other: on the Badger 2040 W's single
+# precision floats the arithmetic costs relatively more.
+#
+# Usage: python host/bench_projection.py [points]
+import random
+import sys
+import time
+from array import array
+
+import shims
+
+shims.install()
+
+import projection
+
+MAP_IMAGE_HEIGHT = 128
+MAP_IMAGE_WIDTH = 192
+MAP_LEFT_OFFSET = 296 - MAP_IMAGE_WIDTH
+MAP_TOP_OFFSET = 0
+EQUATOR_Y = MAP_IMAGE_HEIGHT // 2
+MERIDIAN_X = MAP_IMAGE_WIDTH // 2
+
+
+# The original projection from update_iss_position.
+def original_project(lat, lon):
+    meridian_offset_px = abs(lon) * (MAP_IMAGE_WIDTH / 360)
+    x = (round(MERIDIAN_X - meridian_offset_px if lon < 0 else MERIDIAN_X + meridian_offset_px)) + MAP_LEFT_OFFSET
+    equator_offset_px = abs(lat) * (MAP_IMAGE_HEIGHT / 180)
+    y = (round(EQUATOR_Y - equator_offset_px if lat >= 0 else EQUATOR_Y + equator_offset_px)) + MAP_TOP_OFFSET
+    return x, y
+
+
+def timed(name, count, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:12} {elapsed * 1000:7.2f}ms ({count / elapsed:10.0f} points/s)")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(1)
+    lats = array("f", (random.uniform(-90, 90) for _ in range(count)))
+    lons = array("f", (random.uniform(-180, 180) for _ in range(count)))
+
+    start = time.perf_counter()
+    world_map = projection.Equirectangular(MAP_LEFT_OFFSET, MAP_TOP_OFFSET, MAP_IMAGE_WIDTH, MAP_IMAGE_HEIGHT)
+    table_bytes = len(world_map.x_table) * world_map.x_table.itemsize + len(world_map.y_table) * world_map.y_table.itemsize
+    print(f"{'tables':12} {(time.perf_counter() - start) * 1000:7.2f}ms to build ({table_bytes} bytes)")
+
+    expected = timed("original", count, lambda: [original_project(lats[i], lons[i]) for i in range(count)])
+    single = timed("project", count, lambda: [world_map.project(lats[i], lons[i]) for i in range(count)])
+    xs, ys = timed("project_many", count, lambda: world_map.project_many(lats, lons))
+
+    # The original puts 180 degrees east one pixel off the right of the map,
+    # the tables wrap it round to the left edge, so compare modulo the width.
+    def error(a, b):
+        dx = abs(a[0] - b[0]) % MAP_IMAGE_WIDTH
+        return max(min(dx, MAP_IMAGE_WIDTH - dx), abs(a[1] - b[1]))
+
+    errors = [error(e, s) for e, s in zip(expected, single)]
+    print(f"project: max error {max(errors)}px, {sum(1 for e in errors if e) * 100 / count:.1f}% of points differ "
+          f"({world_map.lon_steps} steps per degree of longitude, {world_map.lat_steps} of latitude)")
+    assert all(single[i] == (xs[i], ys[i]) for i in range(count)), "project_many doesn't match project"
+
+
+if __name__ == "__main__":
+    main()
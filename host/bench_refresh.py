@@ -0,0 +1,104 @@
+# Benchmarks main.update_iss_position() over hundreds of ISS positions
+# along a real orbit, with the history drawn as dots and as a track, and
+# reports per refresh:
+#   - time, and the part of it outside the (C on the device) draw calls
+#   - memory allocated: the peak during the refresh, and what it left
+#     allocated afterwards
+#   - how much of the screen was updated, and how often fully
+#   - the average time and allocation of each stage, from main.py's own
+#     metrics (see metrics.py).
+#
+# Allocation sizes are CPython's, several times MicroPython's, so compare
+# them between runs rather than with the Pico's heap.
+#
+# Usage: python host/bench_refresh.py [positions] [history size]
+import statistics
+import sys
+import time
+import tracemalloc
+
+import harness
+import history
+
+# Seconds between positions, the default POSITION_INTERVAL.
+INTERVAL = 30
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def run(device, style, all_iss_data, history_size):
+    device.config.HISTORY_STYLE = style
+    device.location_history = history.History(history_size)
+    device.last_frame = None
+    device.partial_updates = 0
+    screen = device.display.display
+
+    times = []
+    outside_draw_times = []
+    peaks = []
+    retained = []
+    updated_area = 0
+    full_updates = 0
+
+    for n, iss_data in enumerate(all_iss_data):
+        # Every other position is from the backend, so the history grows.
+        add_to_history = n % 2 == 0
+        draw_seconds = screen.draw_seconds
+        updates = len(screen.updates)
+
+        start = time.perf_counter()
+        device.update_iss_position(iss_data, add_to_history)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        outside_draw_times.append(elapsed - (screen.draw_seconds - draw_seconds))
+
+        for _, kind, (x, y, w, h), _ in screen.updates[updates:]:
+            updated_area += w * h
+            full_updates += kind == "update"
+
+    # Again, measuring allocations this time (which slows it down), without
+    # the stand-in display keeping a record of the updates.
+    device.location_history = history.History(history_size)
+    device.last_frame = None
+    screen.recording = False
+    device.refresh_metrics.clear()
+    tracemalloc.start()
+    for n, iss_data in enumerate(all_iss_data):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        device.update_iss_position(iss_data, n % 2 == 0)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+    screen.recording = True
+
+    count = len(all_iss_data)
+    ms = [t * 1000 for t in times]
+    outside_draw_ms = [t * 1000 for t in outside_draw_times]
+    print(f"{style}, {count} refreshes, history of {history_size}:")
+    print(f"  time          mean {statistics.mean(ms):7.3f}ms  p50 {percentile(ms, 50):7.3f}ms  p99 {percentile(ms, 99):7.3f}ms  max {max(ms):7.3f}ms")
+    print(f"  outside draws mean {statistics.mean(outside_draw_ms):7.3f}ms  p50 {percentile(outside_draw_ms, 50):7.3f}ms  p99 {percentile(outside_draw_ms, 99):7.3f}ms  max {max(outside_draw_ms):7.3f}ms")
+    print(f"  peak heap     mean {statistics.mean(peaks) / 1024:7.1f}KB  p99 {percentile(peaks, 99) / 1024:7.1f}KB  max {max(peaks) / 1024:7.1f}KB")
+    print(f"  retained      mean {statistics.mean(retained):7.0f}B   total {sum(retained) / 1024:.1f}KB")
+    stages = device.refresh_metrics.summary()["stages"]
+    print("  stages        " + ", ".join(f"{stage} {values['time_us']['avg']}us {values['allocated']['avg']}B" for stage, values in stages.items()))
+    print(f"  screen        {full_updates} full updates, {updated_area / count / (device.badger2040.WIDTH * device.badger2040.HEIGHT) * 100:.1f}% of the screen updated per refresh on average")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    history_size = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    harness.flash_dir()
+    device = harness.import_main(quiet=True)
+    all_iss_data = list(harness.positions(count, INTERVAL))
+    for style in ("dots", "track"):
+        run(device, style, all_iss_data, history_size)
+
+
+if __name__ == "__main__":
+    main()
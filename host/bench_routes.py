@@ -0,0 +1,104 @@
+# Compares phew's route table lookups against the original linear scan of
+# every route, with a few hundred routes registered.  Most of the requests
+# are captive portal probes that match nothing and fall through to the
+# catch all handler.
+#
+# Usage: python host/bench_routes.py [iterations]
+import sys
+import time
+
+import shims
+
+shims.install()
+
+from phew import server
+
+
+# The original phew matcher: try every route in turn, most complex first.
+class LinearRoute:
+    def __init__(self, path, handler, methods):
+        self.path_parts = path.split("/")
+        self.handler = handler
+        self.methods = methods
+
+    def matches(self, request):
+        if request.method not in self.methods:
+            return False
+        compare_parts = request.path.split("/")
+        if len(compare_parts) != len(self.path_parts):
+            return False
+        for part, compare in zip(self.path_parts, compare_parts):
+            if not part.startswith("<") and part != compare:
+                return False
+        return True
+
+    def call_handler(self, request):
+        parameters = {}
+        for part, compare in zip(self.path_parts, request.path.split("/")):
+            if part.startswith("<"):
+                parameters[part[1:-1]] = compare
+        return self.handler(request, **parameters)
+
+
+def handler(request, **parameters):
+    return parameters
+
+
+def catch_all(request):
+    return "Not found.", 404
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    linear_routes = []
+
+    for i in range(150):
+        paths = [
+            (f"/static/page{i}", ["GET"]),
+            (f"/api/v1/item{i}/<id>", ["GET", "POST"]),
+        ]
+        for path, methods in paths:
+            server.add_route(path, handler, methods)
+            linear_routes.append(LinearRoute(path, handler, methods))
+    linear_routes.sort(key=lambda route: len(route.path_parts), reverse=True)
+
+    requests = [
+        server.Request("GET", path, "HTTP/1.1") for path in (
+            "/generate_204", "/hotspot-detect.html", "/connecttest.txt",
+            "/ncsi.txt", "/success.txt", "/static/page75", "/api/v1/item120/42",
+        )
+    ]
+
+    def linear(request):
+        for route in linear_routes:
+            if route.matches(request):
+                return route.call_handler(request)
+        return catch_all(request)
+
+    def table(request):
+        request.path_parts = None
+        route, routes = server._match_route(request)
+        if route:
+            return route.call_handler(request)
+        return catch_all(request)
+
+    for request in requests:
+        if linear(request) != table(request):
+            sys.exit(f"route mismatch for {request.path}")
+
+    for name, dispatch in (("linear scan", linear), ("route table", table)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for request in requests:
+                dispatch(request)
+        elapsed = time.perf_counter() - start
+        count = iterations * len(requests)
+        print(f"{name:12} {count} requests in {elapsed * 1000:8.1f}ms ({elapsed / count * 1e6:6.2f}us/request)")
+
+    post = server.Request("POST", "/static/page3", "HTTP/1.1")
+    route, routes = server._match_route(post)
+    print(f"POST /static/page3 -> {'405, Allow: ' + ', '.join(routes) if routes and not route else route}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Compares rendering templates/index.html with the compiled, cached
+# template engine against the original interpret-every-request approach.
+#
+# Usage: python host/bench_templates.py [iterations]
+import os
+import sys
+import time
+
+import shims
+
+shims.install()
+os.chdir(shims.BADGER_DIR)
+
+from phew import template
+
+
+# The original phew renderer: reads and scans the file, and evals every
+# expression from source, on every render.
+def interpreted_render(path, **kwargs):
+    with open(path, "rb") as f:
+        data = f.read()
+        token_caret = 0
+
+        while True:
+            start = data.find(b"{{", token_caret)
+            end = data.find(b"}}", start)
+
+            if start == -1 or end == -1:
+                yield data[token_caret:]
+                break
+
+            expression = data[start + 2:end].strip()
+            yield data[token_caret:start]
+
+            params = {}
+            params.update(locals())
+            params.update(kwargs)
+
+            try:
+                if expression.decode("utf-8") in params:
+                    result = template._escape(str(params[expression.decode("utf-8")]))
+                else:
+                    result = eval(expression, {"render_template": interpreted_render}, params)
+
+                if type(result).__name__ == "generator":
+                    for chunk in result:
+                        yield chunk
+                elif result is not None:
+                    yield str(result)
+            except:
+                pass
+
+            token_caret = end + 2
+
+
+def render(renderer, **kwargs):
+    out = bytearray()
+    for chunk in renderer("templates/index.html", **kwargs):
+        out += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    return bytes(out)
+
+
+def bench(name, renderer, iterations, **kwargs):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render(renderer, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{name:12} {iterations} renders in {elapsed * 1000:8.1f}ms ({elapsed / iterations * 1e6:8.1f}us/render)")
+    return elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    wifis = [(f"Network {i:02}", -40 - i) for i in range(50)]
+    kwargs = {"lat": "52.953384", "lng": "-1.1505282", "loc": "Nottingham England", "wifis": wifis}
+
+    if render(interpreted_render, **kwargs) != render(template.render_template, **kwargs):
+        sys.exit("compiled and interpreted output differ")
+
+    interpreted = bench("interpreted", interpreted_render, iterations, **kwargs)
+    compiled = bench("compiled", template.render_template, iterations, **kwargs)
+    print(f"speedup      {interpreted / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
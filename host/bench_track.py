@@ -0,0 +1,73 @@
+# Checks ground track mode (config.TRACK_MINUTES): builds a track along a
+# real orbit as the cloud function does, sends it through the binary
+# format to issclient, then compares the position interpolated from it
+# every second with SGP4's, and reports:
+#   - the response size and how long decoding it takes
+#   - how far out the interpolated position is, in miles and map pixels
+#   - how long working out a position takes, from the track and from the
+#     TLE (CPython's times, so compare them with each other)
+#   - how often the backend is asked, with and without a track.
+#
+# Usage: python host/bench_track.py [track minutes] [step seconds]
+import statistics
+import sys
+import time
+
+import harness
+import issclient
+import orbit
+import projection
+
+# Defaults in config.py.
+REFRESH_INTERVAL = 300
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 95
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    device = harness.import_main(quiet=True)
+
+    satellite = orbit.Satellite(*harness.recent_tle())
+    start = orbit.now()
+    response = harness.iss_response(satellite, start, harness.LATITUDE, harness.LONGITUDE)
+    response["track"] = harness.iss_track(satellite, start, harness.LATITUDE, harness.LONGITUDE, minutes, step)
+    body = bytearray(harness.encode_binary(response))
+
+    decode_start = time.perf_counter()
+    track = issclient.decode_iss_data(body, len(body))["track"]
+    decode_time = time.perf_counter() - decode_start
+
+    world_map = projection.Equirectangular(0, 0, device.MAP_IMAGE_WIDTH, device.MAP_IMAGE_HEIGHT)
+    errors = []
+    pixel_errors = []
+    dist_errors = []
+    track_time = 0.0
+    orbit_time = 0.0
+    for seconds in range(track.start, track.end() + 1):
+        t = time.perf_counter()
+        lat, lon, dist = track.position(seconds)
+        track_time += time.perf_counter() - t
+
+        t = time.perf_counter()
+        iss_lat, iss_lon = satellite.subpoint(seconds)
+        orbit_time += time.perf_counter() - t
+
+        errors.append(orbit.distance(lat, lon, iss_lat, iss_lon))
+        x, y = world_map.project(lat, lon)
+        iss_x, iss_y = world_map.project(iss_lat, iss_lon)
+        # Either side of the map edge is one pixel apart, not the map width.
+        dx = abs(x - iss_x)
+        pixel_errors.append(max(min(dx, device.MAP_IMAGE_WIDTH - dx), abs(y - iss_y)))
+        dist_errors.append(abs(dist - orbit.distance(harness.LATITUDE, harness.LONGITUDE, iss_lat, iss_lon)))
+    count = track.end() - track.start + 1
+
+    track_seconds = track.end() - track.start - device.TRACK_REFETCH_MARGIN
+    print(f"track   {len(track)} points {step}s apart, {len(body)} byte response, decoded in {decode_time * 1000:.3f}ms")
+    print(f"error   mean {statistics.mean(errors):.2f} miles, max {max(errors):.2f} miles, max {max(pixel_errors)} pixels")
+    print(f"dist    mean {statistics.mean(dist_errors):.1f} miles out, max {max(dist_errors):.1f} miles")
+    print(f"time    {track_time / count * 1000000:.1f}us a position from the track, {orbit_time / count * 1000000:.1f}us from the TLE")
+    print(f"backend {86400 / REFRESH_INTERVAL:.0f} requests a day every REFRESH_INTERVAL, {86400 / max(REFRESH_INTERVAL, track_seconds):.1f} with a track")
+
+
+if __name__ == "__main__":
+    main()
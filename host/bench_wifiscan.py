@@ -0,0 +1,72 @@
+# Simulates scanning for WiFi networks in setup mode somewhere busy, with
+# dozens of access points (several per network) whose signal strength
+# varies from scan to scan and some of which come and go, and reports how
+# long wifiscan.NetworkList takes to merge each scan, and how the list it
+# keeps compares to the networks actually in range.
+#
+# Usage: python host/bench_wifiscan.py [networks] [scans]
+import random
+import sys
+import time
+
+import shims
+
+shims.install()
+
+import wifiscan
+
+# Seconds between scans, as WIFI_SCAN_INTERVAL in main.py.
+INTERVAL = 15
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    random.seed(1)
+
+    # (ssid, typical rssi, how many access points), with some hidden ones.
+    networks = [(f"Network {n}".encode() if n % 10 else b"", random.randint(-90, -35), random.randint(1, 3)) for n in range(count)]
+    network_list = wifiscan.NetworkList()
+    merge_times = []
+    wrong_order = 0
+    missing = 0
+    stale = 0
+
+    for scan in range(scans):
+        # A scan misses some access points, and networks switch off and on
+        # for a few minutes at a time.
+        results = []
+        in_range = {}
+        for n, (ssid, rssi, access_points) in enumerate(networks):
+            if (scan // 20 + n) % 7 == 0:
+                continue
+            for _ in range(access_points):
+                if random.random() < 0.8:
+                    reading = rssi + random.randint(-8, 8)
+                    results.append((ssid, bytes(6), 6, reading, 3, False))
+                    if ssid:
+                        in_range[ssid.decode()] = max(reading, in_range.get(ssid.decode(), -1000))
+
+        start = time.perf_counter()
+        network_list.merge(results, scan * INTERVAL * 1000)
+        merge_times.append(time.perf_counter() - start)
+
+        listed = network_list.strongest()
+        assert len(listed) <= network_list.capacity
+        wrong_order += any(listed[i][1] < listed[i + 1][1] for i in range(len(listed) - 1))
+        # Of the strongest networks in range, how many aren't listed.
+        strongest = sorted(in_range, key=in_range.get, reverse=True)[:network_list.capacity // 2]
+        listed_ssids = {ssid for ssid, _ in listed}
+        missing += sum(1 for ssid in strongest if ssid not in listed_ssids)
+        # Listed networks that weren't in range this time, until they age out.
+        stale += sum(1 for ssid in listed_ssids if ssid not in in_range)
+
+    print(f"{count} networks, {scans} scans, keeping up to {network_list.capacity}")
+    print(f"merge   mean {sum(merge_times) / scans * 1000:.3f}ms, max {max(merge_times) * 1000:.3f}ms")
+    print(f"listed  {len(network_list.strongest())} networks, out of order {wrong_order} times")
+    print(f"missing {missing / scans:.2f} of the strongest {network_list.capacity // 2} networks in range per scan on average")
+    print(f"stale   {stale / scans:.2f} listed networks not in range per scan on average")
+
+
+if __name__ == "__main__":
+    main()
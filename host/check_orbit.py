@@ -0,0 +1,101 @@
+# Validates badger2040w/orbit.py against a reference SGP4 propagation:
+# Vallado's published verification vectors for satellite 00005 and, if
+# the sgp4 package is installed (pip install sgp4), its propagation of an
+# ISS TLE over a day, including the ground track.
+#
+# Usage: python host/check_orbit.py
+import math
+import sys
+
+import shims
+
+shims.install()
+
+import orbit
+
+VERIFICATION_TLE = (
+    "1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753",
+    "2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667",
+)
+# From tcppver.out in "Revisiting Spacetrack Report #3": minutes since
+# epoch and TEME position in km.
+VERIFICATION_VECTORS = (
+    (0.0, (7022.46529266, -1400.08296755, 0.03995155)),
+    (360.0, (-7154.03120202, -3783.17682504, -3536.19412294)),
+)
+ISS_TLE = (
+    "1 25544U 98067A   24001.50000000  .00016717  00000-0  30306-3 0  9995",
+    "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391 14100",
+)
+
+
+def check(name, error, tolerance, unit):
+    status = "ok" if error <= tolerance else "FAIL"
+    print(f"{status:4} {name}: max error {error:.6f}{unit} (tolerance {tolerance}{unit})")
+    return error <= tolerance
+
+
+def distance_km(a, b):
+    return math.sqrt(sum((p - q) ** 2 for p, q in zip(a, b)))
+
+
+def reference_geodetic(r, gmst):
+    x, y, z = r
+    lon = math.degrees(math.atan2(y, x) - gmst)
+    lon = (lon + 540.0) % 360.0 - 180.0
+    e2 = orbit.FLATTENING * (2 - orbit.FLATTENING)
+    p = math.hypot(x, y)
+    lat = math.atan2(z, p * (1 - e2))
+    for _ in range(20):
+        n = orbit.EARTH_RADIUS_KM / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+        lat = math.atan2(z + n * e2 * math.sin(lat), p)
+    return math.degrees(lat), lon
+
+
+def main():
+    ok = True
+
+    satellite = orbit.Satellite(*VERIFICATION_TLE)
+    error = max(distance_km(satellite.propagate(t), r) for t, r in VERIFICATION_VECTORS)
+    ok &= check("00005 against Vallado's vectors", error, 1e-3, "km")
+
+    try:
+        from sgp4.api import Satrec, WGS72
+        from sgp4.propagation import gstime
+    except ImportError:
+        print("skip ISS checks, sgp4 package not installed")
+        sys.exit(0 if ok else 1)
+
+    satellite = orbit.Satellite(*ISS_TLE)
+    reference = Satrec.twoline2rv(*ISS_TLE, WGS72)
+
+    position_error = 0
+    track_error = 0
+    distance_error = 0
+    start = satellite.epoch()
+    for seconds in range(start, start + orbit.SECONDS_PER_DAY, 60):
+        t = satellite.minutes_since_epoch(seconds)
+        error, r, v = reference.sgp4_tsince(t)
+        position_error = max(position_error, distance_km(satellite.propagate(t), r))
+
+        jd = 2451545.0 + (seconds - orbit.SECONDS_PER_DAY // 2) / orbit.SECONDS_PER_DAY
+        reference_lat, reference_lon = reference_geodetic(r, gstime(jd))
+        lat, lon = satellite.subpoint(seconds)
+        lon_error = abs((lon - reference_lon + 180) % 360 - 180)
+        track_error = max(track_error, abs(lat - reference_lat), lon_error)
+
+        # Against the flat formula the haversine package uses.
+        miles = orbit.distance(52.953384, -1.1505282, lat, lon)
+        d_lat = math.radians(lat - 52.953384)
+        d_lon = math.radians(lon + 1.1505282)
+        a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(52.953384)) * math.cos(math.radians(lat)) * math.sin(d_lon / 2) ** 2
+        distance_error = max(distance_error, abs(miles - 3960 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))))
+
+    ok &= check("ISS position over a day against sgp4", position_error, 1e-3, "km")
+    ok &= check("ISS ground track over a day against sgp4", track_error, 1e-3, "deg")
+    ok &= check("distance against haversine", distance_error, 1e-6, "mi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
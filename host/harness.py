@@ -0,0 +1,223 @@
+# Runs badger2040w/main.py under CPython: the device modules come from
+# shims.install_device(), and StubBackend stands in for the iss-locator
+# cloud function and the TLE download, with the ISS moving along a real
+# orbit.  Used by run_main.py, bench_refresh.py and bench_track.py.
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import shims
+
+shims.install_device()
+
+import config
+import groundtrack
+import issclient
+import orbit
+
+# An ISS TLE, given a recent epoch by recent_tle() so the orbit is current.
+ISS_TLE = (
+    "1 25544U 98067A   24001.50000000  .00016717  00000-0  30306-3 0  9995",
+    "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391 14100",
+)
+# Place names the backend gives, by longitude band.
+PLACES = (
+    (-180, {"ocean": "North Pacific Ocean"}),
+    (-120, {"locality": "Fort St. John", "region": "British Columbia", "country": "Canada"}),
+    (-100, {"locality": "Oklahoma City", "region": "Oklahoma", "country": "United States"}),
+    (-80, {"ocean": "North Atlantic Ocean"}),
+    (-10, {"locality": "Nottingham", "region": "England", "country": "United Kingdom"}),
+    (0, {"locality": "Zaporizhzhia", "region": "Zaporizhzhia Oblast", "country": "Ukraine"}),
+    (40, {"region": "Xinjiang Uyghur Autonomous Region", "country": "China"}),
+    (90, {"ocean": "Indian Ocean"}),
+    (110, {"locality": "Alice Springs", "region": "Northern Territory", "country": "Australia"}),
+    (150, {"ocean": "Coral Sea"}),
+)
+LATITUDE = 52.953384
+LONGITUDE = -1.1505282
+
+
+# The ISS TLE with its epoch moved to the start of today (UTC).
+def recent_tle():
+    t = time.gmtime()
+    day_of_year = t.tm_yday
+    epoch = f"{t.tm_year % 100:02}{day_of_year:03}.00000000"
+    return ISS_TLE[0][:18] + epoch + ISS_TLE[0][32:], ISS_TLE[1]
+
+
+# As the backend formats it, e.g. "Mon 02 Jan 3:04pm UTC".
+def updated_at(seconds):
+    t = time.gmtime(seconds + orbit.EPOCH_2000)
+    return f"{time.strftime('%a %d %b', t)} {t.tm_hour % 12 or 12}:{t.tm_min:02}{'am' if t.tm_hour < 12 else 'pm'} UTC"
+
+
+def place(lon):
+    names = PLACES[0][1]
+    for start, band in PLACES:
+        if lon >= start:
+            names = band
+    return names
+
+
+# What the backend would send about the ISS at a time in seconds since
+# 2000, for a device at lat, lng.
+def iss_response(satellite, seconds, lat, lng):
+    iss_lat, iss_lon = satellite.subpoint(seconds)
+    response = {
+        "lat": iss_lat,
+        "lon": iss_lon,
+        "dist": round(orbit.distance(lat, lng, iss_lat, iss_lon)),
+        "timestamp": (seconds + orbit.EPOCH_2000) * 1000
+    }
+    response.update(place(iss_lon))
+    return response
+
+
+# Where the ISS will be every step seconds for minutes from a time in
+# seconds since 2000, as getTrack() in the cloud function.
+def iss_track(satellite, seconds, lat, lng, minutes, step=60):
+    points = []
+    for n in range(minutes * 60 // step + 1):
+        iss_lat, iss_lon = satellite.subpoint(seconds + n * step)
+        iss_lat = round(iss_lat, 2)
+        iss_lon = round(iss_lon, 2)
+        points.append([iss_lat, iss_lon, round(orbit.distance(lat, lng, iss_lat, iss_lon))])
+    return {"start": (seconds + orbit.EPOCH_2000) * 1000, "step": step, "points": points}
+
+
+# The compact binary format, as encodeBinary() in the cloud function.
+def encode_binary(response):
+    field_mask = 0
+    fields = b""
+    for bit, field in enumerate(issclient.BINARY_FIELDS):
+        if response.get(field):
+            value = response[field].encode()[:255]
+            field_mask |= 1 << bit
+            fields += bytes([len(value)]) + value
+    seconds = response["timestamp"] // 1000 - orbit.EPOCH_2000
+    track = b""
+    if "track" in response:
+        field_mask |= issclient.BINARY_TRACK_FLAG
+        points = response["track"]["points"]
+        track = struct.pack(groundtrack.HEADER, response["track"]["start"] // 1000 - orbit.EPOCH_2000, response["track"]["step"], len(points))
+        for lat, lon, dist in points:
+            track += struct.pack(groundtrack.POINT, round(lat * 100), round(lon * 100), min(dist, 0xFFFF))
+    header = struct.pack(issclient.BINARY_HEADER, issclient.BINARY_VERSION, field_mask, response["lat"], response["lon"], min(response["dist"], 0xFFFF), seconds)
+    return header + fields + track
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        backend = self.server.backend
+        url = urlparse(self.path)
+        time.sleep(backend.delay)
+
+        if url.path == "/tle":
+            backend.requests["tle"] += 1
+            self.send_body(200, "text/plain", "\n".join(("ISS (ZARYA)",) + backend.tle).encode())
+        elif url.path == "/isslocator":
+            backend.requests["isslocator"] += 1
+            query = parse_qs(url.query)
+            seconds = orbit.now()
+            lat = float(query["lat"][0])
+            lng = float(query["lng"][0])
+            response = iss_response(backend.satellite, seconds, lat, lng)
+            if "track" in query:
+                response["track"] = iss_track(backend.satellite, seconds, lat, lng, int(query["track"][0]))
+            if issclient.BINARY_CONTENT_TYPE in self.headers.get("Accept", ""):
+                self.send_body(200, issclient.BINARY_CONTENT_TYPE, encode_binary(response))
+            else:
+                response["updatedAt"] = updated_at(response.pop("timestamp") // 1000 - orbit.EPOCH_2000)
+                self.send_body(200, "application/json", json.dumps(response).encode())
+        else:
+            self.send_body(404, "text/plain", b"Not found")
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Serves canned iss-locator responses and the TLE on a local port, after
+# waiting delay seconds like a real server over the internet would.
+class StubBackend:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.tle = recent_tle()
+        self.satellite = orbit.Satellite(*self.tle)
+        self.requests = {"isslocator": 0, "tle": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.backend = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# A TCP port that nothing is listening on.
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Point config at the stub backend, serving metrics on a free port, with
+# any other settings overridden.
+def configure(backend, **settings):
+    config.ISS_SERVICE_URL = f"{backend.url}/isslocator"
+    config.ISS_SERVICE_PASSPHRASE = "harness"
+    config.DEVICE_ID = "harness"
+    config.TLE_URL = f"{backend.url}/tle"
+    config.METRICS_PORT = free_port()
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+
+# Change to a new empty directory standing in for the device's flash, with
+# wifi.json saved as if set up already (unless wifi is False), and the
+# templates main.py uses in setup mode.  Returns its path.
+def flash_dir(wifi=True, lat=LATITUDE, lng=LONGITUDE):
+    path = tempfile.mkdtemp(prefix="badger-")
+    os.symlink(os.path.join(shims.BADGER_DIR, "templates"), os.path.join(path, "templates"))
+    if wifi:
+        with open(os.path.join(path, "wifi.json"), "w") as f:
+            json.dump({"ssid": "ISS Home", "password": "password", "lat": str(lat), "lng": str(lng)}, f)
+    os.chdir(path)
+    return path
+
+
+# Import main.py without starting it, silencing its print()s if quiet.
+def import_main(quiet=False):
+    import main
+    if quiet:
+        main.print = lambda *args, **kwargs: None
+    return main
+
+
+# Data for update_iss_position() for count positions of the ISS interval
+# seconds apart, starting now.
+def positions(count, interval, lat=LATITUDE, lng=LONGITUDE):
+    satellite = orbit.Satellite(*recent_tle())
+    start = orbit.now()
+    for n in range(count):
+        seconds = start + n * interval
+        iss_data = iss_response(satellite, seconds, lat, lng)
+        del iss_data["timestamp"]
+        iss_data["updatedAt"] = updated_at(seconds)
+        yield iss_data
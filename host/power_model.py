@@ -0,0 +1,77 @@
+# Estimates how long the Badger 2040w runs on batteries when it's left
+# on between updates, compared with switching off between updates in low
+# power mode (config.LOW_POWER), for a range of update intervals.
+#
+# The currents and durations below are typical figures for a Pico W and
+# the Badger's e-ink display.  Measure your own with a USB power meter and
+# change them here (or the battery capacity on the command line) for better
+# estimates.  Battery self discharge isn't included, so very long estimates
+# are optimistic.
+#
+# Usage: python host/power_model.py [battery mAh]
+import sys
+
+# Two AAA alkaline batteries.
+BATTERY_MAH = 1000
+
+# Currents in mA.
+AWAKE_IDLE_MA = 35        # running with WiFi connected, waiting
+AWAKE_BUSY_MA = 60        # booting, connecting to WiFi, fetching
+REFRESH_EXTRA_MA = 10     # on top of the above while the display refreshes
+SWITCHED_OFF_MA = 0.01    # only the real time clock running
+
+# Durations in seconds.
+BOOT_S = 1.5              # power on to running main.py
+WIFI_CONNECT_S = 3.0      # after being switched off
+FETCH_S = 1.5             # request to the backend, including TLS
+FULL_REFRESH_S = 1.0      # UPDATE_NORMAL
+PARTIAL_REFRESH_S = 0.3   # UPDATE_FAST
+
+FULL_REFRESH_EVERY = 10
+POSITION_INTERVAL = 30
+INTERVALS = (60, 300, 900, 1800, 3600, 10800)
+
+
+# Average seconds of display refresh per update.
+def refresh_seconds():
+    return (FULL_REFRESH_S + (FULL_REFRESH_EVERY - 1) * PARTIAL_REFRESH_S) / FULL_REFRESH_EVERY
+
+
+# Average current staying on: idle with WiFi up, fetching every interval
+# and moving the ISS along its orbit every POSITION_INTERVAL.
+def always_on_ma(interval):
+    updates = interval / POSITION_INTERVAL
+    busy = FETCH_S
+    refreshing = updates * refresh_seconds()
+    idle = max(interval - busy - refreshing, 0)
+    charge = busy * AWAKE_BUSY_MA + refreshing * (AWAKE_IDLE_MA + REFRESH_EXTRA_MA) + idle * AWAKE_IDLE_MA
+    return charge / interval
+
+
+# Average current switching off between updates: boot, reconnect, fetch,
+# one refresh, then off until the real time clock wakes it.
+def low_power_ma(interval):
+    awake = BOOT_S + WIFI_CONNECT_S + FETCH_S + refresh_seconds()
+    charge = (awake * AWAKE_BUSY_MA + refresh_seconds() * REFRESH_EXTRA_MA +
+              max(interval - awake, 0) * SWITCHED_OFF_MA)
+    return charge / interval, awake
+
+
+def describe(hours):
+    if hours < 48:
+        return f"{hours:7.1f} hours"
+    return f"{hours / 24:7.1f} days "
+
+
+def main():
+    battery = float(sys.argv[1]) if len(sys.argv) > 1 else BATTERY_MAH
+    print(f"Battery: {battery:.0f}mAh\n")
+    print(f"{'interval':>10}  {'always on':>22}  {'low power':>22}  {'awake per update':>16}")
+    for interval in INTERVALS:
+        on = always_on_ma(interval)
+        off, awake = low_power_ma(interval)
+        print(f"{interval // 60:>7}min  {on:6.2f}mA {describe(battery / on)}  {off:6.2f}mA {describe(battery / off)}  {awake:15.1f}s")
+
+
+if __name__ == "__main__":
+    main()
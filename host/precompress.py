@@ -0,0 +1,60 @@
+# Build step: writes a gzipped copy (name.gz) next to each static asset so
+# that phew's serve_file can send it to clients that accept gzip, cutting
+# the bytes sent over the access point.  Template files containing {{ }}
+# tags are rendered per request so are skipped, as are files that gzip
+# doesn't make meaningfully smaller (the jpgs, usually).
+#
+# Usage: python host/precompress.py [file or folder ...]
+# (defaults to the templates folder, which is what the setup portal serves)
+import gzip
+import os
+import sys
+
+import shims
+
+EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".jpg", ".jpeg", ".png", ".csv")
+DEFAULT_PATHS = ("templates",)
+# Only keep the .gz if it saves at least this fraction of the file.
+MIN_SAVING = 0.1
+
+
+def candidates(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                yield from candidates([os.path.join(path, name)])
+        elif path.lower().endswith(EXTENSIONS):
+            yield path
+
+
+def precompress(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    gzip_path = path + ".gz"
+    if b"{{" in data:
+        return "template, skipped"
+
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) > len(data) * (1 - MIN_SAVING):
+        if os.path.exists(gzip_path):
+            os.remove(gzip_path)
+        return f"{len(data)} -> {len(compressed)} bytes, not worth it, skipped"
+
+    with open(gzip_path, "wb") as f:
+        f.write(compressed)
+    return f"{len(data)} -> {len(compressed)} bytes"
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        os.chdir(shims.BADGER_DIR)
+        paths = DEFAULT_PATHS
+
+    for path in candidates(paths):
+        print(f"{path}: {precompress(path)}")
+
+
+if __name__ == "__main__":
+    main()
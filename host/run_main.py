@@ -0,0 +1,90 @@
+# Runs main.py headless against the stub backend, from boot through
+# connecting to wifi to the first few screen refreshes, and prints when
+# each screen update happened and which part of the screen it covered,
+# and how long it took to show the first useful screen and the first new
+# data, from what the device serves at /metrics.  With more than one boot,
+# each starts with the flash as the one before left it, like switching the
+# device off and on again.  -f turns on config.FAST_BOOT, to see how much
+# quicker the boots after the first are.
+#
+# Screen updates and WiFi take about as long as they do on the device
+# (see shims.py), so the times are realistic apart from the drawing.
+#
+# Usage: python host/run_main.py [-v] [-f] [refreshes] [boots] [dots|track]
+# where -v shows what main.py prints and all of /metrics.
+import os
+import subprocess
+import sys
+import time
+
+import harness
+import shims
+
+# Screen update times at each update speed.
+UPDATE_SECONDS = (1.5, 1.0, 0.5, 0.25)
+BOOT_STAGES = ("boot_to_screen", "boot_to_data")
+
+
+def boot(refreshes, style, verbose, fast_boot):
+    shims.update_seconds = UPDATE_SECONDS
+    backend = harness.StubBackend(delay=0.1)
+    harness.configure(backend, REFRESH_INTERVAL=3, POSITION_INTERVAL=1, HISTORY_STYLE=style, FAST_BOOT=fast_boot)
+    start = time.perf_counter()
+    device = harness.import_main(quiet=not verbose)
+    screen = device.display.display
+    from phew import server
+
+    # Stop once the screen has been refreshed with the ISS position
+    # refreshes times, including with new data.
+    update_iss_position = device.update_iss_position
+    refreshed = []
+
+    def counted_update_iss_position(*args, **kwargs):
+        update_iss_position(*args, **kwargs)
+        refreshed.append(time.perf_counter())
+
+    device.update_iss_position = counted_update_iss_position
+
+    async def stop_after_refreshes():
+        while len(refreshed) < refreshes or device.refresh_metrics.count("boot_to_data") == 0:
+            await device.uasyncio.sleep(0.05)
+        metrics_url = f"http://127.0.0.1:{device.config.METRICS_PORT}/metrics"
+        if verbose:
+            print((await device.issclient.fetch(f"{metrics_url}?format=prometheus")).decode())
+        stages = (await device.issclient.fetch_json(metrics_url))["stages"]
+        print("  " + ", ".join(f"{stage} {stages[stage]['time_us']['avg'] / 1000000:.3f}s" for stage in BOOT_STAGES))
+        server.loop.stop()
+
+    server.loop.create_task(stop_after_refreshes())
+    device.main()
+    elapsed = time.perf_counter() - start
+
+    for at, kind, region, speed in screen.updates:
+        print(f"  {at - start:7.3f}s {kind:15} {region} speed {speed}")
+    print(f"  {len(refreshed)} refreshes in {elapsed:.3f}s, backend requests {backend.requests}, wifi connects {shims.wlan_connects}")
+    print(f"  draw calls {screen.calls}")
+    backend.stop()
+
+
+def main():
+    verbose = "-v" in sys.argv
+    fast_boot = "-f" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg not in ("-v", "-f")]
+    refreshes = int(args[0]) if len(args) > 0 else 3
+    boots = int(args[1]) if len(args) > 1 else 2
+    style = args[2] if len(args) > 2 else "dots"
+
+    # Each boot runs in a new Python process, so main.py starts afresh.
+    if "RUN_MAIN_FLASH" in os.environ:
+        os.chdir(os.environ["RUN_MAIN_FLASH"])
+        boot(refreshes, style, verbose, fast_boot)
+        return
+
+    path = harness.flash_dir()
+    for n in range(boots):
+        print(f"boot {n + 1}, flash has {', '.join(sorted(os.listdir(path)))}", flush=True)
+        subprocess.run([sys.executable, os.path.abspath(__file__)] + sys.argv[1:], env=dict(os.environ, RUN_MAIN_FLASH=path), check=True)
+
+
+if __name__ == "__main__":
+    main()
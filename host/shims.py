@@ -0,0 +1,426 @@
+# Stand-ins for the MicroPython modules that phew and main.py import, so
+# that the host-side benchmarks in this folder can run under CPython.
+# Call install() before importing anything from badger2040w, and
+# install_device() as well for main.py and the Badger's own modules
+# (badger2040, jpegdec, network, ntptime and machine.Pin).
+import asyncio
+import gc
+import os
+import socket
+import sys
+import time
+import tracemalloc
+import types
+
+BADGER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "badger2040w")
+
+
+def _install_time():
+    start = time.perf_counter_ns()
+    time.ticks_ms = lambda: (time.perf_counter_ns() - start) // 1000000
+    time.ticks_us = lambda: (time.perf_counter_ns() - start) // 1000
+    time.ticks_diff = lambda new, old: new - old
+    time.ticks_add = lambda ticks, delta: ticks + delta
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+
+def _install_gc():
+    gc.threshold = lambda *args: None
+    gc.mem_free = lambda: 100 * 1024
+    # What tracemalloc has seen allocated, if it's running.
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 64 * 1024
+
+
+def _install_machine():
+    machine = types.ModuleType("machine")
+
+    class RTC:
+        def datetime(self):
+            t = time.localtime()
+            return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+
+    def reset():
+        raise SystemExit("machine.reset()")
+
+    machine.RTC = RTC
+    machine.reset = reset
+    sys.modules["machine"] = machine
+
+
+# uasyncio extras that CPython's asyncio doesn't have.
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+def _install_asyncio():
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+    asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+
+
+def install():
+    if "machine" in sys.modules:
+        return
+
+    _install_time()
+    _install_gc()
+    _install_machine()
+    _install_asyncio()
+    sys.modules["uasyncio"] = asyncio
+    sys.modules["usocket"] = socket
+
+    if BADGER_DIR not in sys.path:
+        sys.path.insert(0, BADGER_DIR)
+
+
+# Device stand-ins, state that tests and benchmarks can look at or change
+# is kept at module level here.
+WIDTH = 296
+HEIGHT = 128
+
+# Buttons currently held down, by pin number, see press().
+buttons_down = set()
+_pin_handlers = {}
+
+# How long the parts of network.WLAN.connect() take: scanning for the
+# network (skipped if given the access point's bssid and channel),
+# associating with it, and getting an address by DHCP (skipped with a
+# static address from ifconfig()).  scan() takes as long as scanning.
+wlan_scan_seconds = 1.5
+wlan_associate_seconds = 0.5
+wlan_dhcp_seconds = 1.0
+# The networks scan() finds, as (ssid, rssi).
+wlan_networks = [("ISS Home", -45), ("Neighbour", -70), ("ISS Home", -60), ("Cafe", -82)]
+wlan_connects = 0
+
+# How long a screen update takes at each update speed (UPDATE_NORMAL to
+# UPDATE_TURBO), none by default.  Roughly (1.5, 1.0, 0.5, 0.25) on the
+# device, which is blocked while it updates.
+update_seconds = (0, 0, 0, 0)
+
+# Calls to badger2040.sleep_for(), in minutes.
+sleeps = []
+
+
+# 1-bit framebuffer laid out like the Badger's: a column of 8 pixels per
+# byte, top to bottom, columns left to right.  Being a bytearray,
+# memoryview() works on it as it does on the device's PicoGraphics.  Draw
+# calls are counted and timed (they're in C on the device, so their time
+# here says little about it) and screen updates recorded.
+def _draw_call(method):
+    name = method.__name__
+
+    def call(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.draw_seconds += time.perf_counter() - start
+
+    return call
+
+
+_BLACK = b"\xff" * (WIDTH * HEIGHT // 8)
+_WHITE = bytes(WIDTH * HEIGHT // 8)
+
+
+class PicoGraphics(bytearray):
+    def __init__(self):
+        super().__init__(WIDTH * HEIGHT // 8)
+        self.pen = 0
+        self.clip = (0, 0, WIDTH, HEIGHT)
+        self.calls = {}
+        self.draw_seconds = 0.0
+        # (time, "update" or "partial_update", (x, y, w, h), update speed),
+        # if recording.
+        self.updates = []
+        self.recording = True
+        self.update_speed = 0
+
+    def _pixel(self, x, y):
+        left, top, width, height = self.clip
+        if left <= x < left + width and top <= y < top + height:
+            index = x * (HEIGHT // 8) + (y >> 3)
+            bit = 0x80 >> (y & 7)
+            if self.pen < 8:
+                self[index] |= bit
+            else:
+                self[index] &= ~bit
+
+    def _span(self, x1, x2, y):
+        for x in range(x1, x2):
+            self._pixel(x, y)
+
+    @_draw_call
+    def set_pen(self, pen):
+        self.pen = pen
+
+    @_draw_call
+    def set_font(self, font):
+        pass
+
+    @_draw_call
+    def set_thickness(self, thickness):
+        pass
+
+    @_draw_call
+    def set_clip(self, x, y, w, h):
+        self.clip = (x, y, w, h)
+
+    @_draw_call
+    def remove_clip(self):
+        self.clip = (0, 0, WIDTH, HEIGHT)
+
+    @_draw_call
+    def clear(self):
+        self[:] = _BLACK if self.pen < 8 else _WHITE
+
+    @_draw_call
+    def pixel(self, x, y):
+        self._pixel(x, y)
+
+    @_draw_call
+    def rectangle(self, x, y, w, h):
+        for row in range(max(y, 0), min(y + h, HEIGHT)):
+            self._span(max(x, 0), min(x + w, WIDTH), row)
+
+    @_draw_call
+    def circle(self, x, y, r):
+        for dy in range(-r, r + 1):
+            dx = int((r * r - dy * dy) ** 0.5)
+            self._span(x - dx, x + dx + 1, y + dy)
+
+    @_draw_call
+    def line(self, x1, y1, x2, y2, thickness=1):
+        steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+        for step in range(steps + 1):
+            self._pixel(x1 + (x2 - x1) * step // steps, y1 + (y2 - y1) * step // steps)
+
+    # The bitmap8 font is about 6 pixels a character at scale 1.
+    @_draw_call
+    def measure_text(self, text, scale=2, spacing=1):
+        return len(text) * 6 * scale
+
+    # Text is drawn as a dotted box the size it would be, wrapping words
+    # at wordwrap pixels like the device does.
+    @_draw_call
+    def text(self, text, x, y, wordwrap=WIDTH, scale=2, angle=0, spacing=1):
+        line_x = x
+        for word in text.split(" "):
+            width = len(word) * 6 * scale
+            if line_x > x and line_x + width > x + wordwrap:
+                line_x = x
+                y += 8 * scale
+            for row in range(y, min(y + 7 * scale, HEIGHT), 2):
+                for column in range(line_x, min(line_x + width, WIDTH), 2):
+                    self._pixel(column, row)
+            line_x += width + 6 * scale
+
+    # For jpegdec, a fixed pattern rather than the image.
+    @_draw_call
+    def decode_jpeg(self, x, y, width, height):
+        pen = self.pen
+        for column in range(x, min(x + width, WIDTH)):
+            for row in range(y, min(y + height, HEIGHT)):
+                self.pen = 0 if (column * 7 + row * 3) % 5 == 0 else 15
+                self._pixel(column, row)
+        self.pen = pen
+
+    @_draw_call
+    def set_update_speed(self, speed):
+        self.update_speed = speed
+
+    @_draw_call
+    def update(self):
+        time.sleep(update_seconds[self.update_speed])
+        if self.recording:
+            self.updates.append((time.perf_counter(), "update", (0, 0, WIDTH, HEIGHT), self.update_speed))
+
+    @_draw_call
+    def partial_update(self, x, y, w, h):
+        if y % 8 or h % 8:
+            raise ValueError("partial update y and h must be multiples of 8")
+        time.sleep(update_seconds[self.update_speed])
+        if self.recording:
+            self.updates.append((time.perf_counter(), "partial_update", (x, y, w, h), self.update_speed))
+
+
+def _install_badger2040():
+    badger2040 = types.ModuleType("badger2040")
+    badger2040.WIDTH = WIDTH
+    badger2040.HEIGHT = HEIGHT
+    badger2040.UPDATE_NORMAL = 0
+    badger2040.UPDATE_MEDIUM = 1
+    badger2040.UPDATE_FAST = 2
+    badger2040.UPDATE_TURBO = 3
+    badger2040.BUTTON_DOWN = 11
+    badger2040.BUTTON_A = 12
+    badger2040.BUTTON_B = 13
+    badger2040.BUTTON_C = 14
+    badger2040.BUTTON_UP = 15
+
+    class Badger2040:
+        def __init__(self):
+            self.display = PicoGraphics()
+            self.led_brightness = 0
+
+        def __getattr__(self, item):
+            return getattr(self.display, item)
+
+        def led(self, brightness):
+            self.led_brightness = brightness
+
+        def pressed(self, button):
+            return button in buttons_down
+
+    badger2040.Badger2040 = Badger2040
+    badger2040.sleep_for = lambda minutes: sleeps.append(minutes)
+    badger2040.woken_by_rtc = lambda: False
+    badger2040.pcf_to_pico_rtc = lambda: None
+    badger2040.pico_rtc_to_pcf = lambda: None
+    sys.modules["badger2040"] = badger2040
+
+
+def _install_jpegdec():
+    jpegdec = types.ModuleType("jpegdec")
+    jpegdec.JPEG_SCALE_FULL = 1
+
+    # Decodes to a fixed pattern the size of the images in badger2040w.
+    class JPEG:
+        SIZES = {"worldmap.jpg": (192, 128), "iss.jpg": (203, 128)}
+
+        def __init__(self, graphics):
+            self.graphics = graphics
+            self.size = (0, 0)
+
+        def open_file(self, file):
+            self.size = self.SIZES.get(os.path.basename(file), (64, 64))
+
+        def decode(self, x, y, scale=1, dither=True):
+            self.graphics.decode_jpeg(x, y, *self.size)
+
+    jpegdec.JPEG = JPEG
+    sys.modules["jpegdec"] = jpegdec
+
+
+def _install_network():
+    network = types.ModuleType("network")
+    network.STA_IF = 0
+    network.AP_IF = 1
+    network.STAT_IDLE = 0
+    network.STAT_CONNECTING = 1
+    network.STAT_GOT_IP = 3
+    network.STAT_CONNECT_FAIL = -1
+    network.STAT_NO_AP_FOUND = -2
+    network.STAT_WRONG_PASSWORD = -3
+
+    class WLAN:
+        def __init__(self, interface=0):
+            self.interface = interface
+            self.connected_at = None
+            self.settings = {}
+            # A static address set with ifconfig(), or None to use DHCP.
+            self.static = None
+
+        def active(self, active=None):
+            return True
+
+        def config(self, *args, **kwargs):
+            self.settings.update(kwargs)
+            if args:
+                return self.settings.get(args[0])
+
+        def connect(self, ssid=None, password=None, bssid=None, channel=None):
+            global wlan_connects
+            wlan_connects += 1
+            seconds = wlan_associate_seconds
+            if bssid is None or channel is None:
+                seconds += wlan_scan_seconds
+            if self.static is None:
+                seconds += wlan_dhcp_seconds
+            self.connected_at = time.perf_counter() + seconds
+
+        def disconnect(self):
+            self.connected_at = None
+
+        def isconnected(self):
+            return self.connected_at is not None and time.perf_counter() >= self.connected_at
+
+        def status(self, *args):
+            if self.connected_at is None:
+                return network.STAT_IDLE
+            return network.STAT_GOT_IP if self.isconnected() else network.STAT_CONNECTING
+
+        def ifconfig(self, *args):
+            if args:
+                self.static = None if args[0] == "dhcp" else tuple(args[0])
+                return
+            if self.interface:
+                return ("192.168.4.1", "255.255.255.0", "192.168.4.1", "8.8.8.8")
+            return self.static or ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+        def scan(self):
+            time.sleep(wlan_scan_seconds)
+            return [(ssid.encode(), bytes([n, 0x1A, 0x2B, 0x3C, 0x4D, 0x5E]), 1 + n % 11, rssi, 3, False) for n, (ssid, rssi) in enumerate(wlan_networks)]
+
+    network.WLAN = WLAN
+    sys.modules["network"] = network
+
+
+def _install_pin():
+    machine = sys.modules["machine"]
+
+    class Pin:
+        IN = 0
+        OUT = 1
+        PULL_UP = 1
+        PULL_DOWN = 2
+        IRQ_FALLING = 4
+        IRQ_RISING = 8
+
+        def __init__(self, id, mode=IN, pull=None):
+            self.id = id
+
+        def value(self):
+            return int(self.id in buttons_down)
+
+        def irq(self, handler=None, trigger=IRQ_RISING):
+            _pin_handlers[self.id] = (self, handler)
+
+    machine.Pin = Pin
+
+
+# Holds buttons down (as badger2040.BUTTON_* pin numbers), calling any
+# interrupt handlers for them like the device would.
+def press(*buttons):
+    buttons_down.update(buttons)
+    for button in buttons:
+        if button in _pin_handlers:
+            pin, handler = _pin_handlers[button]
+            handler(pin)
+
+
+def release(*buttons):
+    buttons_down.difference_update(buttons)
+
+
+def install_device():
+    install()
+    if "badger2040" in sys.modules:
+        return
+
+    _install_badger2040()
+    _install_jpegdec()
+    _install_network()
+    _install_pin()
+    ntptime = types.ModuleType("ntptime")
+    ntptime.settime = lambda: None
+    sys.modules["ntptime"] = ntptime